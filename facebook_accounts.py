@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+from datetime import datetime
+from facebook_config import ACCOUNTS_DIR, ACCOUNTS_REGISTRY_FILE, LEGACY_ACCOUNT_ID
+from facebook_state import locked_file
+
+def account_dir(account_id):
+    """Directory holding one account's JSON files"""
+    return os.path.join(ACCOUNTS_DIR, str(account_id))
+
+def account_file(account_id, filename):
+    """Path of one of an account's JSON files"""
+    return os.path.join(account_dir(account_id), filename)
+
+def account_id_for(data):
+    """Account id of a user data dict, from its /me profile"""
+    return (data.get('profile') or {}).get('id') or LEGACY_ACCOUNT_ID
+
+class AccountRegistry:
+    """Known accounts with the pages they own, persisted in the accounts directory"""
+
+    def __init__(self, path=None):
+        path = path or os.path.join(ACCOUNTS_DIR, ACCOUNTS_REGISTRY_FILE)
+        self.path = path
+        self._accounts = {}
+        self._page_index = {}
+        self.default_account_id = None
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._stamp = None  # (inode, mtime, size) of the file as last read or written
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _ensure_loaded(self):
+        # Other workers rewrite the file when they handle a login, so reload whenever it changed
+        if not self._loaded or self._file_stamp() != self._stamp:
+            self.load()
+
+    def load(self):
+        """Load the registry from its JSON file"""
+        with self._lock:
+            self._loaded = True
+            self._stamp = self._file_stamp()
+            try:
+                if os.path.exists(self.path):
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    self._accounts = data.get('accounts', {})
+                    self.default_account_id = data.get('default_account_id')
+                    self._page_index = {
+                        page_id: account_id
+                        for account_id, info in self._accounts.items()
+                        for page_id in info.get('page_ids', [])
+                    }
+                return True
+            except Exception as e:
+                print(f"❌ Failed to load account registry: {e}")
+                return False
+
+    def save(self):
+        """Save the registry to its JSON file"""
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with locked_file(self.path):
+                    self._write()
+                return True
+            except Exception as e:
+                print(f"❌ Failed to save account registry: {e}")
+                return False
+
+    def _write(self):
+        data = {
+            "last_updated": datetime.now().isoformat(),
+            "default_account_id": self.default_account_id,
+            "accounts": self._accounts
+        }
+        # Replaced in one step, so other workers never read a half-written file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._stamp = self._file_stamp()
+
+    def _update(self, change):
+        """Apply change to the registry as it is on disk and save it, keeping other workers' updates
+
+        change returns False when it left the registry as it was, which skips the write.
+        """
+        with self._lock:
+            try:
+                # The lock file lives next to the registry, so a first login creates the directory first
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with locked_file(self.path):
+                    self.load()
+                    if change() is not False:
+                        self._write()
+                return True
+            except Exception as e:
+                print(f"❌ Failed to save account registry: {e}")
+                return False
+
+    def register(self, account_id, profile, page_ids, make_default=True):
+        """Add or refresh an account and the pages it owns"""
+        def change():
+            info = self._accounts.setdefault(account_id, {})
+            for page_id in info.get('page_ids', []):
+                self._page_index.pop(page_id, None)
+            info.update({
+                'name': (profile or {}).get('name', 'Unknown'),
+                'page_ids': list(page_ids),
+                'last_login': datetime.now().isoformat()
+            })
+            for page_id in page_ids:
+                self._page_index[page_id] = account_id
+            if make_default or not self.default_account_id:
+                self.default_account_id = account_id
+
+        self._update(change)
+
+    def record_usage(self, account_id, statistics, stored_bytes):
+        """Record an account's data size, used for per-account memory accounting"""
+        usage = {
+            'conversations': statistics.get('total_conversations', 0),
+            'messages': statistics.get('total_messages', 0),
+            'participants': statistics.get('total_participants', 0),
+            'approx_bytes': stored_bytes
+        }
+
+        def change():
+            info = self._accounts.setdefault(account_id, {})
+            if info.get('usage') == usage:
+                return False
+            info['usage'] = usage
+
+        with self._lock:
+            self._ensure_loaded()
+            if self._accounts.get(account_id, {}).get('usage') == usage:
+                return
+        self._update(change)
+
+    def account_ids(self):
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._accounts.keys())
+
+    def info(self, account_id):
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._accounts.get(account_id, {}))
+
+    def resolve(self, account_id=None):
+        """Return the requested account id if known, or the default account when none is given"""
+        with self._lock:
+            self._ensure_loaded()
+            if account_id is None:
+                return self.default_account_id
+            return account_id if account_id in self._accounts else None
+
+    def account_for_page(self, page_id):
+        """Return the account that owns a page"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._page_index.get(page_id)
+
+account_registry = AccountRegistry()
+
+_sync_locks = {}
+_sync_locks_guard = threading.Lock()
+
+def account_sync_lock(account_id):
+    """Lock that keeps two syncs of the same account from running at once"""
+    with _sync_locks_guard:
+        return _sync_locks.setdefault(account_id, threading.Lock())
@@ -0,0 +1,377 @@
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from facebook_window_cache import parse_graph_time
+from facebook_data_handlers import conversation_title
+from facebook_logging import get_logger
+
+try:
+    import numpy
+except ImportError:  # analytics fall back to plain Python loops
+    numpy = None
+
+log = get_logger("analytics")
+
+# Histogram intervals: (seconds, offset) so weeks start on Monday rather than on the epoch's Thursday
+ANALYTICS_INTERVALS = {'hour': (3600, 0), 'day': (86400, 0), 'week': (604800, 259200)}
+ANALYTICS_MAX_BUCKETS = 5000
+RESPONSE_TIME_PERCENTILES = (50, 90, 95, 99)
+# Lower bounds of the messages-per-conversation histogram
+CONVERSATION_VOLUME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+class _Column:
+    """An append-only column: a numpy array grown by doubling, or a list without numpy
+
+    Growing replaces the array and appending only writes past the current size, so a view of the
+    first n values taken under the owner's lock stays valid while later messages are appended.
+    """
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.size = 0
+        self.data = numpy.zeros(1024, dtype=dtype) if numpy is not None else []
+
+    def extend(self, values):
+        if numpy is None:
+            self.data.extend(values)
+            self.size = len(self.data)
+            return
+        values = numpy.asarray(values, dtype=self.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = numpy.zeros(max(needed, 2 * len(self.data)), dtype=self.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def view(self, n):
+        return self.data[:n]
+
+class MessageColumns:
+    """One account's messages as parallel columns for vectorized analytics
+
+    Each message is a row of epoch second, conversation, page and sender (interned to integer indexes),
+    direction, and for an outbound message that answers inbound ones, the seconds since the first
+    unanswered inbound message. Columns are built from the store and then appended to as messages
+    are sent or received, so queries never walk the message dicts. They also count the messages of
+    each conversation, so a store written by another worker is noticed and the columns rebuilt.
+    """
+
+    def __init__(self):
+        self.built = False
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.timestamps = _Column('int64')
+        self.conversations = _Column('int32')
+        self.pages = _Column('int32')
+        self.senders = _Column('int32')
+        self.inbound = _Column('int8')
+        self.response_seconds = _Column('float64')
+        self.conversation_ids = []
+        self.conversation_names = []
+        self.conversation_pages = []
+        self._conversation_index = {}
+        self.page_ids = []
+        self.page_names = []
+        self._page_index = {}
+        self._sender_index = {}
+        # Per conversation: time of the first inbound message not yet answered, or None
+        self._unanswered_since = []
+        self._message_counts = {}  # conversation_id -> stored messages the columns hold
+
+    def __len__(self):
+        return self.timestamps.size
+
+    def _conversation(self, conv):
+        conv_id = conv['conversation_id']
+        index = self._conversation_index.get(conv_id)
+        if index is None:
+            page_id = conv.get('page_id')
+            page = self._page_index.get(page_id)
+            if page is None:
+                page = self._page_index[page_id] = len(self.page_ids)
+                self.page_ids.append(page_id)
+                self.page_names.append(conv.get('page_name'))
+            index = self._conversation_index[conv_id] = len(self.conversation_ids)
+            self.conversation_ids.append(conv_id)
+            self.conversation_names.append(conversation_title(conv))
+            self.conversation_pages.append(page)
+            self._unanswered_since.append(None)
+        return index
+
+    def _add(self, rows, conversation, page_id, message, timestamp=None):
+        """Append one message, oldest first within its conversation, to the row lists"""
+        if timestamp is None:
+            if not message.get('created_time'):
+                return
+            timestamp = parse_graph_time(message['created_time']).timestamp()
+        # Graph times have whole seconds, and integer bucketing is several times faster than float
+        timestamp = int(timestamp)
+        sender_id = (message.get('sender') or {}).get('id')
+        sender = self._sender_index.setdefault(sender_id, len(self._sender_index))
+        inbound = sender_id != page_id
+        response = math.nan
+        if inbound:
+            if self._unanswered_since[conversation] is None:
+                self._unanswered_since[conversation] = timestamp
+        elif self._unanswered_since[conversation] is not None:
+            response = max(0.0, timestamp - self._unanswered_since[conversation])
+            self._unanswered_since[conversation] = None
+        for column, value in zip(rows, (timestamp, conversation, self.conversation_pages[conversation], sender, inbound, response)):
+            column.append(value)
+
+    def _extend(self, rows):
+        for column, values in zip(self._columns(), rows):
+            column.extend(values)
+
+    def _columns(self):
+        return (self.timestamps, self.conversations, self.pages, self.senders, self.inbound, self.response_seconds)
+
+    def build(self, account):
+        """Replace the columns with every message in an account's store"""
+        started = time.perf_counter()
+        with self._lock:
+            self._reset()
+            rows = tuple([] for _ in self._columns())
+            messages = account.get('facebook_messages', {})
+            for conv in account.get('facebook_conversations', []):
+                conversation = self._conversation(conv)
+                conversation_messages = messages.get(conv['conversation_id'], [])
+                self._message_counts[conv['conversation_id']] = len(conversation_messages)
+                # Stored newest first; response times need them in the order they were written
+                for message in reversed(conversation_messages):
+                    self._add(rows, conversation, conv.get('page_id'), message)
+            self._extend(rows)
+            self.built = True
+        log.info("📊 Built analytics columns for %d messages in %.0fms", len(self), (time.perf_counter() - started) * 1000)
+
+    def append(self, conv, message, timestamp=None):
+        """Append a message that just arrived or was sent; ignored until the columns are built"""
+        with self._lock:
+            if not self.built:
+                return
+            rows = tuple([] for _ in self._columns())
+            self._add(rows, self._conversation(conv), conv.get('page_id'), message, timestamp)
+            self._extend(rows)
+            self._message_counts[conv['conversation_id']] = self._message_counts.get(conv['conversation_id'], 0) + 1
+
+    def stale(self, account):
+        """True until the columns are built, and whenever the store holds other messages than they do"""
+        messages = account.get('facebook_messages', {})
+        counts = {conv['conversation_id']: len(messages.get(conv['conversation_id'], [])) for conv in account.get('facebook_conversations', [])}
+        with self._lock:
+            return not self.built or counts != self._message_counts
+
+    def _snapshot(self):
+        with self._lock:
+            n = len(self)
+            # numpy views stay valid as later rows are appended; the list fallback slices a copy
+            columns = [column.view(n) for column in self._columns()]
+            return columns, len(self.conversation_ids), len(self.page_ids), len(self._sender_index)
+
+    def summary(self, interval='day', since=None, until=None, page_id=None, conversation_id=None, top=20):
+        """Volume histograms, reply time percentiles and direction ratios, overall, per page and per conversation
+
+        since and until are epoch seconds. Raises ValueError for an unknown interval or too many buckets.
+        """
+        if interval not in ANALYTICS_INTERVALS:
+            raise ValueError(f"Unknown interval {interval!r}, expected one of {', '.join(ANALYTICS_INTERVALS)}")
+        started = time.perf_counter()
+        columns, n_conversations, n_pages, n_senders = self._snapshot()
+        page = self._page_index.get(page_id, -1) if page_id else None
+        conversation = self._conversation_index.get(conversation_id, -1) if conversation_id else None
+        summarize = _summarize_numpy if numpy is not None else _summarize_python
+        result = summarize(columns, n_conversations, n_pages, n_senders, ANALYTICS_INTERVALS[interval], since, until, page, conversation, top)
+
+        result['interval'] = interval
+        for page_result in result['pages']:
+            index = page_result.pop('index')
+            page_result['page_id'] = self.page_ids[index]
+            page_result['page_name'] = self.page_names[index]
+        for conv_result in result['conversations']['top']:
+            index = conv_result.pop('index')
+            conv_result['conversation_id'] = self.conversation_ids[index]
+            conv_result['participant_name'] = self.conversation_names[index]
+            conv_result['page_id'] = self.page_ids[self.conversation_pages[index]]
+        result['vectorized'] = numpy is not None
+        result['query_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+def _bucket_labels(first, count, interval):
+    seconds, offset = interval
+    return [datetime.fromtimestamp((first + i) * seconds - offset, tz=timezone.utc).isoformat() for i in range(count)]
+
+def _check_buckets(count):
+    if count > ANALYTICS_MAX_BUCKETS:
+        raise ValueError(f"{count} buckets is more than {ANALYTICS_MAX_BUCKETS}; use a longer interval or a narrower since/until")
+
+def _ratios(total, inbound):
+    outbound = total - inbound
+    return {
+        'messages': total,
+        'inbound': inbound,
+        'outbound': outbound,
+        'inbound_ratio': round(inbound / total, 4) if total else None,
+        'outbound_per_inbound': round(outbound / inbound, 4) if inbound else None
+    }
+
+def _volume_labels():
+    edges = CONVERSATION_VOLUME_BUCKETS
+    labels = [str(low) if high - low == 1 else f"{low}-{high - 1}" for low, high in zip(edges, edges[1:])]
+    return labels + [f"{edges[-1]}+"]
+
+def _response_summary(values, percentile):
+    if not len(values):
+        return {'replies': 0}
+    mean = numpy.mean(values) if numpy is not None else sum(values) / len(values)
+    summary = {'replies': len(values), 'mean_seconds': round(float(mean), 3)}
+    for q, value in zip(RESPONSE_TIME_PERCENTILES, percentile(values)):
+        summary[f'p{q}_seconds'] = round(float(value), 3)
+    return summary
+
+def _summarize_numpy(columns, n_conversations, n_pages, n_senders, interval, since, until, page, conversation, top):
+    timestamps, conversations, pages, senders, inbound, response = columns
+    mask = None
+    for condition in (
+        timestamps >= since if since is not None else None,
+        timestamps < until if until is not None else None,
+        pages == page if page is not None else None,
+        conversations == conversation if conversation is not None else None
+    ):
+        if condition is not None:
+            mask = condition if mask is None else mask & condition
+    if mask is not None:
+        timestamps, conversations, pages, senders, inbound, response = (column[mask] for column in columns)
+
+    total = len(timestamps)
+    is_inbound = inbound.astype(bool)
+    result = _ratios(total, int(numpy.count_nonzero(is_inbound)))
+    result['active_participants'] = int(numpy.count_nonzero(numpy.bincount(senders[is_inbound], minlength=n_senders)))
+    answered = ~numpy.isnan(response)
+    replies, reply_pages = response[answered], pages[answered]
+    percentile = lambda values: numpy.percentile(values, RESPONSE_TIME_PERCENTILES)
+    result['response_times'] = _response_summary(replies, percentile)
+
+    # Volume over time, overall and per page, from one bincount over (page, bucket) keys
+    seconds, offset = interval
+    buckets = (timestamps + offset) // seconds
+    first = int(buckets.min()) if total else 0
+    n_buckets = int(buckets.max()) - first + 1 if total else 0
+    _check_buckets(n_buckets)
+    buckets -= first
+    per_page_volume = numpy.bincount(pages.astype(numpy.int64) * n_buckets + buckets, minlength=n_pages * n_buckets).reshape(n_pages, n_buckets)
+    result['buckets'] = _bucket_labels(first, n_buckets, interval)
+    result['volume'] = per_page_volume.sum(axis=0).tolist()
+
+    page_totals = numpy.bincount(pages, minlength=n_pages)
+    page_inbound = numpy.bincount(pages[is_inbound], minlength=n_pages)
+    result['pages'] = []
+    for index in numpy.flatnonzero(page_totals).tolist():
+        page_result = _ratios(int(page_totals[index]), int(page_inbound[index]))
+        page_result['index'] = index
+        page_result['volume'] = per_page_volume[index].tolist()
+        page_result['response_times'] = _response_summary(replies[reply_pages == index], percentile)
+        result['pages'].append(page_result)
+
+    conversation_totals = numpy.bincount(conversations, minlength=n_conversations)
+    conversation_inbound = numpy.bincount(conversations[is_inbound], minlength=n_conversations)
+    active = conversation_totals[conversation_totals > 0]
+    histogram = numpy.bincount(numpy.searchsorted(CONVERSATION_VOLUME_BUCKETS, active, side='right') - 1, minlength=len(CONVERSATION_VOLUME_BUCKETS))
+    top = min(top, len(active))
+    if top:
+        # partition finds the top count without sorting every conversation; ties keep conversation order
+        threshold = numpy.partition(conversation_totals, len(conversation_totals) - top)[len(conversation_totals) - top]
+        busiest = numpy.flatnonzero(conversation_totals >= threshold)
+        busiest = busiest[numpy.argsort(-conversation_totals[busiest], kind='stable')][:top]
+    else:
+        busiest = []
+    result['conversations'] = {
+        'active': len(active),
+        'volume_histogram': [{'messages': label, 'conversations': int(count)} for label, count in zip(_volume_labels(), histogram)],
+        'top': [dict(_ratios(int(conversation_totals[i]), int(conversation_inbound[i])), index=int(i)) for i in busiest]
+    }
+    return result
+
+def _percentiles_python(values):
+    """Linearly interpolated percentiles, as numpy.percentile computes them"""
+    ordered = sorted(values)
+    result = []
+    for q in RESPONSE_TIME_PERCENTILES:
+        k = (len(ordered) - 1) * q / 100
+        low = math.floor(k)
+        high = min(low + 1, len(ordered) - 1)
+        result.append(ordered[low] + (ordered[high] - ordered[low]) * (k - low))
+    return result
+
+def _summarize_python(columns, n_conversations, n_pages, n_senders, interval, since, until, page, conversation, top):
+    seconds, offset = interval
+    rows = [
+        row for row in zip(*columns)
+        if (since is None or row[0] >= since) and (until is None or row[0] < until)
+        and (page is None or row[2] == page) and (conversation is None or row[1] == conversation)
+    ]
+    total = len(rows)
+    result = _ratios(total, sum(row[4] for row in rows))
+    result['active_participants'] = len({row[3] for row in rows if row[4]})
+    responses = [row[5] for row in rows if not math.isnan(row[5])]
+    result['response_times'] = _response_summary(responses, _percentiles_python)
+
+    buckets = [int((row[0] + offset) // seconds) for row in rows]
+    first = min(buckets) if buckets else 0
+    n_buckets = max(buckets) - first + 1 if buckets else 0
+    _check_buckets(n_buckets)
+    volume = [0] * n_buckets
+    page_volume = {}
+    page_totals, page_inbound = Counter(), Counter()
+    page_responses = {}
+    for row, bucket in zip(rows, buckets):
+        volume[bucket - first] += 1
+        page_volume.setdefault(row[2], [0] * n_buckets)[bucket - first] += 1
+        page_totals[row[2]] += 1
+        page_inbound[row[2]] += row[4]
+        if not math.isnan(row[5]):
+            page_responses.setdefault(row[2], []).append(row[5])
+    result['buckets'] = _bucket_labels(first, n_buckets, interval)
+    result['volume'] = volume
+    result['pages'] = []
+    for index in sorted(page_totals):
+        page_result = _ratios(page_totals[index], page_inbound[index])
+        page_result['index'] = index
+        page_result['volume'] = page_volume[index]
+        page_result['response_times'] = _response_summary(page_responses.get(index, []), _percentiles_python)
+        result['pages'].append(page_result)
+
+    conversation_totals, conversation_inbound = Counter(), Counter()
+    for row in rows:
+        conversation_totals[row[1]] += 1
+        conversation_inbound[row[1]] += row[4]
+    histogram = [0] * len(CONVERSATION_VOLUME_BUCKETS)
+    for count in conversation_totals.values():
+        histogram[max(i for i, low in enumerate(CONVERSATION_VOLUME_BUCKETS) if count >= low)] += 1
+    busiest = sorted(conversation_totals, key=lambda i: (-conversation_totals[i], i))[:top]
+    result['conversations'] = {
+        'active': len(conversation_totals),
+        'volume_histogram': [{'messages': label, 'conversations': count} for label, count in zip(_volume_labels(), histogram)],
+        'top': [dict(_ratios(conversation_totals[i], conversation_inbound[i]), index=i) for i in busiest]
+    }
+    return result
+
+_columns = {}
+_columns_lock = threading.Lock()
+
+def get_message_columns(account_id):
+    """Return the analytics columns of an account; they are built on the first query"""
+    with _columns_lock:
+        if account_id not in _columns:
+            _columns[account_id] = MessageColumns()
+        return _columns[account_id]
+
+def drop_message_columns(account_id):
+    """Forget an account's columns after a sync replaced its store, so the next query rebuilds them"""
+    with _columns_lock:
+        _columns.pop(account_id, None)
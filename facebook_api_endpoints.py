@@ -1,198 +1,239 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import RedirectResponse
-from datetime import datetime
-from facebook_config import user_data
-from facebook_data_handlers import load_all_data
-from facebook_messenger import FacebookMessenger
-
-app = FastAPI()
-messenger = FacebookMessenger()
-
-@app.get("/")
-async def root():
-    return {
-        "message": "Enhanced Facebook Messenger with Proper Name Handling - Ready!",
-        "note": "Participant names come from conversation data and are properly stored"
-    }
-
-@app.get("/login")
-async def login():
-    """Facebook login"""
-    url = messenger.generate_login_url()
-    print(f"\n🔗 Login URL: {url}")
-    return RedirectResponse(url=url, status_code=307)
-
-@app.get("/auth/callback")
-async def auth_callback(request: Request):
-    """Handle OAuth callback and setup complete user data with proper names"""
-    code = request.query_params.get("code")
-    error = request.query_params.get("error")
-    
-    if error:
-        return {"error": f"Authorization failed: {error}"}
-    
-    if not code:
-        return {"error": "Missing authorization code"}
-    
-    print("🔄 Exchanging code for token...")
-    token_data = messenger.get_access_token(code)
-    if not token_data:
-        return {"error": "Failed to get access token"}
-    
-    access_token = token_data['access_token']
-    
-    print("🔄 Getting long-lived token...")
-    long_token_data = messenger.get_long_lived_token(access_token)
-    long_lived_token = long_token_data['access_token']
-    
-    print("🔄 Setting up complete user data with proper participant names...")
-    complete_data = messenger.setup_complete_user_data(long_lived_token)
-    user_data['main_user'] = complete_data
-    
-    total_messages = sum(len(msgs) for msgs in complete_data['facebook_messages'].values())
-    total_participants = len(complete_data.get('participant_names', {}))
-    
-    print(f"✅ Setup complete!")
-    return {
-        "message": "🎉 Facebook login successful with proper name handling!",
-        "facebook_conversations": len(complete_data['facebook_conversations']),
-        "total_messages_fetched": total_messages,
-        "participant_names_collected": total_participants,
-        "improvements": [
-            "✅ Participant names from conversation data",
-            "✅ Names properly stored in messages JSON",
-            "✅ Names displayed when sending messages",
-            "✅ Enhanced error handling throughout"
-        ]
-    }
-
-@app.get("/facebook/conversations")
-async def get_facebook_conversations():
-    """Get Facebook conversations with proper participant names"""
-    if 'main_user' not in user_data:
-        if not load_all_data():
-            return {"error": "Please login first"}
-    
-    conversations = user_data['main_user']['facebook_conversations']
-    messages_data = user_data['main_user']['facebook_messages']
-    formatted_conversations = []
-    
-    for i, conv in enumerate(conversations, 1):
-        status = "✅ Can send" if conv.get('can_send_message', False) else f"⏰ Wait {conv.get('hours_since_last_message', 999):.1f}h"
-        conv_messages = messages_data.get(conv['conversation_id'], [])
-        
-        formatted_conversations.append({
-            'number': i,
-            'conversation_id': conv['conversation_id'],
-            'participant_name': conv['participant_name'],
-            'participant_email': conv.get('participant_email', 'Not available'),
-            'participant_id': conv['participant_id'],
-            'page_name': conv['page_name'],
-            'message_count': len(conv_messages),
-            'status': status,
-            'can_send': conv.get('can_send_message', False),
-            'access_token': conv['page_access_token']
-        })
-    
-    return {
-        "platform": "📘 Facebook",
-        "total_conversations": len(formatted_conversations),
-        "note": "Participant names come from conversation data",
-        "conversations": formatted_conversations
-    }
-
-@app.get("/facebook/messages/{conversation_id}")
-async def get_messages_for_conversation(conversation_id: str):
-    """Get all messages for a specific conversation with proper names"""
-    if 'main_user' not in user_data:
-        if not load_all_data():
-            return {"error": "Please login first"}
-    
-    messages = user_data['main_user']['facebook_messages'].get(conversation_id, [])
-    if not messages:
-        return {"error": f"No messages found for conversation {conversation_id}"}
-    
-    # Find conversation name
-    conversations = user_data['main_user']['facebook_conversations']
-    conv_name = "Unknown"
-    for conv in conversations:
-        if conv['conversation_id'] == conversation_id:
-            conv_name = conv['participant_name']
-            break
-    
-    return {
-        "conversation_id": conversation_id,
-        "participant_name": conv_name,
-        "total_messages": len(messages),
-        "note": "Names come from conversation participant data",
-        "messages": messages
-    }
-
-@app.get("/facebook/participants")
-async def get_participant_names():
-    """Get all participant names collected from conversations"""
-    if 'main_user' not in user_data:
-        if not load_all_data():
-            return {"error": "Please login first"}
-    
-    participant_names_data = user_data['main_user'].get('participant_names', {})
-    
-    return {
-        "total_participants": len(participant_names_data),
-        "note": "Names collected from conversation participant data",
-        "participant_names": participant_names_data
-    }
-
-@app.post("/facebook/send")
-async def send_facebook_message(request: Request):
-    """Send Facebook message with proper participant name display"""
-    if 'main_user' not in user_data:
-        if not load_all_data():
-            return {"error": "Please login first"}
-    
-    data = await request.json()
-    conversation_id = data.get('conversation_id')
-    message_text = data.get('message')
-    
-    if not conversation_id or not message_text:
-        return {"error": "conversation_id and message are required"}
-    
-    # Find conversation details
-    conversations = user_data['main_user']['facebook_conversations']
-    target_conv = None
-    for conv in conversations:
-        if conv['conversation_id'] == conversation_id:
-            target_conv = conv
-            break
-    
-    if not target_conv:
-        return {"error": f"Conversation ID {conversation_id} not found"}
-    
-    # Send message with participant name
-    success, result = messenger.send_facebook_message_with_templates(
-        conversation_id,
-        target_conv['participant_id'],
-        message_text,
-        target_conv['page_access_token'],
-        target_conv['participant_name']  # Pass the participant name
-    )
-    
-    if success:
-        return {
-            "success": True,
-            "platform": "📘 Facebook",
-            "message": f"Message sent to {target_conv['participant_name']}",
-            "participant_name": target_conv['participant_name'],
-            "participant_email": target_conv.get('participant_email', 'Not available'),
-            "conversation_id": conversation_id,
-            "message_id": result,
-            "sent_at": datetime.now().isoformat()
-        }
-    else:
-        return {
-            "success": False,
-            "platform": "📘 Facebook",
-            "error": result,
-            "conversation_id": conversation_id,
-            "participant_name": target_conv['participant_name']
-        }
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, PlainTextResponse, FileResponse, Response, StreamingResponse
+from facebook_config import WEBHOOK_VERIFY_TOKEN, ATTACHMENT_ACCEL_REDIRECT_PREFIX, EVENT_STREAM_HEARTBEAT_SECONDS
+import facebook_service as service
+from facebook_service import messenger
+from facebook_startup import startup_state, start_background_load
+from facebook_tokens import token_manager
+from facebook_window_cache import window_scheduler
+from facebook_metrics import http_requests_total, http_request_seconds
+from facebook_events import event_bus, format_sse
+from facebook_json import FastJSONResponse
+from facebook_compression import CompressionMiddleware, negotiate
+
+@asynccontextmanager
+async def lifespan(app):
+    # Loads data when the app is served on its own; main.py starts the load even earlier
+    start_background_load()
+    token_manager.start(messenger)
+    window_scheduler.start()
+    # server_ready is not set here: uvicorn only binds its socket after the lifespan has started
+    yield
+    window_scheduler.stop()
+    token_manager.stop()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware)
+
+def _encoded(result):
+    """Response for a service call that returns pre-encoded (JSON bytes, content encoding), or an error dict"""
+    if isinstance(result, dict):
+        return FastJSONResponse(result)
+    body, encoding = result
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count and time every request by its route template, not its raw path"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        route_path = route.path if route is not None else 'unmatched'
+        http_requests_total.inc(route=route_path, method=request.method, status=status)
+        http_request_seconds.observe(time.perf_counter() - started, route=route_path, method=request.method)
+
+@app.get("/")
+async def root():
+    return FastJSONResponse({
+        "message": "Enhanced Facebook Messenger with Proper Name Handling - Ready!",
+        "note": "Participant names come from conversation data and are properly stored"
+    })
+
+@app.get("/health")
+async def health():
+    """Liveness check: the server is up and answering"""
+    return FastJSONResponse({"status": "ok", "uptime_seconds": startup_state.snapshot()['uptime_seconds']})
+
+@app.get("/ready")
+async def ready():
+    """Readiness check with data load progress; 503 until startup has finished"""
+    # Answering a request means the socket is listening, also when uvicorn serves the app on its own
+    startup_state.server_ready.set()
+    state = startup_state.snapshot()
+    return FastJSONResponse(state, status_code=200 if state['ready'] else 503)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: Graph calls and latency, sync phases, sends, persistence and store sizes"""
+    body = await run_in_threadpool(service.render_metrics)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/facebook/traces")
+async def get_sync_traces(limit: int = 10, events: bool = False):
+    """Last N sync timelines (opt-in tracing); ?events=true adds the raw Chrome trace events"""
+    return FastJSONResponse(service.get_sync_traces(limit, events))
+
+@app.get("/login")
+async def login():
+    """Facebook login"""
+    url = messenger.generate_login_url()
+    print(f"\n🔗 Login URL: {url}")
+    return RedirectResponse(url=url, status_code=307)
+
+@app.get("/auth/callback")
+async def auth_callback(request: Request):
+    """Handle OAuth callback and setup complete user data with proper names"""
+    code = request.query_params.get("code")
+    error = request.query_params.get("error")
+    
+    if error:
+        return FastJSONResponse({"error": f"Authorization failed: {error}"})
+    
+    if not code:
+        return FastJSONResponse({"error": "Missing authorization code"})
+    
+    # The sync runs in a worker thread so other accounts' reads are not blocked meanwhile
+    return FastJSONResponse(await run_in_threadpool(service.complete_login, code))
+
+@app.get("/accounts")
+async def get_accounts():
+    """List known accounts; other endpoints take ?account_id= and default to the last login"""
+    return FastJSONResponse(service.list_accounts())
+
+@app.get("/facebook/conversations")
+async def get_facebook_conversations(account_id: str = None):
+    """Get Facebook conversations with proper participant names"""
+    return FastJSONResponse(await run_in_threadpool(service.get_conversations, account_id))
+
+@app.get("/facebook/messages/{conversation_id}")
+async def get_messages_for_conversation(request: Request, conversation_id: str, account_id: str = None):
+    """Get all messages for a specific conversation with proper names"""
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    return _encoded(await run_in_threadpool(service.get_messages_json, conversation_id, account_id, encoding))
+
+@app.get("/facebook/attachments/{attachment_id}")
+async def get_attachment(attachment_id: str, account_id: str = None):
+    """Serve one of an account's cached message attachments, with Range requests for partial and resumed downloads"""
+    attachment = await run_in_threadpool(service.get_attachment, attachment_id, account_id)
+    if "error" in attachment:
+        return FastJSONResponse(attachment, status_code=404)
+    # Blobs are content-addressed, so their body never changes for a given id
+    headers = {"ETag": f'"{attachment["sha256"]}"', "Cache-Control": "private, max-age=31536000, immutable"}
+    if ATTACHMENT_ACCEL_REDIRECT_PREFIX:
+        # Let the fronting proxy send the file itself (sendfile, ranges); the path below the prefix is blobs/<ab>/<sha256>
+        blob = attachment["path"].split(os.sep)[-2:]
+        headers["X-Accel-Redirect"] = f"{ATTACHMENT_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{'/'.join(blob)}"
+        return Response(status_code=200, headers=headers, media_type=attachment["mime_type"])
+    return FileResponse(attachment["path"], media_type=attachment["mime_type"], filename=attachment["name"], headers=headers)
+
+@app.get("/facebook/sync")
+async def get_sync_status():
+    """Progress of running syncs, and accounts with an interrupted sync the next login will resume"""
+    return FastJSONResponse(service.get_sync_status())
+
+@app.get("/facebook/sync/conversations")
+async def get_partial_conversations(account_id: str = None):
+    """Conversations the running sync has fetched so far"""
+    return FastJSONResponse(service.get_partial_conversations(account_id))
+
+@app.get("/facebook/sync/messages/{conversation_id}")
+async def get_partial_messages(conversation_id: str, account_id: str = None):
+    """Messages the running sync has fetched so far for one conversation"""
+    return FastJSONResponse(service.get_partial_messages(conversation_id, account_id))
+
+@app.get("/facebook/export")
+async def export_messages(account_id: str = None, format: str = "ndjson", since: str = None, until: str = None,
+                          page_id: str = None, conversation_id: str = None):
+    """Stream stored messages as ndjson, csv, columnar (JSON column batches) or arrow, optionally filtered by time and page"""
+    export = await run_in_threadpool(service.export_messages, account_id, format, since, until, page_id, conversation_id)
+    if "error" in export:
+        return FastJSONResponse(export, status_code=400)
+    # A plain iterator is consumed in the threadpool chunk by chunk, so rows are encoded as the client reads them
+    return StreamingResponse(
+        export["chunks"], media_type=export["media_type"],
+        headers={"Content-Disposition": f'attachment; filename="{export["filename"]}"'}
+    )
+
+@app.get("/facebook/analytics")
+async def get_analytics(account_id: str = None, interval: str = "day", since: str = None, until: str = None,
+                        page_id: str = None, conversation_id: str = None, top: int = 20):
+    """Message volume per page and conversation over time, reply time percentiles and inbound/outbound ratios"""
+    # The first query of an account builds its columns from the store, so keep it off the event loop
+    analytics = await run_in_threadpool(service.get_analytics, account_id, interval, since, until, page_id, conversation_id, top)
+    return FastJSONResponse(analytics, status_code=400 if "error" in analytics else 200)
+
+@app.get("/facebook/windows/expiring")
+async def get_expiring_windows(within: str = "2h", limit: int = 100, account_id: str = None):
+    """Conversations whose 24-hour reply window closes within e.g. 30m or 2h, soonest first"""
+    return FastJSONResponse(await run_in_threadpool(service.get_expiring_windows, within, limit, account_id))
+
+@app.get("/facebook/changes")
+async def get_changes(since: int = 0, limit: int = 1000, account_id: str = None):
+    """Store changes after sequence number since, oldest first; poll again with next_since while has_more"""
+    return FastJSONResponse(await run_in_threadpool(service.get_changes, since, limit, account_id))
+
+@app.get("/facebook/stream")
+async def stream_events(request: Request, types: str = None, account_id: str = None, conversation_id: str = None, page_id: str = None):
+    """Server-Sent Events: new messages, sends, window changes and sync progress, filtered per client"""
+    subscription = service.subscribe_events(types, account_id, conversation_id, page_id, loop=asyncio.get_running_loop())
+    if isinstance(subscription, dict):
+        return FastJSONResponse(subscription, status_code=400)
+
+    async def events():
+        try:
+            yield f"retry: 3000\n: subscribed types={types or 'all'}\n\n"
+            while not await request.is_disconnected():
+                batch, dropped = await subscription.wait_async(EVENT_STREAM_HEARTBEAT_SECONDS)
+                if dropped:
+                    # This client fell behind; it should refetch what it shows instead of trusting the stream
+                    yield f"event: overflow\ndata: {{\"dropped\": {dropped}}}\n\n"
+                if batch:
+                    yield ''.join(format_sse(event) for event in batch)
+                elif not dropped:
+                    yield ": keepalive\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/facebook/participants")
+async def get_participant_names(request: Request, account_id: str = None):
+    """Get all participant names collected from conversations"""
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    return _encoded(await run_in_threadpool(service.get_participants_json, account_id, encoding))
+
+@app.post("/facebook/send")
+async def send_facebook_message(request: Request, account_id: str = None):
+    """Send Facebook message with proper participant name display"""
+    data = await request.json()
+    return FastJSONResponse(await run_in_threadpool(service.send_message, data.get('conversation_id'), data.get('message'), data.get('account_id', account_id), data.get('recipient_id')))
+
+@app.get("/webhook")
+async def verify_webhook(request: Request):
+    """Verify the Messenger webhook subscription"""
+    mode = request.query_params.get("hub.mode")
+    token = request.query_params.get("hub.verify_token")
+    challenge = request.query_params.get("hub.challenge", "")
+    
+    if mode == "subscribe" and token == WEBHOOK_VERIFY_TOKEN:
+        return PlainTextResponse(challenge)
+    return PlainTextResponse("Verification failed", status_code=403)
+
+@app.post("/webhook")
+async def receive_webhook(request: Request):
+    """Receive Messenger webhook events and keep message window statuses current"""
+    data = await request.json()
+    return FastJSONResponse(await run_in_threadpool(service.handle_webhook_event, data))
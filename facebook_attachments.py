@@ -0,0 +1,295 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from facebook_config import ATTACHMENTS_DIR, ATTACHMENT_CACHE_MAX_BYTES, ATTACHMENT_MAX_FILE_BYTES, ATTACHMENT_DOWNLOAD_WORKERS
+from facebook_logging import get_logger
+from facebook_metrics import attachment_downloads_total, attachment_download_seconds, attachment_download_bytes_total, attachment_evictions_total, attachment_cache_bytes
+from facebook_tracing import tracer
+
+log = get_logger("attachments")
+
+CHUNK_SIZE = 64 * 1024
+
+def attachment_source_url(attachment):
+    """Download URL of a Graph message attachment: files have file_url, media image_data/video_data"""
+    return (
+        attachment.get('file_url')
+        or (attachment.get('video_data') or {}).get('url')
+        or (attachment.get('image_data') or {}).get('url')
+    )
+
+class AttachmentStore:
+    """Content-addressed attachment cache: blobs stored once per sha256, evicted least recently used past a size limit
+
+    The index maps Graph attachment ids to their blob, metadata and the accounts whose messages hold them;
+    blobs live at blobs/<ab>/<sha256>.
+    """
+
+    def __init__(self, root=ATTACHMENTS_DIR, max_bytes=ATTACHMENT_CACHE_MAX_BYTES, max_file_bytes=ATTACHMENT_MAX_FILE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.index_path = os.path.join(root, "index.json")
+        self._attachments = {}  # attachment_id -> {'sha256', 'size', 'mime_type', 'name', 'url', 'accounts'}
+        self._blobs = {}  # sha256 -> {'size', 'last_access'}
+        self._total_bytes = 0
+        self._downloading = {}  # attachment_id -> Event, so concurrent requests share one download
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+        self.session = requests.Session()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, "blobs", sha256[:2], sha256)
+
+    # ---- index ----
+
+    def register(self, attachment_id, url, mime_type=None, name=None, size=None, account_id=None):
+        """Remember where an attachment can be downloaded from and which account it belongs to, without downloading it yet"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._attachments.setdefault(attachment_id, {})
+            if url:
+                entry['url'] = url
+            entry.update({k: v for k, v in (('mime_type', mime_type), ('name', name), ('size', size)) if v})
+            if account_id and account_id not in entry.setdefault('accounts', []):
+                entry['accounts'].append(account_id)
+            self._dirty = True
+
+    def owned_by(self, attachment_id, account_id):
+        """Whether an attachment was registered by one of an account's syncs"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._attachments.get(attachment_id)
+            return entry is not None and account_id in entry.get('accounts', [])
+
+    def info(self, attachment_id):
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._attachments.get(attachment_id)
+            if entry is None:
+                return None
+            return dict(entry, cached=bool(entry.get('sha256')) and entry['sha256'] in self._blobs)
+
+    def open(self, attachment_id):
+        """Return (path, metadata) of a cached attachment and mark it recently used, or (None, metadata)"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._attachments.get(attachment_id)
+            if not entry:
+                return None, None
+            blob = self._blobs.get(entry.get('sha256'))
+            if blob is None:
+                return None, dict(entry)
+            blob['last_access'] = time.time()
+            return self.blob_path(entry['sha256']), dict(entry)
+
+    # ---- downloads ----
+
+    def download(self, attachment_id, url=None):
+        """Stream an attachment into the cache unless its blob is already there; returns its sha256 or None"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._attachments.setdefault(attachment_id, {})
+            url = url or entry.get('url')
+            if entry.get('sha256') in self._blobs:
+                self._blobs[entry['sha256']]['last_access'] = time.time()
+                return entry['sha256']
+            if not url:
+                return None
+            pending = self._downloading.get(attachment_id)
+            if pending is None:
+                pending = self._downloading[attachment_id] = threading.Event()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            pending.wait()
+            info = self.info(attachment_id)
+            return info['sha256'] if info and info['cached'] else None
+
+        try:
+            return self._stream_to_blob(attachment_id, url)
+        finally:
+            with self._lock:
+                self._downloading.pop(attachment_id, None)
+            pending.set()
+
+    def _stream_to_blob(self, attachment_id, url):
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, f"{attachment_id.replace('/', '_')}.{threading.get_ident()}.part")
+        digest = hashlib.sha256()
+        size = 0
+        complete = False
+        started = time.perf_counter()
+        try:
+            with tracer.span('download_attachment', 'attachments', attachment_id=attachment_id) as span, \
+                    self.session.get(url, stream=True, timeout=60) as response:
+                if response.status_code != 200:
+                    log.warning("⚠️ Attachment %s download failed: HTTP %s", attachment_id, response.status_code)
+                    attachment_downloads_total.inc(result="error")
+                    return None
+                mime_type = response.headers.get('Content-Type')
+                with open(tmp_path, 'wb') as f:
+                    # Chunks go straight to disk while hashing, so large media never sits in memory
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            log.warning("⚠️ Attachment %s is larger than %d bytes, not caching it", attachment_id, self.max_file_bytes)
+                            attachment_downloads_total.inc(result="too_large")
+                            return None
+                        digest.update(chunk)
+                        f.write(chunk)
+                span['bytes'] = size
+                complete = True
+        except (requests.exceptions.RequestException, OSError) as e:
+            log.warning("⚠️ Attachment %s download failed: %s", attachment_id, e)
+            attachment_downloads_total.inc(result="error")
+            return None
+        finally:
+            if not complete and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        attachment_download_seconds.observe(time.perf_counter() - started)
+        attachment_download_bytes_total.inc(size)
+
+        sha256 = digest.hexdigest()
+        path = self.blob_path(sha256)
+        with self._lock:
+            if sha256 in self._blobs:
+                # Same content under another attachment id: keep the one copy
+                os.remove(tmp_path)
+                attachment_downloads_total.inc(result="deduplicated")
+            else:
+                attachment_downloads_total.inc(result="stored")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                self._blobs[sha256] = {'size': size, 'last_access': time.time()}
+                self._total_bytes += size
+            entry = self._attachments.setdefault(attachment_id, {})
+            entry.update({'sha256': sha256, 'size': size, 'url': url})
+            if mime_type and not entry.get('mime_type'):
+                entry['mime_type'] = mime_type
+            self._blobs[sha256]['last_access'] = time.time()
+            self._dirty = True
+            self._evict()
+            attachment_cache_bytes.set(self._total_bytes)
+        return sha256
+
+    def _evict(self):
+        """Drop least recently used blobs until the cache fits; index entries stay so they can be fetched again"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        for sha256, blob in sorted(self._blobs.items(), key=lambda item: item[1]['last_access']):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self.blob_path(sha256))
+            except OSError:
+                pass
+            self._total_bytes -= blob['size']
+            del self._blobs[sha256]
+            attachment_evictions_total.inc()
+
+    # ---- persistence ----
+
+    def load(self):
+        """(Re)load the index, dropping entries whose blob is gone"""
+        with self._lock:
+            self._loaded = True
+            self._attachments, self._blobs, self._total_bytes = {}, {}, 0
+            try:
+                if os.path.exists(self.index_path):
+                    with open(self.index_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    self._attachments = data.get('attachments', {})
+                    # Trust the blobs on disk over the saved index
+                    self._blobs = {
+                        sha256: blob for sha256, blob in data.get('blobs', {}).items()
+                        if os.path.exists(self.blob_path(sha256))
+                    }
+                    self._total_bytes = sum(blob['size'] for blob in self._blobs.values())
+                return True
+            except Exception as e:
+                log.error("❌ Failed to load attachment index: %s", e)
+                return False
+
+    def save(self):
+        """Save the index if anything changed"""
+        with self._lock:
+            if not self._dirty:
+                return True
+            try:
+                os.makedirs(self.root, exist_ok=True)
+                tmp_path = f"{self.index_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"attachments": self._attachments, "blobs": self._blobs}, f, ensure_ascii=False)
+                os.replace(tmp_path, self.index_path)
+                self._dirty = False
+                return True
+            except Exception as e:
+                log.error("❌ Failed to save attachment index: %s", e)
+                return False
+
+    def snapshot(self):
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                "attachments": len(self._attachments),
+                "blobs": len(self._blobs),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+class AttachmentDownloader:
+    """Downloads a sync's attachments on a small thread pool while the sync keeps fetching messages"""
+
+    def __init__(self, store, account_id=None, workers=ATTACHMENT_DOWNLOAD_WORKERS):
+        self.store = store
+        self.account_id = account_id
+        self.workers = workers
+        self._pool = None
+        self._futures = []
+
+    def submit(self, attachment):
+        """Queue one processed attachment dict; its cache fields are filled in by wait()"""
+        if not attachment.get('attachment_id') or not attachment.get('url'):
+            return
+        self.store.register(attachment['attachment_id'], attachment['url'], attachment.get('mime_type'), attachment.get('name'), attachment.get('size'), self.account_id)
+        if self.workers <= 0:
+            return
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="attachment")
+        self._futures.append((attachment, self._pool.submit(self._download, tracer.current(), attachment['attachment_id'], attachment['url'])))
+
+    def _download(self, timeline, attachment_id, url):
+        with tracer.bind(timeline):
+            return self.store.download(attachment_id, url)
+
+    def wait(self):
+        """Wait for all downloads, record each attachment's sha256 and return how many are cached"""
+        cached = 0
+        for attachment, future in self._futures:
+            try:
+                sha256 = future.result()
+            except Exception as e:
+                log.warning("⚠️ Attachment %s download failed: %s", attachment.get('attachment_id'), e)
+                sha256 = None
+            attachment['sha256'] = sha256
+            attachment['cached'] = sha256 is not None
+            cached += sha256 is not None
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._futures = []
+        self.store.save()
+        return cached
+
+attachment_store = AttachmentStore()
@@ -0,0 +1,466 @@
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timezone
+import requests
+from facebook_config import user_data, STATE_BACKEND, FACEBOOK_DATA_FILE, MESSAGES_DATA_FILE
+from facebook_mock_graph import MockGraphFixture, MockGraphServer, MOCK_USER_TOKEN
+from facebook_messenger import FacebookMessenger
+from facebook_graph_cache import graph_cache
+from facebook_window_cache import window_cache, parse_graph_time
+from facebook_accounts import account_registry, account_file
+from facebook_data_handlers import save_facebook_data, save_messages_data, save_user_profile, load_all_data, count_messages
+from facebook_logging import get_logger
+from facebook_attachments import attachment_store
+
+DEFAULT_SYNC_SIZES = [10, 1000, 100000]
+DEFAULT_DATASET_SIZES = [100, 1000, 10000]
+SERVER_START_TIMEOUT_SECONDS = 30
+
+@contextmanager
+def scratch_dir(keep=False):
+    """Run in a temporary working directory, since the account JSON files are written relative to it"""
+    previous = os.getcwd()
+    path = tempfile.mkdtemp(prefix="fb-bench-")
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+        if not keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+@contextmanager
+def quiet(enabled=True):
+    """Silence progress prints and info logging, which would otherwise show up in the timings"""
+    if not enabled:
+        yield
+        return
+    logger = get_logger("benchmark").parent
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            yield
+    finally:
+        logger.setLevel(level)
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def bench_sync(conversations, pages=1, messages_per_conversation=5, latency=0.0, error_rate=0.0, rate_limit=None, attachment_every=0, verbose=False,
+               participants_per_conversation=1):
+    """Time setup_complete_user_data against the mock Graph server for one fixture size"""
+    fixture = MockGraphFixture(conversations, pages, messages_per_conversation, attachment_every=attachment_every,
+                               participants_per_conversation=participants_per_conversation)
+    with MockGraphServer(fixture, latency=latency, error_rate=error_rate, rate_limit=rate_limit) as mock, scratch_dir():
+        messenger = FacebookMessenger(base_url=mock.url)
+        messenger.conversation_delay = 0
+        messenger.retry_backoff = 0.05
+        graph_cache.clear()
+        window_cache.clear()
+        attachment_store.load()
+
+        with quiet(not verbose):
+            started, cpu_started = time.perf_counter(), time.process_time()
+            data = messenger.setup_complete_user_data(MOCK_USER_TOKEN)
+            seconds = time.perf_counter() - started
+            cpu_seconds = time.process_time() - cpu_started
+
+        synced_conversations = len(data['facebook_conversations'])
+        synced_messages = count_messages(data)
+        stored_bytes = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk('.') for name in names
+        )
+        graph = mock.snapshot()
+        attachments = attachment_store.snapshot()
+
+    return {
+        "benchmark": "sync",
+        "conversations": conversations,
+        "pages": pages,
+        "messages_per_conversation": messages_per_conversation,
+        "latency_seconds": latency,
+        "error_rate": error_rate,
+        "rate_limit": rate_limit,
+        "attachment_every": attachment_every,
+        "participants_per_conversation": participants_per_conversation,
+        "synced_conversations": synced_conversations,
+        "synced_messages": synced_messages,
+        "complete": synced_conversations == conversations and synced_messages == conversations * messages_per_conversation,
+        "seconds": round(seconds, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "conversations_per_second": round(synced_conversations / seconds, 1) if seconds else None,
+        "graph_requests": graph['requests'],
+        "graph_requests_per_conversation": round(graph['requests'] / max(conversations, 1), 2),
+        "graph_requests_by_endpoint": graph['by_endpoint'],
+        "graph_errors_injected": graph['errors_injected'],
+        "graph_rate_limited": graph['rate_limited'],
+        "stored_bytes": stored_bytes,
+        "attachments": attachments['attachments'],
+        "attachment_blobs": attachments['blobs'],
+        "attachment_media_bytes": graph['media_bytes'],
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def synthetic_account(fixture):
+    """Account data in the shape setup_complete_user_data produces, built straight from a fixture"""
+    retrieved_at = datetime.now().isoformat()
+    now = datetime.now(timezone.utc)
+    pages = [
+        {'id': page['id'], 'name': page['name'], 'access_token': page['access_token'], 'platform': 'facebook', 'retrieved_at': retrieved_at}
+        for page in fixture.page_list()
+    ]
+    data = {
+        'access_token': MOCK_USER_TOKEN,
+        'connected_at': retrieved_at,
+        'profile': fixture.profile(),
+        'facebook_pages': pages,
+        'facebook_conversations': [],
+        'facebook_messages': {},
+        'participant_names': {}
+    }
+    for page_index, page in enumerate(pages):
+        for index in range(fixture.conversations_for_page(page_index)):
+            conv = fixture.conversation(page_index, index)
+            participants = [{'id': p['id'], 'name': p['name']} for p in conv['participants']['data'] if p['id'] != page['id']]
+            participant = participants[0]
+            hours_since = (now - fixture.last_message_time(page_index, index)).total_seconds() / 3600
+            for p in participants:
+                data['participant_names'][p['id']] = p['name']
+            data['facebook_conversations'].append({
+                'conversation_id': conv['id'],
+                'page_id': page['id'],
+                'page_name': page['name'],
+                'page_access_token': page['access_token'],
+                'participant_id': participant['id'],
+                'participant_name': participant['name'],
+                'participant_email': 'Not available (Facebook privacy policy)',
+                'participants': participants,
+                'updated_time': conv['updated_time'],
+                'message_count': conv['message_count'],
+                'platform': 'facebook',
+                'can_send_message': hours_since <= 24,
+                'hours_since_last_message': round(hours_since, 1),
+                'retrieved_at': retrieved_at
+            })
+            data['facebook_messages'][conv['id']] = [
+                {
+                    'message_id': msg['id'],
+                    'message_text': msg['message'],
+                    'created_time': msg['created_time'],
+                    'sender': {'id': msg['from']['id'], 'name': msg['from']['name'], 'email': 'Not available (Facebook privacy policy)'},
+                    'attachments': [],
+                    'attachment_count': 0,
+                    'retrieved_at': retrieved_at
+                }
+                for msg in fixture.messages(page_index, index, fixture.messages_per_conversation)
+            ]
+    return data
+
+def install_account(data):
+    """Make a synthetic account the default account of this process"""
+    account_id = data['profile']['id']
+    user_data[account_id] = data
+    account_registry.register(account_id, data['profile'], [page['id'] for page in data['facebook_pages']])
+    # A sync records each conversation's reply window; without it every send asks Graph first
+    for conv in data['facebook_conversations']:
+        messages = data['facebook_messages'].get(conv['conversation_id'], [])
+        last_inbound = next((m for m in messages if m['sender']['id'] != conv['page_id'] and m.get('created_time')), None)
+        if last_inbound:
+            window_cache.record_last_message(conv['conversation_id'], parse_graph_time(last_inbound['created_time']), account_id)
+    return account_id
+
+def latency_stats(latencies, errors, seconds):
+    """Percentiles in milliseconds plus throughput for one endpoint run"""
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 2)
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else None,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+        "requests_per_second": round(len(ordered) / seconds, 1) if seconds else None
+    }
+
+def run_load(call, total, concurrency):
+    """Issue total calls from concurrency threads, each with its own keep-alive session"""
+    local = threading.local()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = call(session, i)
+            ok = response.status_code == 200 and 'error' not in response.json()
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return latency_stats(latencies, errors[0], time.perf_counter() - started)
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def api_server():
+    """Serve the FastAPI app with uvicorn in a background thread"""
+    import uvicorn
+    from facebook_api_endpoints import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-api", daemon=True)
+    thread.start()
+    deadline = time.time() + SERVER_START_TIMEOUT_SECONDS
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(SERVER_START_TIMEOUT_SECONDS)
+
+def bench_endpoints(base_url, conversations, messages_per_conversation=20, requests_per_endpoint=200, concurrency=8, seed=0, latency=0.0):
+    """Latency percentiles of the read and send endpoints under concurrent load for one dataset size
+
+    Sends go to a mock Graph API serving the fixture the account was built from. A send that had to
+    fall back to a message tag counts as an error, since it measured the out-of-window path.
+    """
+    from facebook_service import messenger
+
+    fixture = MockGraphFixture(conversations, 1, messages_per_conversation, seed)
+    account_id = install_account(synthetic_account(fixture))
+    conversation_ids = [conv['conversation_id'] for conv in user_data[account_id]['facebook_conversations']]
+    pick = random.Random(seed)
+    targets = [pick.choice(conversation_ids) for _ in range(requests_per_endpoint)]
+    # Sends target conversations whose reply window is open, the path a reply normally takes
+    open_ids = [conv['conversation_id'] for conv in user_data[account_id]['facebook_conversations'] if conv['can_send_message']] or conversation_ids
+    send_targets = [pick.choice(open_ids) for _ in range(requests_per_endpoint)]
+
+    endpoints = {
+        "conversations": lambda session, i: session.get(f"{base_url}/facebook/conversations", params={'account_id': account_id}),
+        "messages": lambda session, i: session.get(f"{base_url}/facebook/messages/{targets[i]}", params={'account_id': account_id}),
+        "send": lambda session, i: session.post(f"{base_url}/facebook/send", json={
+            'conversation_id': send_targets[i], 'message': f"Benchmark message {i}", 'account_id': account_id
+        })
+    }
+    results = {}
+    previous_base_url = messenger.base_url
+    with MockGraphServer(fixture, latency=latency) as mock:
+        messenger.base_url = mock.url
+        try:
+            for name, call in endpoints.items():
+                results[name] = run_load(call, requests_per_endpoint, concurrency)
+        finally:
+            messenger.base_url = previous_base_url
+        graph = mock.snapshot()
+    results['send']['fallbacks'] = graph['messages_tagged']
+    results['send']['errors'] += graph['messages_tagged']
+
+    return {
+        "benchmark": "endpoints",
+        "conversations": conversations,
+        "messages_per_conversation": messages_per_conversation,
+        "concurrency": concurrency,
+        "state_backend": STATE_BACKEND,
+        "endpoints": results,
+        "graph_requests_by_endpoint": graph['by_endpoint'],
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def bench_persistence(conversations, messages_per_conversation=20, seed=0):
+    """JSON save and load times and file sizes for one dataset size"""
+    fixture = MockGraphFixture(conversations, 1, messages_per_conversation, seed)
+    data = synthetic_account(fixture)
+    account_id = data['profile']['id']
+    save_user_profile(data['profile'])
+
+    started = time.perf_counter()
+    save_facebook_data(data)
+    save_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    save_messages_data(data)
+    save_messages_seconds = time.perf_counter() - started
+    account_registry.register(account_id, data['profile'], [page['id'] for page in data['facebook_pages']])
+
+    # Load from disk as a fresh start would
+    del data
+    if account_id in user_data:
+        del user_data[account_id]
+    started = time.perf_counter()
+    loaded = load_all_data()
+    load_seconds = time.perf_counter() - started
+    loaded_messages = count_messages(user_data[account_id]) if loaded else 0
+
+    return {
+        "benchmark": "persistence",
+        "conversations": conversations,
+        "messages_per_conversation": messages_per_conversation,
+        "state_backend": STATE_BACKEND,
+        "save_facebook_data_seconds": round(save_seconds, 3),
+        "save_messages_data_seconds": round(save_messages_seconds, 3),
+        "load_all_data_seconds": round(load_seconds, 3),
+        "facebook_data_bytes": os.path.getsize(account_file(account_id, FACEBOOK_DATA_FILE)),
+        "messages_data_bytes": os.path.getsize(account_file(account_id, MESSAGES_DATA_FILE)),
+        "complete": loaded_messages == conversations * messages_per_conversation,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def _flatten(result, prefix=""):
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def compare_reports(old_path, new_path):
+    """Print every numeric metric that exists in both reports, matched by benchmark and size"""
+    def index(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        return {(r['benchmark'], r['conversations']): _flatten(r) for r in report['results']}
+
+    old, new = index(old_path), index(new_path)
+    rows = []
+    for key in sorted(set(old) & set(new)):
+        for metric, old_value in old[key].items():
+            new_value = new[key].get(metric)
+            if new_value is None or metric in ('conversations', 'messages_per_conversation', 'concurrency', 'pages'):
+                continue
+            change = round((new_value - old_value) / old_value * 100, 1) if old_value else None
+            rows.append({"benchmark": key[0], "conversations": key[1], "metric": metric, "old": old_value, "new": new_value, "change_percent": change})
+    return rows
+
+def _sizes(value):
+    return [int(float(size)) for size in value.split(',') if size]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks against the mock Graph API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = subparsers.add_parser("sync", help="time setup_complete_user_data at several conversation counts")
+    sync_parser.add_argument("--sizes", type=_sizes, default=DEFAULT_SYNC_SIZES, help="comma separated conversation counts")
+    sync_parser.add_argument("--pages", type=int, default=1)
+    sync_parser.add_argument("--messages-per-conversation", type=int, default=5)
+    sync_parser.add_argument("--latency", type=float, default=0.0, help="seconds the mock adds to every response")
+    sync_parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock responses that are transient errors")
+    sync_parser.add_argument("--rate-limit", type=int, default=None, help="mock requests per second before rate limit errors")
+    sync_parser.add_argument("--attachment-every", type=int, default=0, help="give every Nth mock message an attachment")
+    sync_parser.add_argument("--participants-per-conversation", type=int, default=1, help="above 1, every mock conversation is a group thread")
+    sync_parser.add_argument("--verbose", action="store_true", help="keep the sync's progress output")
+
+    endpoints_parser = subparsers.add_parser("endpoints", help="endpoint latency percentiles under concurrent load")
+    endpoints_parser.add_argument("--sizes", type=_sizes, default=DEFAULT_DATASET_SIZES)
+    endpoints_parser.add_argument("--messages-per-conversation", type=int, default=20)
+    endpoints_parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and size")
+    endpoints_parser.add_argument("--concurrency", type=int, default=8)
+    endpoints_parser.add_argument("--latency", type=float, default=0.0, help="seconds the mock Graph API adds to sends")
+
+    persistence_parser = subparsers.add_parser("persistence", help="JSON save/load time and file size")
+    persistence_parser.add_argument("--sizes", type=_sizes, default=DEFAULT_DATASET_SIZES)
+    persistence_parser.add_argument("--messages-per-conversation", type=int, default=20)
+
+    all_parser = subparsers.add_parser("all", help="sync, endpoints and persistence at the same sizes")
+    all_parser.add_argument("--sizes", type=_sizes, default=DEFAULT_DATASET_SIZES)
+    all_parser.add_argument("--requests", type=int, default=200)
+    all_parser.add_argument("--concurrency", type=int, default=8)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two JSON reports, e.g. from two releases")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+
+    for name, sub in subparsers.choices.items():
+        if name != "compare":
+            sub.add_argument("--output", help="write the JSON results to this file as well")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        rows = compare_reports(args.old, args.new)
+        print(json.dumps(rows, indent=2))
+        return rows
+
+    results = []
+    with scratch_dir():
+        if args.command in ("sync", "all"):
+            for size in args.sizes:
+                print(f"⏱️ Syncing {size} conversations from the mock Graph API...", file=sys.stderr)
+                if args.command == "sync":
+                    result = bench_sync(size, args.pages, args.messages_per_conversation, args.latency, args.error_rate, args.rate_limit, args.attachment_every, args.verbose,
+                                         args.participants_per_conversation)
+                else:
+                    result = bench_sync(size)
+                print(f"   {result['seconds']}s, {result['conversations_per_second']} conversations/s, {result['graph_requests']} Graph requests", file=sys.stderr)
+                results.append(result)
+
+        if args.command in ("persistence", "all"):
+            messages_per_conversation = getattr(args, 'messages_per_conversation', 20)
+            for size in args.sizes:
+                print(f"⏱️ Saving and loading {size} conversations...", file=sys.stderr)
+                with quiet():
+                    result = bench_persistence(size, messages_per_conversation)
+                print(f"   save {result['save_facebook_data_seconds']}s, load {result['load_all_data_seconds']}s, {result['facebook_data_bytes']} bytes", file=sys.stderr)
+                results.append(result)
+
+        if args.command in ("endpoints", "all"):
+            messages_per_conversation = getattr(args, 'messages_per_conversation', 20)
+            with quiet(), api_server() as base_url:
+                for size in args.sizes:
+                    print(f"⏱️ Loading endpoints with {size} conversations...", file=sys.stderr)
+                    result = bench_endpoints(base_url, size, messages_per_conversation, args.requests, args.concurrency, latency=getattr(args, 'latency', 0.0))
+                    summary = ", ".join(f"{name} p50 {stats['p50_ms']}ms p99 {stats['p99_ms']}ms" for name, stats in result['endpoints'].items())
+                    print(f"   {summary}", file=sys.stderr)
+                    results.append(result)
+
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from facebook_config import CHANGE_LOG_FILE, CHANGE_LOG_RETENTION
+from facebook_state import locked_file
+from facebook_data_handlers import count_messages, conversation_participants
+from facebook_logging import get_logger
+
+log = get_logger("changes")
+
+# Conversation fields a change feed client mirrors; a sync only records a conversation when one of these differs
+CONVERSATION_FEED_FIELDS = (
+    'conversation_id', 'page_id', 'page_name', 'participant_id', 'participant_name',
+    'updated_time', 'message_count', 'can_send_message'
+)
+
+def conversation_summary(conv):
+    """A conversation as the change feed shows it, without its page access token"""
+    summary = {field: conv.get(field) for field in CONVERSATION_FEED_FIELDS}
+    summary['participants'] = conversation_participants(conv)
+    return summary
+
+class ChangeLog:
+    """One account's store mutations, numbered by a sequence that only ever increases
+
+    Changes are appended to a JSON lines file so sequence numbers survive restarts; only the last
+    retention changes are kept, and a client asking for anything older is told to reset. The file is
+    shared by every worker: before numbering new changes a worker reads, under the file lock, whatever
+    the others appended, and readers pick those up too, so all workers hand out one sequence.
+    """
+
+    def __init__(self, path=CHANGE_LOG_FILE, retention=CHANGE_LOG_RETENTION):
+        self.path = path
+        self.retention = retention
+        self.latest_seq = 0
+        self._changes = deque(maxlen=retention)
+        self._lines_in_file = 0
+        # How far into which file (inode) this process has read
+        self._offset = 0
+        self._file_id = None
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def load(self):
+        with self._lock:
+            self._loaded = True
+            self._changes.clear()
+            self._lines_in_file = 0
+            self._offset = 0
+            self._file_id = None
+            try:
+                self._catch_up()
+                return True
+            except Exception as e:
+                log.error("❌ Failed to load change log %s: %s", self.path, e)
+                return False
+
+    def _catch_up(self):
+        """Read the changes appended to the file since this process last read it"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._file_id or stat.st_size < self._offset:
+            # Compacted by another worker: read the rewritten file from the start
+            self._changes.clear()
+            self._lines_in_file = 0
+            self._offset = 0
+            self._file_id = stat.st_ino
+        if stat.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # A line another worker is still writing is read next time
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                change = json.loads(line)
+            except ValueError:
+                # A crash mid-append can leave a partial last line
+                log.warning("⚠️ Skipping unreadable line in %s", self.path)
+                continue
+            self._changes.append(change)
+            self._lines_in_file += 1
+            self.latest_seq = max(self.latest_seq, change['seq'])
+        self._offset += end
+
+    def record(self, op, data, conversation_id=None):
+        """Append one change and return it"""
+        return self.record_many([(op, data, conversation_id)])[-1]
+
+    def record_many(self, entries):
+        """Append (op, data, conversation_id) changes with consecutive sequence numbers in one write"""
+        if not entries:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            ts = datetime.now(timezone.utc).isoformat()
+            changes = []
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with locked_file(self.path):
+                    # Number after the last change any worker wrote
+                    self._catch_up()
+                    for op, data, conversation_id in entries:
+                        self.latest_seq += 1
+                        changes.append({'seq': self.latest_seq, 'ts': ts, 'op': op, 'conversation_id': conversation_id, 'data': data})
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(''.join(json.dumps(change, ensure_ascii=False) + '\n' for change in changes))
+                    # Read back with the file, which keeps the offset right
+                    self._catch_up()
+                if self._lines_in_file > 2 * self.retention:
+                    self._compact()
+            except Exception as e:
+                log.error("❌ Failed to append to change log %s: %s", self.path, e)
+                # Numbered from what this worker knows and kept in memory, so it still serves them
+                if not changes:
+                    for op, data, conversation_id in entries:
+                        self.latest_seq += 1
+                        changes.append({'seq': self.latest_seq, 'ts': ts, 'op': op, 'conversation_id': conversation_id, 'data': data})
+                if not self._changes or self._changes[-1]['seq'] < changes[-1]['seq']:
+                    self._changes.extend(changes)
+            return changes
+
+    def _compact(self):
+        """Rewrite the file with only the retained changes"""
+        tmp_path = f"{self.path}.tmp"
+        with locked_file(self.path):
+            self._catch_up()
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for change in self._changes:
+                    f.write(json.dumps(change, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+            stat = os.stat(self.path)
+        self._file_id = stat.st_ino
+        self._offset = stat.st_size
+        self._lines_in_file = len(self._changes)
+
+    def since(self, seq, limit=1000):
+        """Changes after seq, oldest first, or a reset when some of them are no longer retained"""
+        with self._lock:
+            self._ensure_loaded()
+            try:
+                self._catch_up()
+            except Exception as e:
+                log.error("❌ Failed to read change log %s: %s", self.path, e)
+            oldest = self._changes[0]['seq'] if self._changes else self.latest_seq + 1
+            if seq < oldest - 1 or seq > self.latest_seq:
+                return {"reset": True, "latest_seq": self.latest_seq, "oldest_seq": oldest, "changes": []}
+            # Sequence numbers are consecutive, so the first wanted change normally sits at a known offset
+            start = seq - oldest + 1
+            if start < len(self._changes) and self._changes[start]['seq'] != seq + 1:
+                start = next((i for i, change in enumerate(self._changes) if change['seq'] > seq), len(self._changes))
+            changes = [self._changes[i] for i in range(start, min(start + limit, len(self._changes)))]
+        next_seq = changes[-1]['seq'] if changes else seq
+        return {
+            "reset": False,
+            "latest_seq": self.latest_seq,
+            "oldest_seq": oldest,
+            "next_since": next_seq,
+            "has_more": next_seq < self.latest_seq,
+            "changes": changes
+        }
+
+def diff_account(previous, current):
+    """Changes that turn a previous sync's data into the current one: conversations, new messages, removals"""
+    previous = previous or {}
+    old_conversations = {conv['conversation_id']: conv for conv in previous.get('facebook_conversations', [])}
+    old_messages = previous.get('facebook_messages', {})
+    new_messages = current.get('facebook_messages', {})
+    entries = []
+    current_ids = set()
+    for conv in current.get('facebook_conversations', []):
+        conv_id = conv['conversation_id']
+        current_ids.add(conv_id)
+        summary = conversation_summary(conv)
+        old = old_conversations.get(conv_id)
+        if old is None or conversation_summary(old) != summary:
+            entries.append(('conversation', summary, conv_id))
+        known_ids = {message.get('message_id') for message in old_messages.get(conv_id, [])}
+        # Stored newest first; the feed lists them in the order they were written
+        for message in reversed(new_messages.get(conv_id, [])):
+            if message.get('message_id') not in known_ids:
+                entries.append(('message', message, conv_id))
+    for conv_id in old_conversations:
+        if conv_id not in current_ids:
+            entries.append(('conversation_deleted', {'conversation_id': conv_id}, conv_id))
+    return entries
+
+def record_sync(change_log, previous, current):
+    """Record what a sync changed; a first sync or a diff larger than the log records a single snapshot change"""
+    entries = diff_account(previous, current) if previous else None
+    if entries is None or len(entries) > change_log.retention:
+        return change_log.record_many([('snapshot', {
+            'conversations': len(current.get('facebook_conversations', [])),
+            'messages': count_messages(current)
+        }, None)])
+    return change_log.record_many(entries)
+
+_change_logs = {}
+_change_logs_lock = threading.Lock()
+
+def get_change_log(account_id):
+    """Return the change log of an account, persisted in its account directory"""
+    from facebook_accounts import account_file
+
+    with _change_logs_lock:
+        if account_id not in _change_logs:
+            _change_logs[account_id] = ChangeLog(path=account_file(account_id, CHANGE_LOG_FILE))
+        return _change_logs[account_id]
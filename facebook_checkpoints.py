@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from facebook_config import SYNC_CHECKPOINT_FILE, SYNC_CHECKPOINT_MAX_AGE_SECONDS
+from facebook_json import dumps
+from facebook_data_handlers import merge_conversation_entries
+from facebook_logging import get_logger
+
+log = get_logger("checkpoints")
+
+class SyncCheckpoint:
+    """Journal of one account's sync in progress, so a crashed or restarted sync resumes where it stopped
+
+    Every finished step is appended as one JSON line: each page of conversations together with the cursor
+    of the next one, and each conversation's messages. Replaying the journal restores everything fetched
+    so far. The file is removed once the sync has saved its data, and a journal older than max_age is
+    discarded rather than resumed. While the sync runs, what it has fetched can be read through
+    conversations() and messages().
+    """
+
+    def __init__(self, account_id, path, max_age=SYNC_CHECKPOINT_MAX_AGE_SECONDS):
+        self.account_id = account_id
+        self.path = path
+        self.max_age = max_age
+        self.sync_id = None
+        self.started_at = None
+        self.resumed = False
+        self.phase = None
+        self._page_cursors = {}
+        self._page_conversations = {}
+        self._participant_names = {}
+        self._messages = {}
+        self._restored_conversations = 0
+        self._restored_messages = set()
+        self._file = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Resume the journal on disk if it is recent enough, otherwise start a new one"""
+        with self._lock:
+            self.resumed = self._replay()
+            if not self.resumed:
+                self.sync_id = uuid.uuid4().hex
+                self.started_at = time.time()
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'ab' if self.resumed else 'wb')
+            if not self.resumed:
+                self._write({'type': 'start', 'sync_id': self.sync_id, 'started_at': self.started_at})
+        if self.resumed:
+            log.info("♻️ Resuming sync %s: %d conversations and %d conversations' messages already fetched",
+                     self.sync_id, self._restored_conversations, len(self._restored_messages))
+        return self.resumed
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return False
+        records = []
+        good_bytes = 0
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    good_bytes += len(line)
+            if good_bytes < os.path.getsize(self.path):
+                # The process died mid-write; drop the partial line so the next append starts clean
+                with open(self.path, 'r+b') as f:
+                    f.truncate(good_bytes)
+        except Exception as e:
+            log.warning("⚠️ Could not read sync checkpoint %s: %s", self.path, e)
+            return False
+        if not records or records[0].get('type') != 'start':
+            return False
+        if time.time() - records[0]['started_at'] > self.max_age:
+            log.info("🗑️ Discarding sync checkpoint from %s, it is older than %ds",
+                     datetime.fromtimestamp(records[0]['started_at'], timezone.utc).isoformat(), self.max_age)
+            return False
+        self.sync_id = records[0]['sync_id']
+        self.started_at = records[0]['started_at']
+        for record in records[1:]:
+            if record['type'] == 'conversations':
+                self._page_conversations.setdefault(record['page_id'], []).extend(record['conversations'])
+                self._participant_names.update(record['participant_names'])
+                self._page_cursors[record['page_id']] = (record['after'], record['done'])
+            elif record['type'] == 'messages':
+                self._messages[record['conversation_id']] = record['messages']
+                self._restored_messages.add(record['conversation_id'])
+        # Older journals hold a group thread once per participant
+        for page_id, conversations in self._page_conversations.items():
+            self._page_conversations[page_id] = merge_conversation_entries(conversations)
+            self._restored_conversations += len(self._page_conversations[page_id])
+        return True
+
+    def _write(self, record):
+        self._file.write(dumps(record) + b'\n')
+        # Flushed per step: a crashed process loses at most the step it was in
+        self._file.flush()
+
+    def page_cursor(self, page_id):
+        """(cursor to continue from, whether the page's conversations are all fetched)"""
+        return self._page_cursors.get(page_id, (None, False))
+
+    def page_conversations(self, page_id):
+        """Conversations of a page restored from the journal"""
+        with self._lock:
+            return list(self._page_conversations.get(page_id, []))
+
+    def restored_participant_names(self):
+        with self._lock:
+            return dict(self._participant_names)
+
+    def record_conversations(self, page_id, conversations, participant_names, after, done):
+        """Journal one Graph page of a page's conversations and the cursor of the next one"""
+        with self._lock:
+            self._page_conversations.setdefault(page_id, []).extend(conversations)
+            self._participant_names.update(participant_names)
+            self._page_cursors[page_id] = (after, done)
+            self._write({
+                'type': 'conversations', 'page_id': page_id, 'conversations': conversations,
+                'participant_names': participant_names, 'after': after, 'done': done
+            })
+
+    def restored_messages(self, conversation_id):
+        """Messages fetched for a conversation before the sync was interrupted, or None"""
+        if conversation_id not in self._restored_messages:
+            return None
+        return self._messages.get(conversation_id)
+
+    def record_messages(self, conversation_id, messages):
+        """Journal a conversation's messages"""
+        with self._lock:
+            self._messages[conversation_id] = messages
+            self._write({'type': 'messages', 'conversation_id': conversation_id, 'messages': messages})
+
+    def finish(self):
+        """The sync saved its data: drop the journal"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """Stop journaling and keep the file for the next sync to resume"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        with _running_lock:
+            if _running.get(self.account_id) is self:
+                del _running[self.account_id]
+
+    def conversations(self):
+        """Conversations fetched so far"""
+        with self._lock:
+            return [conv for conversations in self._page_conversations.values() for conv in conversations]
+
+    def messages(self, conversation_id):
+        """Messages fetched so far for one conversation, or None when they have not been fetched yet"""
+        with self._lock:
+            return self._messages.get(conversation_id)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'account_id': self.account_id,
+                'sync_id': self.sync_id,
+                'started_at': datetime.fromtimestamp(self.started_at, timezone.utc).isoformat() if self.started_at else None,
+                'running': self._file is not None,
+                'resumed': self.resumed,
+                'phase': self.phase,
+                'pages_done': sum(1 for _, done in self._page_cursors.values() if done),
+                'conversations': sum(len(conversations) for conversations in self._page_conversations.values()),
+                'conversations_with_messages': len(self._messages),
+                'messages': sum(len(messages) for messages in self._messages.values()),
+                'restored_conversations': self._restored_conversations,
+                'restored_message_conversations': len(self._restored_messages)
+            }
+
+_running = {}
+_running_lock = threading.Lock()
+
+def start_sync_checkpoint(account_id):
+    """Start journaling a sync of an account, resuming its previous checkpoint when there is one"""
+    from facebook_accounts import account_file
+
+    checkpoint = SyncCheckpoint(account_id, account_file(account_id, SYNC_CHECKPOINT_FILE))
+    checkpoint.start()
+    with _running_lock:
+        _running[account_id] = checkpoint
+    return checkpoint
+
+def running_sync(account_id=None):
+    """Checkpoint of the account's running sync; without an account, of the only running sync"""
+    with _running_lock:
+        if account_id is not None:
+            return _running.get(account_id)
+        return next(iter(_running.values())) if len(_running) == 1 else None
+
+def running_syncs():
+    with _running_lock:
+        return list(_running.values())
+
+def has_sync_checkpoint(account_id):
+    """Whether an interrupted sync of the account left a checkpoint for the next login to resume"""
+    from facebook_accounts import account_file
+
+    return os.path.exists(account_file(account_id, SYNC_CHECKPOINT_FILE))
@@ -0,0 +1,178 @@
+import zlib
+from starlette.concurrency import run_in_threadpool
+from facebook_config import COMPRESSION_MIN_BYTES, COMPRESSION_LEVELS
+
+try:
+    import brotli
+except ImportError:  # br is not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstd is not offered
+    zstandard = None
+
+# Content types worth compressing; attachments are served as they were uploaded
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/x-ndjson', 'application/vnd.apache.arrow.stream',
+    'text/plain', 'text/csv', 'text/event-stream', 'text/html'
+)
+
+# Bodies or streamed chunks larger than this are compressed in a worker thread instead of on the event loop
+COMPRESS_IN_THREAD_BYTES = 256 * 1024
+
+# Offered encodings in server preference order, used when a client accepts several with the same weight
+SUPPORTED_ENCODINGS = tuple(
+    encoding for encoding, available in (('zstd', zstandard is not None), ('br', brotli is not None), ('gzip', True))
+    if available
+)
+
+def negotiate(accept_encoding):
+    """Pick the encoding for an Accept-Encoding header, or None to send the body as it is"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip()] = weight
+    best, best_weight = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def is_compressible(content_type):
+    return bool(content_type) and content_type.split(';')[0].strip().lower() in COMPRESSIBLE_TYPES
+
+def compress(body, encoding, level=None):
+    """Compress a whole body, by default at the level used for responses compressed on the fly"""
+    level = COMPRESSION_LEVELS[encoding] if level is None else level
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    raise ValueError(f"Unsupported encoding {encoding!r}")
+
+class StreamCompressor:
+    """Compress a body chunk by chunk, flushing after each chunk so a streaming client never waits on the compressor"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        level = COMPRESSION_LEVELS[encoding]
+        if encoding == 'gzip':
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            raise ValueError(f"Unsupported encoding {encoding!r}")
+
+    def compress(self, chunk):
+        if self.encoding == 'gzip':
+            return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == 'br':
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        if self.encoding == 'gzip':
+            return self._compressor.flush()
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+class CompressionMiddleware:
+    """ASGI middleware: compress responses with the client's preferred encoding
+
+    A complete body shorter than COMPRESSION_MIN_BYTES is sent as it is. Streaming bodies are compressed
+    as they are sent. Responses that already have a Content-Encoding (pre-compressed cached views),
+    partial content and non-text types pass through untouched.
+    """
+
+    def __init__(self, app, min_bytes=COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        accept = ''
+        for name, value in scope.get('headers', []):
+            if name == b'accept-encoding':
+                accept = value.decode('latin-1')
+        encoding = negotiate(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, compressor, passthrough
+            if message['type'] == 'http.response.start':
+                headers = dict((name.lower(), value) for name, value in message.get('headers', []))
+                content_type = headers.get(b'content-type', b'').decode('latin-1')
+                if message['status'] in (204, 206, 304) or b'content-encoding' in headers or not is_compressible(content_type):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if message['type'] != 'http.response.body' or passthrough:
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                if not more_body:
+                    # A complete body: small ones are not worth it, the rest is compressed in one go
+                    if len(body) < self.min_bytes:
+                        await send(_with_headers(start, vary=True))
+                        await send(message)
+                    else:
+                        if len(body) > COMPRESS_IN_THREAD_BYTES:
+                            body = await run_in_threadpool(compress, body, encoding)
+                        else:
+                            body = compress(body, encoding)
+                        await send(_with_headers(start, vary=True, encoding=encoding, length=len(body)))
+                        await send({'type': 'http.response.body', 'body': body})
+                    passthrough = True
+                    return
+                compressor = StreamCompressor(encoding)
+                await send(_with_headers(start, vary=True, encoding=encoding))
+            if len(body) > COMPRESS_IN_THREAD_BYTES:
+                data = await run_in_threadpool(compressor.compress, body)
+            else:
+                data = compressor.compress(body) if body else b''
+            if not more_body:
+                data += compressor.finish()
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+def _with_headers(start, vary=False, encoding=None, length=None):
+    """A copy of a response start message with Vary and, when compressing, Content-Encoding and the new Content-Length"""
+    headers = [(name, value) for name, value in start.get('headers', []) if not (encoding and name.lower() == b'content-length')]
+    if vary and not any(name.lower() == b'vary' for name, _ in headers):
+        headers.append((b'vary', b'Accept-Encoding'))
+    if encoding:
+        headers.append((b'content-encoding', encoding.encode('latin-1')))
+        if length is not None:
+            headers.append((b'content-length', str(length).encode('latin-1')))
+    return dict(start, headers=headers)
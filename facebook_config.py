@@ -1,15 +1,116 @@
-# Facebook App Configuration
-APP_ID = ""
-APP_SECRET = ""
-REDIRECT_URI = "http://localhost:8000/auth/callback"
-WEBHOOK_VERIFY_TOKEN = "crmsecret123"
-
-# JSON file names
-FACEBOOK_DATA_FILE = "facebook_data.json"
-USER_PROFILE_FILE = "user_profile.json"
-MESSAGES_DATA_FILE = "messages_data.json"
-
-# Storage
-user_data = {}
-participant_names = {}
-
+import os
+from facebook_state import create_state_store
+
+# Facebook App Configuration
+APP_ID = ""
+APP_SECRET = ""
+REDIRECT_URI = "http://localhost:8000/auth/callback"
+WEBHOOK_VERIFY_TOKEN = "crmsecret123"
+
+# Per-account storage: each account's JSON files live in ACCOUNTS_DIR/<account id>/
+ACCOUNTS_DIR = "accounts"
+ACCOUNTS_REGISTRY_FILE = "accounts.json"
+LEGACY_ACCOUNT_ID = "main_user"
+
+# JSON file names
+FACEBOOK_DATA_FILE = "facebook_data.json"
+USER_PROFILE_FILE = "user_profile.json"
+MESSAGES_DATA_FILE = "messages_data.json"
+SENT_MESSAGES_LOG_FILE = "sent_messages_log.jsonl"
+PARTICIPANT_DIRECTORY_FILE = "participant_directory.json"
+CHANGE_LOG_FILE = "changes.jsonl"
+SYNC_CHECKPOINT_FILE = "sync_checkpoint.jsonl"
+
+# Messaging window
+MESSAGE_WINDOW_HOURS = 24
+WINDOW_CLOSED_RECHECK_SECONDS = 300
+
+# Participant directory
+PARTICIPANT_CACHE_TTL_SECONDS = 7 * 24 * 3600
+PARTICIPANT_CACHE_MAX_ENTRIES = 10000
+PARTICIPANT_LOOKUP_BATCH_SIZE = 50
+
+# Token lifecycle: long-lived user tokens last about 60 days; refresh them a week early
+TOKENS_FILE = "tokens.json"
+TOKEN_REFRESH_MARGIN_SECONDS = 7 * 24 * 3600
+TOKEN_REFRESH_CHECK_SECONDS = 3600
+
+# Graph API base URL override, e.g. FB_GRAPH_BASE_URL=http://127.0.0.1:8765/v18.0 for the mock server
+GRAPH_BASE_URL = os.environ.get("FB_GRAPH_BASE_URL", "")
+
+# Graph retries: rate limits are retried for every request, transient errors only for GETs
+GRAPH_MAX_RETRIES = 3
+GRAPH_RETRY_BACKOFF_SECONDS = 1.0
+GRAPH_RATE_LIMIT_ERROR_CODES = (4, 17, 32, 613)
+GRAPH_TRANSIENT_ERROR_CODES = (1, 2)
+
+# Sync: conversations are paged through with cursors; the delay between conversations can be 0 against the mock
+SYNC_CONVERSATIONS_PAGE_SIZE = 100
+SYNC_CONVERSATION_DELAY_SECONDS = float(os.environ.get("FB_SYNC_CONVERSATION_DELAY_SECONDS", "1"))
+# A sync that stopped halfway resumes from its checkpoint unless the checkpoint is older than this
+SYNC_CHECKPOINT_MAX_AGE_SECONDS = int(os.environ.get("FB_SYNC_CHECKPOINT_MAX_AGE_SECONDS", 6 * 3600))
+
+# Graph response cache: per-endpoint TTLs (path regex, seconds); other GETs are revalidated with their ETag
+GRAPH_CACHE_TTLS = [
+    (r"^/me$", 3600),
+    (r"^/me/accounts$", 3600),
+    (r"^/\d+/conversations$", 300)
+]
+GRAPH_CACHE_UNCACHED_PATHS = [r"^/oauth/"]
+# Responses carrying page access tokens are kept in memory only, never written to the disk tier
+GRAPH_CACHE_MEMORY_ONLY_PATHS = [r"^/me/accounts$"]
+GRAPH_CACHE_MAX_ENTRIES = 2000
+GRAPH_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Optional disk tier, e.g. FB_GRAPH_CACHE_DIR=graph_cache; disabled when empty
+GRAPH_CACHE_DIR = os.environ.get("FB_GRAPH_CACHE_DIR", "")
+GRAPH_CACHE_DISK_MAX_ENTRIES = 20000
+
+# Logging: FB_LOG_LEVEL=DEBUG brings back per-conversation detail; FB_LOG_JSON=1 for JSON lines;
+# FB_LOG_FILE keeps log output off the terminal UI
+LOG_LEVEL = os.environ.get("FB_LOG_LEVEL", "INFO")
+LOG_JSON = os.environ.get("FB_LOG_JSON", "") not in ("", "0", "false")
+LOG_FILE = os.environ.get("FB_LOG_FILE", "")
+LOG_SAMPLE_EVERY = int(os.environ.get("FB_LOG_SAMPLE_EVERY", "100"))
+
+# Tracing (opt-in with FB_TRACING=1): span timelines of each sync, written as Chrome trace files to TRACE_DIR
+TRACING_ENABLED = os.environ.get("FB_TRACING", "") not in ("", "0", "false")
+TRACE_DIR = os.environ.get("FB_TRACE_DIR", "traces")
+TRACE_HISTORY = 20
+TRACE_MAX_SPANS = 500000
+
+# Attachment cache: message attachments downloaded during sync into a content-addressed store under
+# ATTACHMENTS_DIR, least recently used blobs evicted once it grows past ATTACHMENT_CACHE_MAX_BYTES
+ATTACHMENTS_DIR = os.environ.get("FB_ATTACHMENTS_DIR", "attachments")
+ATTACHMENT_CACHE_MAX_BYTES = int(os.environ.get("FB_ATTACHMENT_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+ATTACHMENT_MAX_FILE_BYTES = 100 * 1024 * 1024
+ATTACHMENT_DOWNLOAD_WORKERS = int(os.environ.get("FB_ATTACHMENT_DOWNLOAD_WORKERS", 4))
+# With a reverse proxy in front (e.g. an nginx internal location aliased to ATTACHMENTS_DIR/blobs),
+# attachment responses hand the file to the proxy via X-Accel-Redirect so it is sent with sendfile
+ATTACHMENT_ACCEL_REDIRECT_PREFIX = os.environ.get("FB_ATTACHMENT_ACCEL_REDIRECT_PREFIX", "")
+
+# Live event stream (/facebook/stream): events buffered per client before the oldest are dropped,
+# keepalive comment interval, and how often a running sync reports progress
+EVENT_STREAM_BUFFER_SIZE = 1000
+EVENT_STREAM_HEARTBEAT_SECONDS = 15
+SYNC_PROGRESS_EVENT_SECONDS = 1.0
+
+# Change feed (/facebook/changes): changes kept per account before clients that fell further behind must reset
+CHANGE_LOG_RETENTION = int(os.environ.get("FB_CHANGE_LOG_RETENTION", 50000))
+
+# Encoded JSON bodies of message and participant views, reused until the view changes
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("FB_RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Response compression (gzip, and br/zstd when brotli/zstandard are installed), negotiated per request:
+# bodies under COMPRESSION_MIN_BYTES are sent as they are; cached views are compressed once at the higher levels
+COMPRESSION_MIN_BYTES = int(os.environ.get("FB_COMPRESSION_MIN_BYTES", 1024))
+COMPRESSION_LEVELS = {'gzip': 6, 'br': 5, 'zstd': 3}
+COMPRESSION_CACHED_LEVELS = {'gzip': 9, 'br': 9, 'zstd': 12}
+
+# Storage backend: "memory" (single process) or "sqlite" (shared between workers, e.g.
+# FB_STATE_BACKEND=sqlite uvicorn facebook_api_endpoints:app --workers 4)
+STATE_BACKEND = os.environ.get("FB_STATE_BACKEND", "memory")
+STATE_DB_FILE = os.environ.get("FB_STATE_DB_FILE", "facebook_state.db")
+
+# Storage
+user_data = create_state_store(STATE_BACKEND, STATE_DB_FILE)
+
@@ -1,109 +1,430 @@
-import json
-import os
-from datetime import datetime
-from facebook_config import FACEBOOK_DATA_FILE, USER_PROFILE_FILE, MESSAGES_DATA_FILE
-
-def save_facebook_data(data):
-    """Save Facebook data to JSON file"""
-    try:
-        facebook_data = {
-            "last_updated": datetime.now().isoformat(),
-            "pages": data.get("facebook_pages", []),
-            "conversations": data.get("facebook_conversations", []),
-            "messages": data.get("facebook_messages", {}),
-            "participant_names": data.get("participant_names", {}),
-            "statistics": {
-                "total_conversations": len(data.get("facebook_conversations", [])),
-                "total_messages": sum(len(msgs) for msgs in data.get("facebook_messages", {}).values()),
-                "total_participants": len(data.get("participant_names", {}))
-            }
-        }
-        
-        with open(FACEBOOK_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(facebook_data, f, indent=2, ensure_ascii=False)
-        print(f"✅ Facebook data saved to {FACEBOOK_DATA_FILE}")
-        return True
-    except Exception as e:
-        print(f"❌ Failed to save Facebook data: {e}")
-        return False
-
-def save_messages_data(data):
-    """Save detailed messages data to separate JSON file"""
-    try:
-        messages_data = {
-            "last_updated": datetime.now().isoformat(),
-            "total_conversations": len(data.get("facebook_messages", {})),
-            "total_messages": sum(len(msgs) for msgs in data.get("facebook_messages", {}).values()),
-            "messages_by_conversation": data.get("facebook_messages", {}),
-            "participant_names": data.get("participant_names", {}),
-            "note": "Names come from conversation participant data, emails not available due to Facebook privacy"
-        }
-        
-        with open(MESSAGES_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(messages_data, f, indent=2, ensure_ascii=False)
-        print(f"✅ Messages data saved to {MESSAGES_DATA_FILE}")
-        return True
-    except Exception as e:
-        print(f"❌ Failed to save messages data: {e}")
-        return False
-
-def save_user_profile(profile):
-    """Save user profile to JSON file"""
-    try:
-        profile_data = {
-            "last_updated": datetime.now().isoformat(),
-            "profile": profile
-        }
-        
-        with open(USER_PROFILE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(profile_data, f, indent=2, ensure_ascii=False)
-        print(f"✅ User profile saved to {USER_PROFILE_FILE}")
-        return True
-    except Exception as e:
-        print(f"❌ Failed to save user profile: {e}")
-        return False
-
-def load_facebook_data():
-    """Load Facebook data from JSON file"""
-    try:
-        if os.path.exists(FACEBOOK_DATA_FILE):
-            with open(FACEBOOK_DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data
-        return None
-    except Exception as e:
-        print(f"❌ Failed to load Facebook data: {e}")
-        return None
-
-def load_user_profile():
-    """Load user profile from JSON file"""
-    try:
-        if os.path.exists(USER_PROFILE_FILE):
-            with open(USER_PROFILE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data.get('profile', {})
-        return {}
-    except Exception as e:
-        print(f"❌ Failed to load user profile: {e}")
-        return {}
-
-def load_all_data():
-    """Load all data from JSON files on startup"""
-    from facebook_config import user_data, participant_names
-    
-    facebook_data = load_facebook_data()
-    profile_data = load_user_profile()
-    
-    if facebook_data or profile_data:
-        user_data['main_user'] = {
-            'profile': profile_data,
-            'facebook_pages': facebook_data.get('pages', []) if facebook_data else [],
-            'facebook_conversations': facebook_data.get('conversations', []) if facebook_data else [],
-            'facebook_messages': facebook_data.get('messages', {}) if facebook_data else {},
-            'participant_names': facebook_data.get('participant_names', {}) if facebook_data else {}
-        }
-        
-        # Update global participant_names
-        participant_names.update(facebook_data.get('participant_names', {}) if facebook_data else {})
-        return True
-    return False
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from facebook_config import FACEBOOK_DATA_FILE, USER_PROFILE_FILE, MESSAGES_DATA_FILE, SENT_MESSAGES_LOG_FILE, PARTICIPANT_DIRECTORY_FILE
+from facebook_state import locked_file
+from facebook_accounts import account_file, account_dir, account_id_for, account_registry
+from facebook_metrics import persistence_write_seconds, persistence_write_bytes
+from facebook_tracing import tracer
+from facebook_window_cache import window_cache, parse_graph_time
+
+# Steps reported by load_all_data, in order
+LOAD_STEPS = ['accounts', 'facebook_data', 'user_profile', 'sent_messages_log', 'participant_directory']
+
+def count_messages(account):
+    """Total number of stored messages of an account"""
+    return sum(len(msgs) for msgs in account.get('facebook_messages', {}).values())
+
+def conversation_participants(conv):
+    """The people in a conversation besides the page, as [{'id', 'name'}]"""
+    participants = conv.get('participants')
+    if participants is None:
+        # Stored before conversations kept their participant list
+        participants = [{'id': conv.get('participant_id'), 'name': conv.get('participant_name')}]
+    return participants
+
+def conversation_title(conv):
+    """Display name of a conversation: its participant, or every participant of a group thread"""
+    return ", ".join(participant.get('name') or 'Unknown User' for participant in conversation_participants(conv))
+
+def merge_conversation_entries(conversations):
+    """Fold repeated entries of a conversation into one with every participant
+
+    Syncs used to store a group thread once per participant; those stores and checkpoints load as one
+    entry per conversation, the first entry's fields kept.
+    """
+    merged = {}
+    for conv in conversations:
+        existing = merged.get(conv['conversation_id'])
+        if existing is None:
+            merged[conv['conversation_id']] = dict(conv, participants=list(conversation_participants(conv)))
+            continue
+        known_ids = {participant['id'] for participant in existing['participants']}
+        existing['participants'].extend(p for p in conversation_participants(conv) if p['id'] not in known_ids)
+    return list(merged.values())
+
+def choose_recipient(conv, messages, recipient_id=None):
+    """The participant a message to the conversation goes to, or None when recipient_id is not one of them
+
+    The Send API delivers to one person, so a group thread is answered to whoever wrote to the page
+    last, unless the caller names a participant.
+    """
+    participants = conversation_participants(conv)
+    if recipient_id:
+        return next((p for p in participants if p['id'] == recipient_id), None)
+    if len(participants) > 1:
+        by_id = {participant['id']: participant for participant in participants}
+        # Stored newest first
+        for message in messages:
+            participant = by_id.get(message.get('sender', {}).get('id'))
+            if participant is not None:
+                return participant
+    return participants[0]
+
+def _write_json(path, data, indent=2):
+    """Write a JSON file under its lock and return the number of bytes written"""
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with locked_file(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+    size = os.path.getsize(path)
+    finished = time.perf_counter()
+    persistence_write_seconds.observe(finished - started, file=os.path.basename(path))
+    tracer.record(f"write {os.path.basename(path)}", 'persistence', started, finished, bytes=size)
+    persistence_write_bytes.observe(size, file=os.path.basename(path))
+    return size
+
+def save_facebook_data(data):
+    """Save Facebook data to the account's JSON file"""
+    account_id = account_id_for(data)
+    path = account_file(account_id, FACEBOOK_DATA_FILE)
+    try:
+        facebook_data = {
+            "last_updated": datetime.now().isoformat(),
+            "pages": data.get("facebook_pages", []),
+            "conversations": data.get("facebook_conversations", []),
+            "messages": data.get("facebook_messages", {}),
+            "participant_names": data.get("participant_names", {}),
+            "statistics": {
+                "total_conversations": len(data.get("facebook_conversations", [])),
+                "total_messages": count_messages(data),
+                "total_participants": len(data.get("participant_names", {}))
+            }
+        }
+        
+        size = _write_json(path, facebook_data)
+        account_registry.record_usage(account_id, facebook_data['statistics'], size)
+        print(f"✅ Facebook data saved to {path}")
+        
+        # Logged messages the snapshot contains are no longer needed; ones stored after it was taken stay
+        clear_sent_messages_log(account_id, data)
+        return True
+    except Exception as e:
+        print(f"❌ Failed to save Facebook data: {e}")
+        return False
+
+def save_messages_data(data):
+    """Save detailed messages data to the account's separate JSON file"""
+    path = account_file(account_id_for(data), MESSAGES_DATA_FILE)
+    try:
+        messages_data = {
+            "last_updated": datetime.now().isoformat(),
+            "total_conversations": len(data.get("facebook_messages", {})),
+            "total_messages": count_messages(data),
+            "messages_by_conversation": data.get("facebook_messages", {}),
+            "participant_names": data.get("participant_names", {}),
+            "note": "Names come from conversation participant data, emails not available due to Facebook privacy"
+        }
+        
+        _write_json(path, messages_data)
+        print(f"✅ Messages data saved to {path}")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to save messages data: {e}")
+        return False
+
+def save_user_profile(profile):
+    """Save user profile to the account's JSON file"""
+    path = account_file(account_id_for({'profile': profile}), USER_PROFILE_FILE)
+    try:
+        profile_data = {
+            "last_updated": datetime.now().isoformat(),
+            "profile": profile
+        }
+        
+        _write_json(path, profile_data)
+        print(f"✅ User profile saved to {path}")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to save user profile: {e}")
+        return False
+
+def append_sent_message(account_id, conversation_id, message):
+    """Append a sent (or webhook-delivered) message to the account's sent messages log (one JSON object per line)"""
+    path = account_file(account_id, SENT_MESSAGES_LOG_FILE)
+    try:
+        started = time.perf_counter()
+        line = json.dumps({"conversation_id": conversation_id, "message": message}, ensure_ascii=False) + "\n"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with locked_file(path):
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        persistence_write_seconds.observe(time.perf_counter() - started, file=SENT_MESSAGES_LOG_FILE)
+        persistence_write_bytes.observe(len(line.encode('utf-8')), file=SENT_MESSAGES_LOG_FILE)
+        return True
+    except Exception as e:
+        print(f"❌ Failed to append sent message: {e}")
+        return False
+
+def load_sent_messages_log(account_id):
+    """Load the account's sent and webhook-delivered messages logged since the last full save"""
+    path = account_file(account_id, SENT_MESSAGES_LOG_FILE)
+    entries = []
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A crash mid-append can leave a partial last line
+                        print("⚠️ Skipping unreadable line in sent messages log")
+        return entries
+    except Exception as e:
+        print(f"❌ Failed to load sent messages log: {e}")
+        return entries
+
+def clear_sent_messages_log(account_id, saved_data):
+    """Drop the entries of the account's sent messages log whose message a full save of saved_data captured
+
+    A message sent or received after saved_data was taken is not in it, so its entry is kept.
+    """
+    path = account_file(account_id, SENT_MESSAGES_LOG_FILE)
+    messages_by_conversation = saved_data.get('facebook_messages', {})
+    saved_ids = {}
+    try:
+        with locked_file(path):
+            if not os.path.exists(path):
+                return True
+            kept = []
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    conv_id = entry['conversation_id']
+                    if conv_id not in saved_ids:
+                        saved_ids[conv_id] = {m.get('message_id') for m in messages_by_conversation.get(conv_id, [])}
+                    if entry['message'].get('message_id') not in saved_ids[conv_id]:
+                        kept.append(line if line.endswith("\n") else line + "\n")
+            if not kept:
+                os.remove(path)
+                return True
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(kept)
+            os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"❌ Failed to clear sent messages log: {e}")
+        return False
+
+def add_message_to_store(user_info, conversation_id, message):
+    """Insert a message into the in-memory store (newest first, like Graph) and bump counts"""
+    messages = user_info.setdefault('facebook_messages', {}).setdefault(conversation_id, [])
+    messages.insert(0, message)
+    for conv in user_info.get('facebook_conversations', []):
+        if conv['conversation_id'] == conversation_id:
+            conv['message_count'] = conv.get('message_count', 0) + 1
+            break
+
+def record_sent_message(account_id, conversation, message_id, message_text):
+    """Record a successfully sent message in the account's store and sent messages log"""
+    from facebook_config import user_data
+    
+    message = {
+        'message_id': message_id,
+        'message_text': message_text,
+        'created_time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+0000'),
+        'sender': {
+            'id': conversation['page_id'],
+            'name': conversation['page_name'],
+            'email': 'Not available (Facebook privacy policy)'
+        },
+        'attachments': [],
+        'attachment_count': 0,
+        'retrieved_at': datetime.now().isoformat()
+    }
+    
+    user_data.mutate(account_id, lambda account: add_message_to_store(account, conversation['conversation_id'], message),
+                     conversation_ids=[conversation['conversation_id']])
+    append_sent_message(account_id, conversation['conversation_id'], message)
+    return message
+
+def replace_account_data(account_id, new_data, since):
+    """Replace an account's store with a sync's data, keeping the messages stored since the sync started
+
+    Messages sent or received while the sync ran (retrieved_at at or after since) may be missing from
+    its data; they are carried over in the same store write, so none is lost by the swap.
+    """
+    from facebook_config import user_data
+
+    def replace(account):
+        carried = {}
+        for conv_id, messages in account.get('facebook_messages', {}).items():
+            recent = [m for m in messages if m.get('retrieved_at', '') >= since]
+            if recent:
+                carried[conv_id] = recent
+        account.clear()
+        account.update(new_data)
+        # Copied where messages are added, so new_data itself is left as the sync built it
+        account['facebook_messages'] = dict(new_data.get('facebook_messages', {}))
+        account['facebook_conversations'] = [dict(conv) for conv in new_data.get('facebook_conversations', [])]
+        for conv_id, messages in carried.items():
+            synced_ids = {m.get('message_id') for m in account['facebook_messages'].get(conv_id, [])}
+            account['facebook_messages'][conv_id] = list(account['facebook_messages'].get(conv_id, []))
+            # Newest first in the store, so add the oldest first
+            for message in reversed(messages):
+                if message.get('message_id') not in synced_ids:
+                    add_message_to_store(account, conv_id, message)
+        return True
+
+    if not user_data.mutate(account_id, replace):
+        user_data[account_id] = new_data
+
+def record_received_message(account_id, conversation, message):
+    """Record a message delivered by the webhook like a sent one; False when it is already stored
+
+    Facebook retries webhook deliveries, so a message ID the conversation already has is skipped.
+    """
+    from facebook_config import user_data
+
+    conversation_id = conversation['conversation_id']
+
+    def store(account):
+        if any(m.get('message_id') == message['message_id'] for m in account.get('facebook_messages', {}).get(conversation_id, [])):
+            return False
+        add_message_to_store(account, conversation_id, message)
+        return True
+
+    if not user_data.mutate(account_id, store, conversation_ids=[conversation_id]):
+        return False
+    # Logged with the sent messages, so the message survives a restart until the next full save
+    append_sent_message(account_id, conversation_id, message)
+    return True
+
+def load_facebook_data(account_id):
+    """Load the account's Facebook data from its JSON file"""
+    path = account_file(account_id, FACEBOOK_DATA_FILE)
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            account_registry.record_usage(account_id, data.get('statistics', {}), os.path.getsize(path))
+            return data
+        return None
+    except Exception as e:
+        print(f"❌ Failed to load Facebook data: {e}")
+        return None
+
+def load_user_profile(account_id):
+    """Load the account's user profile from its JSON file"""
+    path = account_file(account_id, USER_PROFILE_FILE)
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data.get('profile', {})
+        return {}
+    except Exception as e:
+        print(f"❌ Failed to load user profile: {e}")
+        return {}
+
+def migrate_legacy_files():
+    """Move single-account JSON files from before per-account storage into their account directory"""
+    legacy_files = [FACEBOOK_DATA_FILE, USER_PROFILE_FILE, MESSAGES_DATA_FILE, SENT_MESSAGES_LOG_FILE, PARTICIPANT_DIRECTORY_FILE]
+    if not any(os.path.exists(filename) for filename in legacy_files):
+        return None
+    
+    profile = {}
+    if os.path.exists(USER_PROFILE_FILE):
+        try:
+            with open(USER_PROFILE_FILE, 'r', encoding='utf-8') as f:
+                profile = json.load(f).get('profile', {})
+        except Exception as e:
+            print(f"⚠️ Could not read legacy user profile: {e}")
+    
+    account_id = account_id_for({'profile': profile})
+    os.makedirs(account_dir(account_id), exist_ok=True)
+    page_ids = []
+    for filename in legacy_files:
+        target = account_file(account_id, filename)
+        if os.path.exists(filename) and not os.path.exists(target):
+            shutil.move(filename, target)
+    
+    try:
+        with open(account_file(account_id, FACEBOOK_DATA_FILE), 'r', encoding='utf-8') as f:
+            page_ids = [page['id'] for page in json.load(f).get('pages', [])]
+    except Exception:
+        pass
+    
+    account_registry.register(account_id, profile, page_ids, make_default=account_registry.default_account_id is None)
+    print(f"✅ Moved legacy data files into {account_dir(account_id)}")
+    return account_id
+
+def load_account(account_id, progress=None):
+    """Load one account from its JSON files into user_data, reporting each finished step to progress"""
+    from facebook_config import user_data
+    from facebook_participants import get_participant_directory
+    from facebook_tokens import token_manager
+
+    def report(step):
+        if progress:
+            progress(step)
+    
+    facebook_data = load_facebook_data(account_id)
+    report('facebook_data')
+    profile_data = load_user_profile(account_id)
+    report('user_profile')
+    
+    if facebook_data or profile_data:
+        account = {
+            'profile': profile_data,
+            'facebook_pages': facebook_data.get('pages', []) if facebook_data else [],
+            'facebook_conversations': merge_conversation_entries(facebook_data.get('conversations', [])) if facebook_data else [],
+            'facebook_messages': facebook_data.get('messages', {}) if facebook_data else {},
+            'participant_names': facebook_data.get('participant_names', {}) if facebook_data else {}
+        }
+        
+        # Replay messages sent since the last full save, skipping any the snapshot already has
+        messages_by_conversation = account['facebook_messages']
+        snapshot_ids = {}
+        for entry in load_sent_messages_log(account_id):
+            conv_id = entry['conversation_id']
+            if conv_id not in snapshot_ids:
+                snapshot_ids[conv_id] = {m.get('message_id') for m in messages_by_conversation.get(conv_id, [])}
+            if entry['message'].get('message_id') not in snapshot_ids[conv_id]:
+                add_message_to_store(account, conv_id, entry['message'])
+        report('sent_messages_log')
+        
+        # Update the account's participant directory
+        get_participant_directory(account_id).update(account['participant_names'])
+        report('participant_directory')
+        
+        # Schedule the open reply windows from each conversation's newest inbound message
+        for conv in account['facebook_conversations']:
+            for message in messages_by_conversation.get(conv['conversation_id'], []):
+                if message.get('sender', {}).get('id') != conv.get('page_id') and message.get('created_time'):
+                    window_cache.record_last_message(conv['conversation_id'], parse_graph_time(message['created_time']), account_id)
+                    break
+        
+        # Publish the account only once it is complete, so readers never see a half-loaded store
+        user_data[account_id] = account
+        token_manager.load(account_id)
+        return True
+    
+    report('sent_messages_log')
+    report('participant_directory')
+    return False
+
+def load_all_data(progress=None):
+    """Load accounts on startup: the default account right away, the others on first access"""
+    migrate_legacy_files()
+    account_registry.load()
+    if progress:
+        progress('accounts')
+    
+    default_account_id = account_registry.resolve()
+    if default_account_id is None:
+        for step in LOAD_STEPS[1:]:
+            if progress:
+                progress(step)
+        return False
+    return load_account(default_account_id, progress)
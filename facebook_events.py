@@ -0,0 +1,132 @@
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from facebook_config import EVENT_STREAM_BUFFER_SIZE
+
+# Event types published on the bus
+EVENT_TYPES = ('message', 'sent', 'window', 'sync')
+
+class Subscription:
+    """One client's filtered, bounded event buffer
+
+    When the client reads slower than events arrive, the oldest buffered events are dropped and
+    counted, so a stalled client costs at most buffer_size events and is told how many it missed.
+    """
+
+    def __init__(self, types=None, account_id=None, conversation_id=None, page_id=None, buffer_size=EVENT_STREAM_BUFFER_SIZE, loop=None):
+        self.types = set(types) if types else None
+        self.account_id = account_id
+        self.conversation_id = conversation_id
+        self.page_id = page_id
+        self.buffer_size = buffer_size
+        self.dropped = 0
+        self.delivered = 0
+        self._events = deque()
+        self._condition = threading.Condition()
+        # Async readers are woken through their event loop; threads wait on the condition
+        self._loop = loop
+        self._ready = asyncio.Event() if loop is not None else None
+
+    def matches(self, event):
+        return (
+            (self.types is None or event['type'] in self.types)
+            and (self.account_id is None or event['account_id'] == self.account_id)
+            and (self.conversation_id is None or event['conversation_id'] == self.conversation_id)
+            and (self.page_id is None or event['page_id'] == self.page_id)
+        )
+
+    def put(self, event):
+        with self._condition:
+            if len(self._events) >= self.buffer_size:
+                self._events.popleft()
+                self.dropped += 1
+            self._events.append(event)
+            self._condition.notify()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:  # the client's loop has closed
+                pass
+
+    def drain(self):
+        """Take every buffered event plus the number dropped since the last drain"""
+        with self._condition:
+            events = list(self._events)
+            self._events.clear()
+            dropped, self.dropped = self.dropped, 0
+            self.delivered += len(events)
+        if self._ready is not None:
+            self._ready.clear()
+        return events, dropped
+
+    def wait(self, timeout=None):
+        """Block the calling thread until an event is buffered or timeout passes, then drain"""
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+        return self.drain()
+
+    async def wait_async(self, timeout=None):
+        """Await an event or the timeout on the subscription's loop, then drain"""
+        if not self._events:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.drain()
+
+class EventBus:
+    """In-process fan-out of store changes to live subscribers; publishing with no subscribers costs one check"""
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def subscribe(self, **filters):
+        subscription = Subscription(**filters)
+        with self._lock:
+            self._subscribers = self._subscribers + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscription]
+
+    def publish(self, event_type, data, account_id=None, conversation_id=None, page_id=None):
+        # The list is replaced, never mutated, so it can be read without the lock
+        subscribers = self._subscribers
+        if not subscribers:
+            return None
+        event = {
+            'id': next(self._ids),
+            'type': event_type,
+            'ts': datetime.now(timezone.utc).isoformat(),
+            'account_id': account_id,
+            'conversation_id': conversation_id,
+            'page_id': page_id,
+            'data': data
+        }
+        self.published += 1
+        for subscription in subscribers:
+            if subscription.matches(event):
+                subscription.put(event)
+        return event
+
+    def snapshot(self):
+        subscribers = self._subscribers
+        return {
+            "subscribers": len(subscribers),
+            "published": self.published,
+            "buffered": sum(len(s._events) for s in subscribers)
+        }
+
+def format_sse(event):
+    """One event in the text/event-stream wire format"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+event_bus = EventBus()
@@ -0,0 +1,207 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from facebook_window_cache import parse_graph_time
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # Arrow output is optional; the other formats have no dependencies
+    pyarrow = None
+
+# Columns of every export row, in output order
+EXPORT_COLUMNS = [
+    'account_id', 'page_id', 'page_name', 'conversation_id', 'participant_id', 'participant_name', 'message_id',
+    'created_time', 'direction', 'sender_id', 'sender_name', 'message_text', 'attachment_count'
+]
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'columnar': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+# Output is flushed in chunks of about this size; the first row always goes out on its own
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Rows per record batch in the columnar and Arrow formats
+EXPORT_BATCH_ROWS = 5000
+
+def parse_export_time(value):
+    """Parse a since/until filter: epoch seconds, a date or an ISO datetime (UTC unless it has an offset)"""
+    if value is None or value == '':
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), timezone.utc)
+    except (OverflowError, OSError) as e:
+        # inf, 1e30 and the like parse as floats but are no timestamp
+        raise ValueError(f"Time {value} is out of range") from e
+    except ValueError:
+        pass
+    parsed = parse_graph_time(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def iter_export_rows(account_id, account, since=None, until=None, page_id=None, conversation_id=None):
+    """Flat message rows of one account, conversation by conversation, without building the whole export"""
+    messages_by_conversation = account.get('facebook_messages', {})
+    for conv in list(account.get('facebook_conversations', [])):
+        if page_id and conv.get('page_id') != page_id:
+            continue
+        if conversation_id and conv['conversation_id'] != conversation_id:
+            continue
+        # Copy one conversation at a time, so a message stored meanwhile cannot shift the iteration
+        for message in list(messages_by_conversation.get(conv['conversation_id'], [])):
+            created_time = message.get('created_time')
+            if since or until:
+                if not created_time:
+                    continue
+                created = parse_graph_time(created_time)
+                if (since and created < since) or (until and created >= until):
+                    continue
+            sender = message.get('sender', {})
+            yield {
+                'account_id': account_id,
+                'page_id': conv.get('page_id'),
+                'page_name': conv.get('page_name'),
+                'conversation_id': conv['conversation_id'],
+                'participant_id': conv.get('participant_id'),
+                'participant_name': conv.get('participant_name'),
+                'message_id': message.get('message_id'),
+                'created_time': created_time,
+                'direction': 'outbound' if sender.get('id') == conv.get('page_id') else 'inbound',
+                'sender_id': sender.get('id'),
+                'sender_name': sender.get('name'),
+                'message_text': message.get('message_text'),
+                'attachment_count': message.get('attachment_count', 0)
+            }
+
+def _chunked(pieces, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """Join small string pieces into chunks of about chunk_bytes, sending the first piece right away"""
+    buffer, size, first = [], 0, True
+    for piece in pieces:
+        if first:
+            yield piece
+            first = False
+            continue
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_bytes:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def _ndjson_pieces(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+def _csv_pieces(rows):
+    line = io.StringIO()
+    writer = csv.DictWriter(line, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+    if line.getvalue():
+        yield line.getvalue()
+
+def _batches(rows, batch_rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _columnar_pieces(rows, batch_rows):
+    """Record batches as NDJSON lines of column arrays, e.g. for pandas.DataFrame(line['columns'])"""
+    yield json.dumps({"schema": EXPORT_COLUMNS}) + '\n'
+    for batch in _batches(rows, batch_rows):
+        columns = {column: [row[column] for row in batch] for column in EXPORT_COLUMNS}
+        yield json.dumps({"rows": len(batch), "columns": columns}, ensure_ascii=False) + '\n'
+
+def _arrow_chunks(rows, batch_rows):
+    """Arrow IPC stream, one record batch at a time (readable with pyarrow.ipc.open_stream, polars, DuckDB)"""
+    schema = pyarrow.schema([
+        (column, pyarrow.int64() if column == 'attachment_count' else pyarrow.string()) for column in EXPORT_COLUMNS
+    ])
+    sink = io.BytesIO()
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    yield drain()
+    for batch in _batches(rows, batch_rows):
+        writer.write_batch(pyarrow.RecordBatch.from_pydict({column: [row[column] for row in batch] for column in EXPORT_COLUMNS}, schema=schema))
+        yield drain()
+    writer.close()
+    yield drain()
+
+def export_chunks(rows, export_format='ndjson', batch_rows=EXPORT_BATCH_ROWS):
+    """Encode rows lazily in one of EXPORT_FORMATS; yields str chunks (bytes for arrow)"""
+    if export_format == 'ndjson':
+        return _chunked(_ndjson_pieces(rows))
+    if export_format == 'csv':
+        return _chunked(_csv_pieces(rows))
+    if export_format == 'columnar':
+        return _chunked(_columnar_pieces(rows, batch_rows))
+    if export_format == 'arrow':
+        if pyarrow is None:
+            raise ValueError("The arrow format needs pyarrow (pip install pyarrow); use columnar instead")
+        return _arrow_chunks(rows, batch_rows)
+    raise ValueError(f"Unknown export format {export_format}, expected one of {', '.join(EXPORT_FORMATS)}")
+
+def export_filename(account_id, export_format):
+    extension = {'ndjson': 'ndjson', 'csv': 'csv', 'columnar': 'columnar.ndjson', 'arrow': 'arrows'}[export_format]
+    return f"messages-{account_id}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from contextlib import redirect_stdout
+    from facebook_config import user_data
+    from facebook_accounts import account_registry
+    from facebook_data_handlers import load_all_data, load_account
+
+    parser = argparse.ArgumentParser(description="Stream an account's stored messages as NDJSON, CSV or columnar batches")
+    parser.add_argument("--account-id", help="defaults to the last logged in account")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--since", help="only messages at or after this time (ISO date/datetime or epoch seconds)")
+    parser.add_argument("--until", help="only messages before this time")
+    parser.add_argument("--page-id")
+    parser.add_argument("--conversation-id")
+    parser.add_argument("--output", help="file to write; defaults to stdout")
+    args = parser.parse_args()
+
+    # Loading reports progress with print, which must not end up in an export written to stdout
+    with redirect_stdout(sys.stderr):
+        load_all_data()
+        account_id = account_registry.resolve(args.account_id)
+        loaded = account_id is not None and (account_id in user_data or load_account(account_id))
+    if not loaded:
+        sys.exit(f"❌ No stored data for account {args.account_id or '(default)'}")
+    try:
+        rows = iter_export_rows(account_id, user_data[account_id], parse_export_time(args.since), parse_export_time(args.until), args.page_id, args.conversation_id)
+        chunks = export_chunks(rows, args.format)
+    except ValueError as e:
+        sys.exit(f"❌ {e}")
+
+    if args.format == 'arrow':
+        out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    else:
+        out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
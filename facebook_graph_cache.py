@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from facebook_config import GRAPH_CACHE_TTLS, GRAPH_CACHE_UNCACHED_PATHS, GRAPH_CACHE_MAX_ENTRIES, GRAPH_CACHE_MAX_BYTES, GRAPH_CACHE_DIR, GRAPH_CACHE_DISK_MAX_ENTRIES, GRAPH_CACHE_MEMORY_ONLY_PATHS
+from facebook_metrics import graph_cache_events_total
+
+class CachedGraphResponse:
+    """Stand-in for a requests response, built from a cached Graph body"""
+
+    def __init__(self, entry, revalidated=False):
+        self.status_code = 200
+        self.text = entry['body']
+        self.headers = {'ETag': entry['etag']} if entry.get('etag') else {}
+        self.from_cache = True
+        self.revalidated = revalidated
+
+    def json(self):
+        return json.loads(self.text)
+
+class GraphResponseCache:
+    """Graph GET response cache with per-endpoint TTLs, ETag revalidation, a bounded memory tier and an optional disk tier"""
+
+    def __init__(self, ttls=GRAPH_CACHE_TTLS, uncached_paths=GRAPH_CACHE_UNCACHED_PATHS, max_entries=GRAPH_CACHE_MAX_ENTRIES,
+                 max_bytes=GRAPH_CACHE_MAX_BYTES, disk_dir=GRAPH_CACHE_DIR, disk_max_entries=GRAPH_CACHE_DISK_MAX_ENTRIES,
+                 memory_only_paths=GRAPH_CACHE_MEMORY_ONLY_PATHS):
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.uncached_paths = [re.compile(pattern) for pattern in uncached_paths]
+        self.memory_only_paths = [re.compile(pattern) for pattern in memory_only_paths]
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_writes = 0
+        self._lock = threading.RLock()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    # ---- keys and policy ----
+
+    def ttl_for(self, path):
+        """Seconds a response may be served without asking Graph, or None if the path is never cached"""
+        if any(pattern.search(path) for pattern in self.uncached_paths):
+            return None
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        # Anything else is still revalidated with its ETag instead of downloaded again
+        return 0
+
+    def on_disk(self, path):
+        """Whether responses for a path may be written to the disk tier"""
+        return not any(pattern.search(path) for pattern in self.memory_only_paths)
+
+    @staticmethod
+    def make_key(url, params, principal):
+        """Cache key from the URL and params, with the access token replaced by whose token it was"""
+        query = sorted((k, str(v)) for k, v in (params or {}).items() if k != 'access_token')
+        return f"{url}?{json.dumps(query)}#{principal}"
+
+    # ---- lookups ----
+
+    def get(self, key):
+        """Return the cached entry for a key from memory or disk, fresh or not"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = self._read_disk(key)
+        if entry is not None:
+            with self._lock:
+                self._put(key, entry)
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() < entry['expires_at']
+
+    def _count(self, event):
+        # Called under the lock; the counter is what Prometheus rates, stats what snapshot reports
+        self.stats[event] += 1
+        graph_cache_events_total.inc(event=event)
+
+    def record_hit(self):
+        with self._lock:
+            self._count('hits')
+
+    def record_miss(self):
+        with self._lock:
+            self._count('misses')
+
+    # ---- updates ----
+
+    def store(self, key, ttl, etag, body, on_disk=True):
+        """Cache a 200 response; responses without an ETag are only worth keeping for their TTL"""
+        if not etag and not ttl:
+            return
+        entry = {'etag': etag, 'body': body, 'stored_at': time.time(), 'expires_at': time.time() + ttl}
+        with self._lock:
+            self._put(key, entry)
+            self._count('stores')
+        if on_disk:
+            self._write_disk(key, entry)
+
+    def revalidated(self, key, entry, ttl, on_disk=True):
+        """Extend an entry after Graph answered 304 Not Modified"""
+        with self._lock:
+            entry['expires_at'] = time.time() + ttl
+            self._count('revalidated')
+        if on_disk:
+            self._write_disk(key, entry)
+
+    def invalidate_principal(self, principal):
+        """Drop every entry fetched with one account's or page's token"""
+        suffix = f"#{principal}"
+        with self._lock:
+            for key in [k for k in self._entries if k.endswith(suffix)]:
+                self._remove(key)
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return
+        # Rare (an invalid token), so scanning the disk tier for evicted entries is affordable
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    if json.load(f).get('key', '').endswith(suffix):
+                        os.remove(path)
+            except (OSError, ValueError):
+                continue
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove_disk(key)
+            self._entries.clear()
+            self._bytes = 0
+
+    def _put(self, key, entry):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += len(entry['body'])
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            # The disk tier, if enabled, still holds evicted entries
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._count('evictions')
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry['body'])
+
+    # ---- disk tier ----
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # Hash collisions are practically impossible, but a stale file from another key must never be served
+                if data.get('key') == key:
+                    return data['entry']
+            return None
+        except Exception as e:
+            print(f"⚠️ Could not read Graph cache file: {e}")
+            return None
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'entry': entry}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._disk_writes += 1
+            if self._disk_writes % 100 == 0:
+                self._prune_disk()
+        except Exception as e:
+            print(f"⚠️ Could not write Graph cache file: {e}")
+
+    def _remove_disk(self, key):
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def _prune_disk(self):
+        """Keep the disk tier bounded by dropping the least recently written files"""
+        files = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith('.json')]
+        if len(files) <= self.disk_max_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.disk_max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def snapshot(self):
+        """Return cache sizes and hit counters"""
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes, disk_enabled=bool(self.disk_dir))
+
+graph_cache = GraphResponseCache()
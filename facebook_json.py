@@ -0,0 +1,108 @@
+import json
+import threading
+from collections import OrderedDict
+from fastapi.responses import JSONResponse
+from facebook_config import RESPONSE_CACHE_MAX_BYTES, COMPRESSION_MIN_BYTES, COMPRESSION_CACHED_LEVELS
+from facebook_compression import compress
+from facebook_metrics import response_cache_events_total
+
+try:
+    import orjson
+except ImportError:  # the standard library encoder is used instead
+    orjson = None
+
+def dumps(content):
+    """Encode content as compact UTF-8 JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with dumps; returning a Response also skips FastAPI's jsonable_encoder pass"""
+
+    def render(self, content):
+        return dumps(content)
+
+class EncodedResponseCache:
+    """Encoded JSON bodies of store views, kept until the view they were encoded from changes
+
+    An entry remembers the store object its body came from (a conversation's message list, an account's
+    participant names) and that object's length. Sends insert into the same list and a sync or another
+    worker's write replaces it, so a body is served only while both still match. Compressed copies of
+    the body are kept with the entry, one per encoding clients asked for.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def _count(self, event):
+        # Called under the lock; the counter is what Prometheus rates, stats what snapshot reports
+        self.stats[event] += 1
+        response_cache_events_total.inc(event=event)
+
+    def get(self, key, source, encoding=None):
+        """Return (body, content encoding) for key if it was encoded from source as it is now, else None
+
+        With an encoding, the body is compressed once, at COMPRESSION_CACHED_LEVELS, and the compressed
+        body is kept with the entry; bodies under COMPRESSION_MIN_BYTES are returned uncompressed.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['source'] is not source or entry['length'] != len(source):
+                self._count('misses')
+                return None
+            self._entries.move_to_end(key)
+            self._count('hits')
+        return self._compressed(key, entry, encoding)
+
+    def put(self, key, source, body, encoding=None):
+        """Cache a body encoded from source and return it as get would"""
+        entry = {'source': source, 'length': len(source), 'body': body, 'compressed': {}}
+        if len(body) <= self.max_bytes:
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._bytes -= _entry_bytes(old)
+                self._entries[key] = entry
+                self._bytes += len(body)
+                self._count('stores')
+                self._evict()
+        return self._compressed(key, entry, encoding)
+
+    def _compressed(self, key, entry, encoding):
+        if encoding is None or len(entry['body']) < COMPRESSION_MIN_BYTES:
+            return entry['body'], None
+        compressed = entry['compressed'].get(encoding)
+        if compressed is None:
+            # Compressed outside the lock; a concurrent request for the same body may do it twice
+            compressed = compress(entry['body'], encoding, COMPRESSION_CACHED_LEVELS[encoding])
+            with self._lock:
+                if self._entries.get(key) is entry and encoding not in entry['compressed']:
+                    entry['compressed'][encoding] = compressed
+                    self._bytes += len(compressed)
+                    self._evict()
+        return compressed, encoding
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= _entry_bytes(evicted)
+            self._count('evictions')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes)
+
+def _entry_bytes(entry):
+    return len(entry['body']) + sum(len(body) for body in entry['compressed'].values())
+
+response_cache = EncodedResponseCache()
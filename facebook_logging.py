@@ -0,0 +1,102 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from facebook_config import LOG_LEVEL, LOG_JSON, LOG_FILE, LOG_SAMPLE_EVERY
+
+ROOT_LOGGER_NAME = "facebook"
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any fields passed as extra={'fields': {...}}"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class ConsoleFormatter(logging.Formatter):
+    """The familiar one-line console output, with fields appended as key=value"""
+
+    def format(self, record):
+        line = record.getMessage()
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+_listener = None
+_configure_lock = threading.Lock()
+
+def configure_logging(level=None, json_output=None, log_file=None):
+    """Route the facebook.* loggers through a queue to one background writer thread
+
+    Callers only pay for putting a record on the queue; formatting and I/O happen on the writer thread.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+        level = level or LOG_LEVEL
+        json_output = LOG_JSON if json_output is None else json_output
+        log_file = LOG_FILE if log_file is None else log_file
+
+        target = logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.StreamHandler(sys.stderr)
+        target.setFormatter(JsonFormatter() if json_output else ConsoleFormatter())
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, target, respect_handler_level=False)
+        _listener.start()
+        return root
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+atexit.register(_stop_listener)
+
+def get_logger(name):
+    """Logger under the facebook namespace, configuring the queued handler on first use"""
+    if _listener is None:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+class LogSampler:
+    """Lets one in every N calls per key through, for progress lines inside per-item loops"""
+
+    def __init__(self, every=LOG_SAMPLE_EVERY):
+        self.every = max(1, every)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def should_log(self, key):
+        with self._lock:
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+        return count % self.every == 1 or self.every == 1
+
+    def reset(self, key):
+        with self._lock:
+            self._counts.pop(key, None)
+
+log_sampler = LogSampler()
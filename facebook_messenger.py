@@ -1,388 +1,711 @@
-import requests
-import json
-import time
-from datetime import datetime
-from facebook_config import APP_ID, APP_SECRET, REDIRECT_URI
-from facebook_data_handlers import save_user_profile, save_facebook_data, save_messages_data
-
-class FacebookMessenger:
-    def __init__(self):
-        self.graph_version = "v18.0"
-        self.base_url = f"https://graph.facebook.com/{self.graph_version}"
-        self.app_id = APP_ID
-        self.app_secret = APP_SECRET
-        self.redirect_uri = REDIRECT_URI
-
-    def generate_login_url(self):
-        """Generate login URL with Facebook permissions"""
-        scopes = [
-            'pages_messaging',
-            'pages_show_list',
-            'pages_manage_metadata',
-            'pages_read_engagement',
-            'pages_read_user_content',
-            'email',
-            'public_profile',
-            'business_management'
-        ]
-        
-        params = {
-            'client_id': self.app_id,
-            'redirect_uri': self.redirect_uri,
-            'scope': ','.join(scopes),
-            'response_type': 'code',
-            'state': 'facebook_login'
-        }
-        
-        query_params = '&'.join([f"{k}={v}" for k, v in params.items()])
-        return f"https://www.facebook.com/{self.graph_version}/dialog/oauth?{query_params}"
-
-    def get_access_token(self, code):
-        """Exchange code for access token"""
-        params = {
-            'client_id': self.app_id,
-            'client_secret': self.app_secret,
-            'redirect_uri': self.redirect_uri,
-            'code': code
-        }
-        
-        try:
-            response = requests.get(f"{self.base_url}/oauth/access_token", params=params)
-            if response.status_code == 200:
-                return response.json()
-            return None
-        except Exception as e:
-            print(f"❌ Token exchange error: {e}")
-            return None
-
-    def get_long_lived_token(self, short_token):
-        """Convert to long-lived token"""
-        params = {
-            'grant_type': 'fb_exchange_token',
-            'client_id': self.app_id,
-            'client_secret': self.app_secret,
-            'fb_exchange_token': short_token
-        }
-        
-        try:
-            response = requests.get(f"{self.base_url}/oauth/access_token", params=params)
-            if response.status_code == 200:
-                return response.json()
-            return {'access_token': short_token}
-        except Exception as e:
-            return {'access_token': short_token}
-
-    def check_message_window(self, conversation_id, access_token):
-        """Check if we can send messages (within 24-hour window)"""
-        try:
-            print(f"🔍 Checking message window for conversation: {conversation_id}")
-            url = f"{self.base_url}/{conversation_id}"
-            params = {
-                'fields': 'messages{created_time,from}',
-                'access_token': access_token
-            }
-            
-            response = requests.get(url, params=params, timeout=15)
-            if response.status_code == 200:
-                data = response.json()
-                messages = data.get('messages', {}).get('data', [])
-                if not messages:
-                    print("📭 No messages found in conversation")
-                    return False, 999
-                
-                # Get the most recent message
-                last_msg = messages[0]
-                created_time = last_msg.get('created_time')
-                if not created_time:
-                    print("⚠️ No timestamp found in last message")
-                    return False, 999
-                
-                # Parse timestamp
-                try:
-                    last_msg_time = datetime.fromisoformat(created_time.replace('Z', '+00:00'))
-                    now = datetime.now(last_msg_time.tzinfo)
-                    hours_diff = (now - last_msg_time).total_seconds() / 3600
-                    is_within_window = hours_diff <= 24
-                    print(f"⏰ Last message: {hours_diff:.1f} hours ago, within window: {is_within_window}")
-                    return is_within_window, hours_diff
-                except Exception as time_error:
-                    print(f"❌ Error parsing message timestamp: {time_error}")
-                    return False, 999
-            else:
-                print(f"❌ API error checking message window: {response.status_code} - {response.text}")
-                return False, 999
-                
-        except requests.exceptions.RequestException as req_error:
-            print(f"🌐 Network error checking message window: {req_error}")
-            return False, 999
-        except Exception as e:
-            print(f"⚠️ Unexpected error checking message window: {e}")
-            return False, 999
-
-    def send_facebook_message_with_templates(self, conversation_id, participant_id, message_text, access_token, participant_name="Unknown User"):
-        """Send Facebook message with participant name displayed"""
-        # First check if we're within the messaging window
-        can_send, hours_since = self.check_message_window(conversation_id, access_token)
-        
-        if not can_send:
-            print(f"⚠️ Outside 24-hour window ({hours_since:.1f} hours since last message)")
-            print("🔄 Trying to send as message template...")
-            # Try to send as a message template (for businesses)
-            payload = {
-                'recipient': json.dumps({'id': participant_id}),
-                'message': json.dumps({'text': message_text}),
-                'messaging_type': 'MESSAGE_TAG',
-                'tag': 'CONFIRMED_EVENT_UPDATE',
-                'access_token': access_token
-            }
-        else:
-            print(f"✅ Within messaging window ({hours_since:.1f} hours)")
-            payload = {
-                'recipient': json.dumps({'id': participant_id}),
-                'message': json.dumps({'text': message_text}),
-                'messaging_type': 'RESPONSE',
-                'access_token': access_token
-            }
-        
-        try:
-            print(f"📤 Sending Facebook message...")
-            print(f"   To: {participant_name} (ID: {participant_id})")
-            print(f"   Message: {message_text}")
-            
-            response = requests.post(f"{self.base_url}/me/messages", data=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                message_id = result.get('message_id', 'Message sent')
-                print(f"✅ Facebook message sent to {participant_name}! Message ID: {message_id}")
-                return True, message_id
-            else:
-                error_info = response.json()
-                error_msg = error_info.get('error', {}).get('message', 'Unknown error')
-                print(f"❌ Failed to send Facebook message to {participant_name}: {error_msg}")
-                
-                if "outside the allowed window" in error_msg.lower():
-                    suggestion = "💡 SOLUTION: Ask the user to send you a message first, then you can reply within 24 hours."
-                    print(suggestion)
-                    return False, f"{error_msg}\n{suggestion}"
-                
-                return False, error_msg
-                
-        except Exception as e:
-            print(f"❌ Exception while sending Facebook message to {participant_name}: {e}")
-            return False, str(e)
-
-    def get_conversation_messages(self, conversation_id, access_token, participant_name_map, limit=100):
-        """Get messages from Facebook conversation with participant names from conversation data"""
-        try:
-            print(f"📨 Fetching messages for conversation: {conversation_id}")
-            
-            # Get messages with available fields
-            fields = "messages{id,message,from{id,name},created_time,attachments{name,mime_type,size}}"
-            response = requests.get(
-                f"{self.base_url}/{conversation_id}?fields={fields}&limit={limit}&access_token={access_token}",
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                messages_data = response.json().get('messages', {}).get('data', [])
-                processed_messages = []
-                print(f"🔍 Processing {len(messages_data)} messages...")
-                
-                for msg in messages_data:
-                    from_info = msg.get('from', {})
-                    sender_id = from_info.get('id')
-                    
-                    # Use participant name from conversation data first, fallback to message data
-                    sender_name = participant_name_map.get(sender_id, from_info.get('name', 'Unknown User'))
-                    
-                    # Process attachments
-                    attachments_data = []
-                    attachments = msg.get('attachments', {}).get('data', [])
-                    for attachment in attachments:
-                        attachments_data.append({
-                            'name': attachment.get('name', 'Unknown'),
-                            'mime_type': attachment.get('mime_type', 'Unknown'),
-                            'size': attachment.get('size', 0)
-                        })
-                    
-                    processed_message = {
-                        'message_id': msg.get('id'),
-                        'message_text': msg.get('message', 'No text content'),
-                        'created_time': msg.get('created_time'),
-                        'sender': {
-                            'id': sender_id,
-                            'name': sender_name,
-                            'email': 'Not available (Facebook privacy policy)'
-                        },
-                        'attachments': attachments_data,
-                        'attachment_count': len(attachments_data),
-                        'retrieved_at': datetime.now().isoformat()
-                    }
-                    
-                    processed_messages.append(processed_message)
-                
-                print(f"✅ Processed {len(processed_messages)} messages for conversation {conversation_id}")
-                return processed_messages
-            else:
-                print(f"❌ Error fetching messages: {response.status_code} - {response.text}")
-                return []
-                
-        except Exception as e:
-            print(f"❌ Error getting messages for conversation {conversation_id}: {e}")
-            return []
-
-    def setup_complete_user_data(self, access_token):
-        """Setup complete user data using participant names from conversation data"""
-        from facebook_config import participant_names
-        
-        user_info = {
-            'access_token': access_token,
-            'connected_at': datetime.now().isoformat(),
-            'facebook_pages': [],
-            'facebook_conversations': [],
-            'facebook_messages': {},
-            'participant_names': {}
-        }
-        
-        # Get YOUR profile (this will have email if you granted permission)
-        print("👤 Getting your user profile...")
-        try:
-            profile_response = requests.get(
-                f"{self.base_url}/me?fields=id,name,email,first_name,last_name&access_token={access_token}"
-            )
-            
-            if profile_response.status_code == 200:
-                profile = profile_response.json()
-                user_info['profile'] = profile
-                save_user_profile(profile)
-                
-                # Your email should be available since you authorized the app
-                your_email = profile.get('email', 'Not granted permission')
-                print(f"✅ Your profile: {profile.get('name')} ({your_email})")
-            else:
-                print(f"⚠️ Could not get your profile: {profile_response.text}")
-                user_info['profile'] = {}
-        except Exception as e:
-            print(f"⚠️ Error getting your profile: {e}")
-            user_info['profile'] = {}
-        
-        # Get Facebook pages
-        print("📄 Getting Facebook pages...")
-        try:
-            pages_response = requests.get(
-                f"{self.base_url}/me/accounts?access_token={access_token}"
-            )
-            
-            if pages_response.status_code == 200:
-                pages = pages_response.json().get('data', [])
-                for page in pages:
-                    page_data = {
-                        'id': page['id'],
-                        'name': page['name'],
-                        'access_token': page['access_token'],
-                        'platform': 'facebook',
-                        'retrieved_at': datetime.now().isoformat()
-                    }
-                    
-                    user_info['facebook_pages'].append(page_data)
-                print(f"✅ Found {len(pages)} Facebook pages")
-        except Exception as e:
-            print(f"⚠️ Error getting pages: {e}")
-        
-        # Get Facebook conversations and extract participant names
-        print("💬 Getting Facebook conversations and participant names...")
-        for page in user_info['facebook_pages']:
-            print(f"📄 Processing Facebook page: {page['name']}")
-            try:
-                url = f"{self.base_url}/{page['id']}/conversations"
-                params = {
-                    'fields': 'id,participants,updated_time,message_count',
-                    'access_token': page['access_token']
-                }
-                
-                conv_response = requests.get(url, params=params, timeout=30)
-                
-                if conv_response.status_code == 200:
-                    conversations_data = conv_response.json()
-                    conversations = conversations_data.get('data', [])
-                    print(f"✅ Found {len(conversations)} conversations for {page['name']}")
-                    
-                    for conv in conversations:
-                        try:
-                            participants = conv.get('participants', {}).get('data', [])
-                            for participant in participants:
-                                if participant.get('id') != page['id']:  # Skip page itself
-                                    participant_id = participant.get('id')
-                                    participant_name = participant.get('name', 'Unknown User')
-                                    
-                                    # Store participant name for later use
-                                    user_info['participant_names'][participant_id] = participant_name
-                                    print(f"👤 Found participant: {participant_name} (ID: {participant_id})")
-                                    
-                                    # Check message window
-                                    try:
-                                        can_send, hours_since = self.check_message_window(conv['id'], page['access_token'])
-                                    except Exception:
-                                        can_send, hours_since = False, 999
-                                    
-                                    conversation_data = {
-                                        'conversation_id': conv['id'],
-                                        'page_id': page['id'],
-                                        'page_name': page['name'],
-                                        'page_access_token': page['access_token'],
-                                        'participant_id': participant_id,
-                                        'participant_name': participant_name,
-                                        'participant_email': 'Not available (Facebook privacy policy)',
-                                        'updated_time': conv.get('updated_time'),
-                                        'message_count': conv.get('message_count', 0),
-                                        'platform': 'facebook',
-                                        'can_send_message': can_send,
-                                        'hours_since_last_message': round(hours_since, 1),
-                                        'retrieved_at': datetime.now().isoformat()
-                                    }
-                                    
-                                    user_info['facebook_conversations'].append(conversation_data)
-                        except Exception as conv_error:
-                            print(f"❌ Error processing conversation: {conv_error}")
-                            continue
-                else:
-                    print(f"❌ HTTP Error for page {page['name']}: {conv_response.text}")
-            except Exception as page_error:
-                print(f"⚠️ Error processing page: {page_error}")
-        
-        print(f"✅ Total Facebook conversations processed: {len(user_info['facebook_conversations'])}")
-        print(f"✅ Total participant names collected: {len(user_info['participant_names'])}")
-        
-        # Update global participant_names for easy access
-        participant_names.update(user_info['participant_names'])
-        
-        # Fetch messages for each conversation
-        print("📨 Fetching messages for conversations with participant names...")
-        total_messages = 0
-        for conv in user_info['facebook_conversations']:
-            conv_id = conv['conversation_id']
-            participant_name = conv['participant_name']
-            
-            try:
-                print(f"💬 Getting messages for conversation with {participant_name}...")
-                messages = self.get_conversation_messages(conv_id, conv['page_access_token'], user_info['participant_names'])
-                user_info['facebook_messages'][conv_id] = messages
-                total_messages += len(messages)
-                print(f"✅ Fetched {len(messages)} messages for {participant_name} (conversation {conv_id})")
-                
-                # Add a small delay to avoid hitting rate limits
-                time.sleep(1)
-            except Exception as e:
-                print(f"❌ Error fetching messages for conversation with {participant_name}: {e}")
-                user_info['facebook_messages'][conv_id] = []
-        
-        print(f"🎉 Setup complete! Fetched {total_messages} messages from {len(user_info['facebook_conversations'])} conversations")
-        print(f"📊 All participant names properly stored and available for messaging")
-        
-        # Save data
-        print("💾 Saving data to JSON files...")
-        save_facebook_data(user_info)
-        save_messages_data(user_info)
-        
-        return user_info
+import requests
+import hashlib
+import json
+import time
+from datetime import datetime
+from facebook_config import (
+    APP_ID, APP_SECRET, REDIRECT_URI, PARTICIPANT_LOOKUP_BATCH_SIZE, GRAPH_BASE_URL, GRAPH_MAX_RETRIES, GRAPH_RETRY_BACKOFF_SECONDS,
+    GRAPH_RATE_LIMIT_ERROR_CODES, GRAPH_TRANSIENT_ERROR_CODES, SYNC_CONVERSATIONS_PAGE_SIZE, SYNC_CONVERSATION_DELAY_SECONDS,
+    SYNC_PROGRESS_EVENT_SECONDS
+)
+from facebook_data_handlers import save_user_profile, save_facebook_data, save_messages_data, conversation_title
+from facebook_window_cache import window_cache, parse_graph_time
+from facebook_participants import get_participant_directory
+from facebook_accounts import account_id_for
+from facebook_tokens import token_manager, INVALID_TOKEN_ERROR_CODE
+from facebook_graph_cache import graph_cache, CachedGraphResponse
+from facebook_logging import get_logger, log_sampler
+from facebook_tracing import tracer
+from facebook_attachments import attachment_store, attachment_source_url, AttachmentDownloader
+from facebook_events import event_bus
+from facebook_checkpoints import start_sync_checkpoint
+from facebook_metrics import (
+    graph_endpoint, graph_requests_total, graph_request_seconds, graph_retries_total,
+    sync_phase_seconds, sync_messages_fetched_total, sync_conversations_fetched_total, sync_messages_per_second
+)
+
+log = get_logger("messenger")
+
+class FacebookMessenger:
+    def __init__(self, base_url=None):
+        self.graph_version = "v18.0"
+        self.base_url = base_url or GRAPH_BASE_URL or f"https://graph.facebook.com/{self.graph_version}"
+        self.max_retries = GRAPH_MAX_RETRIES
+        self.retry_backoff = GRAPH_RETRY_BACKOFF_SECONDS
+        self.conversation_delay = SYNC_CONVERSATION_DELAY_SECONDS
+        # One pooled session, so a sync reuses connections instead of opening one per request
+        self.session = requests.Session()
+        self.app_id = APP_ID
+        self.app_secret = APP_SECRET
+        self.redirect_uri = REDIRECT_URI
+
+    @staticmethod
+    def _token_principal(token):
+        """Who a token belongs to, so cached responses are shared across token refreshes but never across accounts"""
+        account_id, page_id = token_manager.account_for_token(token)
+        if account_id is not None:
+            return f"{account_id}:{page_id or 'user'}"
+        return "token:" + hashlib.sha256((token or '').encode('utf-8')).hexdigest()[:16]
+
+    def _graph_request(self, method, path, params=None, data=None, timeout=30, use_cache=True):
+        """Call the Graph API, failing fast on tokens known to be invalid and flagging newly invalid ones
+
+        GETs go through graph_cache: fresh entries cost nothing, stale ones are revalidated with If-None-Match.
+        """
+        token = (params or {}).get('access_token') or (data or {}).get('access_token')
+        token_manager.check(token)
+        url = f"{self.base_url}{path}"
+        endpoint = graph_endpoint(path)
+        
+        ttl = graph_cache.ttl_for(path) if method == 'GET' and use_cache else None
+        cache_key, entry, headers = None, None, None
+        if ttl is not None:
+            cache_key = graph_cache.make_key(url, params, self._token_principal(token))
+            entry = graph_cache.get(cache_key)
+            if entry is not None and graph_cache.is_fresh(entry):
+                graph_cache.record_hit()
+                graph_requests_total.inc(endpoint=endpoint, method=method, status='cache_hit')
+                tracer.record(f"{method} {endpoint}", 'graph', time.perf_counter(), time.perf_counter(), status='cache_hit')
+                return CachedGraphResponse(entry)
+            if entry is not None and entry.get('etag'):
+                headers = {'If-None-Match': entry['etag']}
+            graph_cache.record_miss()
+        
+        retry_codes = GRAPH_RATE_LIMIT_ERROR_CODES + (GRAPH_TRANSIENT_ERROR_CODES if method == 'GET' else ())
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, params=params, data=data, headers=headers, timeout=timeout)
+            except requests.exceptions.RequestException:
+                graph_requests_total.inc(endpoint=endpoint, method=method, status='network_error')
+                raise
+            finally:
+                finished = time.perf_counter()
+                graph_request_seconds.observe(finished - started, endpoint=endpoint, method=method)
+            graph_requests_total.inc(endpoint=endpoint, method=method, status=response.status_code)
+            tracer.record(f"{method} {endpoint}", 'graph', started, finished, path=path, status=response.status_code, attempt=attempt)
+            if response.status_code in (200, 304) or attempt == self.max_retries:
+                break
+            error = self._graph_error(response)
+            if error.get('code') not in retry_codes:
+                break
+            graph_retries_total.inc(endpoint=endpoint, code=error.get('code'))
+            delay = self.retry_backoff * 2 ** attempt
+            log.warning("⏳ Graph error %s (%s), retrying in %.1fs", error.get('code'), error.get('message'), delay)
+            time.sleep(delay)
+        
+        if cache_key is not None:
+            if response.status_code == 304 and entry is not None:
+                graph_cache.revalidated(cache_key, entry, ttl, graph_cache.on_disk(path))
+                return CachedGraphResponse(entry, revalidated=True)
+            if response.status_code == 200:
+                graph_cache.store(cache_key, ttl, response.headers.get('ETag'), response.text, graph_cache.on_disk(path))
+        
+        if response.status_code != 200:
+            error = self._graph_error(response)
+            if error.get('code') == INVALID_TOKEN_ERROR_CODE:
+                token_manager.mark_invalid(token, error.get('message', 'Invalid OAuth access token'))
+                graph_cache.invalidate_principal(self._token_principal(token))
+        return response
+
+    @staticmethod
+    def _graph_error(response):
+        """The error object of a failed Graph response, or {} if the body is not a Graph error"""
+        try:
+            error = response.json().get('error', {})
+            return error if isinstance(error, dict) else {}
+        except ValueError:
+            return {}
+
+    def generate_login_url(self):
+        """Generate login URL with Facebook permissions"""
+        scopes = [
+            'pages_messaging',
+            'pages_show_list',
+            'pages_manage_metadata',
+            'pages_read_engagement',
+            'pages_read_user_content',
+            'email',
+            'public_profile',
+            'business_management'
+        ]
+        
+        params = {
+            'client_id': self.app_id,
+            'redirect_uri': self.redirect_uri,
+            'scope': ','.join(scopes),
+            'response_type': 'code',
+            'state': 'facebook_login'
+        }
+        
+        query_params = '&'.join([f"{k}={v}" for k, v in params.items()])
+        return f"https://www.facebook.com/{self.graph_version}/dialog/oauth?{query_params}"
+
+    def get_access_token(self, code):
+        """Exchange code for access token"""
+        params = {
+            'client_id': self.app_id,
+            'client_secret': self.app_secret,
+            'redirect_uri': self.redirect_uri,
+            'code': code
+        }
+        
+        try:
+            response = self._graph_request('GET', "/oauth/access_token", params=params)
+            if response.status_code == 200:
+                return response.json()
+            return None
+        except Exception as e:
+            log.error("❌ Token exchange error: %s", e)
+            return None
+
+    def get_long_lived_token(self, short_token, short_expires_in=None):
+        """Convert to long-lived token, saying so when the exchange fails instead of silently keeping the short one"""
+        params = {
+            'grant_type': 'fb_exchange_token',
+            'client_id': self.app_id,
+            'client_secret': self.app_secret,
+            'fb_exchange_token': short_token
+        }
+        
+        try:
+            response = self._graph_request('GET', "/oauth/access_token", params=params)
+            if response.status_code == 200:
+                token_data = response.json()
+                token_data['long_lived'] = True
+                return token_data
+            log.warning("⚠️ Long-lived token exchange failed, keeping the short-lived token: %s - %s", response.status_code, response.text)
+        except Exception as e:
+            log.warning("⚠️ Long-lived token exchange failed, keeping the short-lived token: %s", e)
+        return {'access_token': short_token, 'expires_in': short_expires_in, 'long_lived': False}
+
+    def get_page_tokens(self, user_token):
+        """Get {page_id: page access token} for the user's pages, or None if Graph could not be reached"""
+        try:
+            # Refreshes need the current page tokens, never cached ones
+            response = self._graph_request('GET', "/me/accounts", params={'fields': 'id,access_token', 'access_token': user_token}, use_cache=False)
+            if response.status_code == 200:
+                return {page['id']: page['access_token'] for page in response.json().get('data', [])}
+            log.warning("⚠️ Could not get page tokens: %s - %s", response.status_code, response.text)
+            return None
+        except Exception as e:
+            log.warning("⚠️ Error getting page tokens: %s", e)
+            return None
+
+    def check_message_window(self, conversation_id, access_token, page_id=None, account_id=None):
+        """Check if we can send messages (within 24 hours of the participant's last message)"""
+        try:
+            log.debug("🔍 Checking message window for conversation: %s", conversation_id)
+            params = {
+                'fields': 'messages{created_time,from}',
+                'access_token': access_token
+            }
+            
+            response = self._graph_request('GET', f"/{conversation_id}", params=params, timeout=15)
+            if response.status_code == 200:
+                data = response.json()
+                messages = data.get('messages', {}).get('data', [])
+                if page_id:
+                    # Only the participant's messages open the window, not the page's own replies
+                    messages = [msg for msg in messages if msg.get('from', {}).get('id') != page_id]
+                if not messages:
+                    log.debug("📭 No messages found in conversation %s", conversation_id)
+                    window_cache.record_no_messages(conversation_id, account_id)
+                    return False, 999
+                
+                # Get the most recent message
+                last_msg = messages[0]
+                created_time = last_msg.get('created_time')
+                if not created_time:
+                    log.warning("⚠️ No timestamp found in last message of conversation %s", conversation_id)
+                    return False, 999
+                
+                # Parse timestamp
+                try:
+                    last_msg_time = parse_graph_time(created_time)
+                    window_cache.record_last_message(conversation_id, last_msg_time, account_id)
+                    now = datetime.now(last_msg_time.tzinfo)
+                    hours_diff = (now - last_msg_time).total_seconds() / 3600
+                    is_within_window = hours_diff <= 24
+                    log.debug("⏰ Last message: %.1f hours ago, within window: %s", hours_diff, is_within_window)
+                    return is_within_window, hours_diff
+                except Exception as time_error:
+                    log.error("❌ Error parsing message timestamp: %s", time_error)
+                    return False, 999
+            else:
+                log.error("❌ API error checking message window: %s - %s", response.status_code, response.text)
+                return False, 999
+                
+        except requests.exceptions.RequestException as req_error:
+            log.error("🌐 Network error checking message window: %s", req_error)
+            return False, 999
+        except Exception as e:
+            log.warning("⚠️ Unexpected error checking message window: %s", e)
+            return False, 999
+
+    def get_message_window(self, conversation_id, access_token, page_id=None, account_id=None):
+        """Get the messaging window status, only calling Graph when the cached status has expired"""
+        cached = window_cache.get(conversation_id, account_id)
+        if cached is not None:
+            return cached
+        return self.check_message_window(conversation_id, access_token, page_id, account_id)
+
+    def send_facebook_message_with_templates(self, conversation_id, participant_id, message_text, access_token, participant_name="Unknown User", page_id=None, account_id=None):
+        """Send Facebook message with participant name displayed"""
+        # First check if we're within the messaging window
+        can_send, hours_since = self.get_message_window(conversation_id, access_token, page_id, account_id)
+        
+        if not can_send:
+            log.info("⚠️ Outside 24-hour window (%.1f hours since last message)", hours_since)
+            log.info("🔄 Trying to send as message template...")
+            # Try to send as a message template (for businesses)
+            payload = {
+                'recipient': json.dumps({'id': participant_id}),
+                'message': json.dumps({'text': message_text}),
+                'messaging_type': 'MESSAGE_TAG',
+                'tag': 'CONFIRMED_EVENT_UPDATE',
+                'access_token': access_token
+            }
+        else:
+            log.info("✅ Within messaging window (%.1f hours)", hours_since)
+            payload = {
+                'recipient': json.dumps({'id': participant_id}),
+                'message': json.dumps({'text': message_text}),
+                'messaging_type': 'RESPONSE',
+                'access_token': access_token
+            }
+        
+        try:
+            log.info("📤 Sending Facebook message to %s (ID: %s)", participant_name, participant_id)
+            log.debug("   Message: %s", message_text)
+            
+            response = self._graph_request('POST', "/me/messages", data=payload)
+            
+            if response.status_code == 200:
+                result = response.json()
+                message_id = result.get('message_id', 'Message sent')
+                log.info("✅ Facebook message sent to %s! Message ID: %s", participant_name, message_id)
+                return True, message_id
+            else:
+                error_info = response.json()
+                error_msg = error_info.get('error', {}).get('message', 'Unknown error')
+                log.error("❌ Failed to send Facebook message to %s: %s", participant_name, error_msg)
+                
+                if "outside the allowed window" in error_msg.lower():
+                    suggestion = "💡 SOLUTION: Ask the user to send you a message first, then you can reply within 24 hours."
+                    log.info(suggestion)
+                    return False, f"{error_msg}\n{suggestion}"
+                
+                return False, error_msg
+                
+        except Exception as e:
+            log.error("❌ Exception while sending Facebook message to %s: %s", participant_name, e)
+            return False, str(e)
+
+    def get_participant_names(self, participant_ids, access_token, participant_directory):
+        """Resolve participant names with batched multi-id Graph lookups, using the directory first"""
+        names = {}
+        unknown_ids = []
+        for participant_id in dict.fromkeys(participant_ids):
+            name = participant_directory.get(participant_id)
+            if name:
+                names[participant_id] = name
+            elif participant_id:
+                unknown_ids.append(participant_id)
+        
+        for start in range(0, len(unknown_ids), PARTICIPANT_LOOKUP_BATCH_SIZE):
+            batch = unknown_ids[start:start + PARTICIPANT_LOOKUP_BATCH_SIZE]
+            try:
+                response = self._graph_request(
+                    'GET', "/",
+                    params={'ids': ','.join(batch), 'fields': 'name', 'access_token': access_token},
+                    timeout=15
+                )
+                if response.status_code == 200:
+                    for participant_id, profile in response.json().items():
+                        if profile.get('name'):
+                            names[participant_id] = profile['name']
+                            participant_directory.set(participant_id, profile['name'])
+                else:
+                    log.warning("⚠️ Could not resolve %d participant names: %s - %s", len(batch), response.status_code, response.text)
+            except Exception as e:
+                log.warning("⚠️ Error resolving participant names: %s", e)
+        
+        # Fall back to expired entries for anything Graph could not resolve
+        for participant_id in unknown_ids:
+            if participant_id not in names:
+                stale_name = participant_directory.get(participant_id, allow_stale=True)
+                if stale_name:
+                    names[participant_id] = stale_name
+        return names
+
+    def get_conversation_messages(self, conversation_id, access_token, participant_name_map, limit=100, participant_directory=None):
+        """Get messages from Facebook conversation with participant names from conversation data"""
+        try:
+            log.debug("📨 Fetching messages for conversation: %s", conversation_id)
+            
+            # Get messages with available fields
+            fields = "messages{id,message,from{id,name},created_time,attachments{id,name,mime_type,size,file_url,image_data{url},video_data{url}}}"
+            response = self._graph_request(
+                'GET', f"/{conversation_id}",
+                params={'fields': fields, 'limit': limit, 'access_token': access_token},
+                timeout=30
+            )
+            
+            if response.status_code == 200:
+                messages_data = response.json().get('messages', {}).get('data', [])
+                processed_messages = []
+                log.debug("🔍 Processing %d messages...", len(messages_data))
+                
+                # Names in the message data keep the directory fresh; ids without any name are resolved in one batch
+                unnamed_ids = []
+                for msg in messages_data:
+                    from_info = msg.get('from', {})
+                    sender_id = from_info.get('id')
+                    if sender_id in participant_name_map:
+                        continue
+                    if from_info.get('name'):
+                        if participant_directory is not None:
+                            participant_directory.set(sender_id, from_info['name'])
+                    else:
+                        unnamed_ids.append(sender_id)
+                resolved_names = {}
+                if unnamed_ids and participant_directory is not None:
+                    resolved_names = self.get_participant_names(unnamed_ids, access_token, participant_directory)
+                
+                for msg in messages_data:
+                    from_info = msg.get('from', {})
+                    sender_id = from_info.get('id')
+                    
+                    # Use participant name from conversation data first, then message data, then the directory
+                    sender_name = (
+                        participant_name_map.get(sender_id)
+                        or from_info.get('name')
+                        or resolved_names.get(sender_id)
+                        or 'Unknown User'
+                    )
+                    
+                    # Process attachments
+                    attachments_data = []
+                    attachments = msg.get('attachments', {}).get('data', [])
+                    for index, attachment in enumerate(attachments):
+                        attachments_data.append({
+                            # Graph attachment ids are only unique within their message
+                            'attachment_id': f"{msg.get('id')}_{attachment.get('id', index)}",
+                            'name': attachment.get('name', 'Unknown'),
+                            'mime_type': attachment.get('mime_type', 'Unknown'),
+                            'size': attachment.get('size', 0),
+                            'url': attachment_source_url(attachment)
+                        })
+                    
+                    processed_message = {
+                        'message_id': msg.get('id'),
+                        'message_text': msg.get('message', 'No text content'),
+                        'created_time': msg.get('created_time'),
+                        'sender': {
+                            'id': sender_id,
+                            'name': sender_name,
+                            'email': 'Not available (Facebook privacy policy)'
+                        },
+                        'attachments': attachments_data,
+                        'attachment_count': len(attachments_data),
+                        'retrieved_at': datetime.now().isoformat()
+                    }
+                    
+                    processed_messages.append(processed_message)
+                
+                log.debug("✅ Processed %d messages for conversation %s", len(processed_messages), conversation_id)
+                return processed_messages
+            else:
+                log.error("❌ Error fetching messages: %s - %s", response.status_code, response.text)
+                return []
+                
+        except Exception as e:
+            log.error("❌ Error getting messages for conversation %s: %s", conversation_id, e)
+            return []
+
+    def get_user_profile(self, access_token):
+        """Get the logged-in user's /me profile, whose id keys the account"""
+        log.info("👤 Getting your user profile...")
+        try:
+            profile_response = self._graph_request(
+                'GET', "/me",
+                params={'fields': 'id,name,email,first_name,last_name', 'access_token': access_token}
+            )
+            
+            if profile_response.status_code == 200:
+                profile = profile_response.json()
+                
+                # Your email should be available since you authorized the app
+                your_email = profile.get('email', 'Not granted permission')
+                log.info("✅ Your profile: %s (%s)", profile.get('name'), your_email)
+                return profile
+            else:
+                log.warning("⚠️ Could not get your profile: %s", profile_response.text)
+                return {}
+        except Exception as e:
+            log.warning("⚠️ Error getting your profile: %s", e)
+            return {}
+
+    def setup_complete_user_data(self, access_token, profile=None):
+        """Setup complete user data using participant names from conversation data
+
+        Progress is checkpointed as the sync goes, so after a crash or restart the next sync of the same
+        account resumes from the last finished Graph page or conversation instead of starting over.
+        """
+        with tracer.timeline('sync'):
+            return self._sync_user_data(access_token, profile)
+
+    def _sync_user_data(self, access_token, profile):
+        user_info = {
+            'access_token': access_token,
+            'connected_at': datetime.now().isoformat(),
+            'facebook_pages': [],
+            'facebook_conversations': [],
+            'facebook_messages': {},
+            'participant_names': {}
+        }
+        
+        # Get YOUR profile (this will have email if you granted permission)
+        phase_started = time.perf_counter()
+        user_info['profile'] = profile if profile is not None else self.get_user_profile(access_token)
+        if user_info['profile']:
+            save_user_profile(user_info['profile'])
+        account_id = account_id_for(user_info)
+        participant_directory = get_participant_directory(account_id)
+        tracer.annotate(account_id=account_id)
+        checkpoint = start_sync_checkpoint(account_id)
+        try:
+            return self._sync_with_checkpoint(access_token, user_info, account_id, participant_directory, checkpoint, phase_started)
+        finally:
+            # Finished syncs have already dropped their checkpoint; an interrupted one keeps it for the next attempt
+            checkpoint.close()
+
+    def _sync_with_checkpoint(self, access_token, user_info, account_id, participant_directory, checkpoint, phase_started):
+        event_bus.publish('sync', {'status': 'started', 'resumed': checkpoint.resumed}, account_id=account_id)
+        phase_started = self._end_sync_phase('profile', phase_started, account_id)
+        
+        # Get Facebook pages
+        checkpoint.phase = 'pages'
+        log.info("📄 Getting Facebook pages...")
+        try:
+            pages_response = self._graph_request('GET', "/me/accounts", params={'access_token': access_token})
+            
+            if pages_response.status_code == 200:
+                pages = pages_response.json().get('data', [])
+                for page in pages:
+                    page_data = {
+                        'id': page['id'],
+                        'name': page['name'],
+                        'access_token': page['access_token'],
+                        'platform': 'facebook',
+                        'retrieved_at': datetime.now().isoformat()
+                    }
+                    
+                    user_info['facebook_pages'].append(page_data)
+                log.info("✅ Found %d Facebook pages", len(pages))
+                # Known page tokens let the conversation requests below reuse cached responses
+                token_manager.register_page_tokens(account_id, {page['id']: page['access_token'] for page in user_info['facebook_pages']})
+        except Exception as e:
+            log.warning("⚠️ Error getting pages: %s", e)
+        phase_started = self._end_sync_phase('pages', phase_started, account_id)
+        
+        # Get Facebook conversations and extract participant names
+        checkpoint.phase = 'conversations'
+        log.info("💬 Getting Facebook conversations and participant names...")
+        user_info['participant_names'].update(checkpoint.restored_participant_names())
+        for page in user_info['facebook_pages']:
+            log.info("📄 Processing Facebook page: %s", page['name'])
+            try:
+                params = {
+                    'fields': 'id,participants,updated_time,message_count',
+                    'limit': SYNC_CONVERSATIONS_PAGE_SIZE,
+                    'access_token': page['access_token']
+                }
+                
+                # Conversations fetched before an interruption are kept, with this login's page token
+                restored = checkpoint.page_conversations(page['id'])
+                for conversation_data in restored:
+                    conversation_data['page_access_token'] = page['access_token']
+                user_info['facebook_conversations'].extend(restored)
+                page_conversations = len(restored)
+                seen_ids = {conversation_data['conversation_id'] for conversation_data in restored}
+                after, done = checkpoint.page_cursor(page['id'])
+                if done:
+                    log.info("✅ Found %d conversations for %s (from checkpoint)", page_conversations, page['name'])
+                    continue
+                if after:
+                    params['after'] = after
+                
+                while True:
+                    conv_response = self._graph_request('GET', f"/{page['id']}/conversations", params=params, timeout=30)
+                    if conv_response.status_code != 200:
+                        log.error("❌ HTTP Error for page %s: %s", page['name'], conv_response.text)
+                        break
+                    
+                    conversations_data = conv_response.json()
+                    conversations = conversations_data.get('data', [])
+                    page_conversations += len(conversations)
+                    sync_conversations_fetched_total.inc(len(conversations))
+                    batch, batch_names = [], {}
+                    
+                    for conv in conversations:
+                        # Graph can list a conversation again when it is updated while we page
+                        if conv['id'] in seen_ids:
+                            continue
+                        seen_ids.add(conv['id'])
+                        try:
+                            participants = []
+                            for participant in conv.get('participants', {}).get('data', []):
+                                if participant.get('id') != page['id']:  # Skip page itself
+                                    participant_id = participant.get('id')
+                                    participant_name = participant.get('name', 'Unknown User')
+                                    participants.append({'id': participant_id, 'name': participant_name})
+                                    
+                                    # Store participant name for later use
+                                    user_info['participant_names'][participant_id] = participant_name
+                                    batch_names[participant_id] = participant_name
+                                    log.debug("👤 Found participant: %s (ID: %s)", participant_name, participant_id)
+                            if not participants:
+                                continue
+                            
+                            conversation_data = {
+                                'conversation_id': conv['id'],
+                                'page_id': page['id'],
+                                'page_name': page['name'],
+                                'page_access_token': page['access_token'],
+                                # The first participant, for clients that show one name per conversation
+                                'participant_id': participants[0]['id'],
+                                'participant_name': participants[0]['name'],
+                                'participant_email': 'Not available (Facebook privacy policy)',
+                                'participants': participants,
+                                'updated_time': conv.get('updated_time'),
+                                'message_count': conv.get('message_count', 0),
+                                'platform': 'facebook',
+                                # Filled in from the conversation's messages below
+                                'can_send_message': False,
+                                'hours_since_last_message': 999,
+                                'retrieved_at': datetime.now().isoformat()
+                            }
+                            
+                            user_info['facebook_conversations'].append(conversation_data)
+                            batch.append(conversation_data)
+                        except Exception as conv_error:
+                            log.error("❌ Error processing conversation: %s", conv_error)
+                            continue
+                    
+                    # Follow the cursor until Graph stops returning a next page
+                    paging = conversations_data.get('paging', {})
+                    after = paging.get('cursors', {}).get('after')
+                    done = not paging.get('next') or not after
+                    checkpoint.record_conversations(page['id'], batch, batch_names, None if done else after, done)
+                    if done:
+                        break
+                    params['after'] = after
+                log.info("✅ Found %d conversations for %s", page_conversations, page['name'])
+            except Exception as page_error:
+                log.warning("⚠️ Error processing page: %s", page_error)
+        
+        log.info("✅ Total Facebook conversations processed: %d", len(user_info['facebook_conversations']))
+        log.info("✅ Total participant names collected: %d", len(user_info['participant_names']))
+        
+        # Update the shared participant directory for easy access
+        participant_directory.update(user_info['participant_names'])
+        phase_started = self._end_sync_phase('conversations', phase_started, account_id)
+        
+        # Fetch messages for each conversation
+        checkpoint.phase = 'messages'
+        log.info("📨 Fetching messages for %d conversations...", len(user_info['facebook_conversations']))
+        total_messages = 0
+        log_sampler.reset('sync_messages')
+        # Attachments download on their own pool while the loop below keeps fetching messages
+        downloader = AttachmentDownloader(attachment_store, account_id)
+        progress_reported = time.perf_counter()
+        for done, conv in enumerate(user_info['facebook_conversations'], 1):
+            conv_id = conv['conversation_id']
+            participant_name = conversation_title(conv)
+            
+            try:
+                messages = checkpoint.restored_messages(conv_id)
+                if messages is None:
+                    log.debug("💬 Getting messages for conversation with %s...", participant_name)
+                    with tracer.span('fetch_messages', 'messages', conversation_id=conv_id) as span:
+                        messages = self.get_conversation_messages(conv_id, conv['page_access_token'], user_info['participant_names'], participant_directory=participant_directory)
+                        span['messages'] = len(messages)
+                    # An empty result may be a failed fetch, which a resumed sync should try again
+                    if messages:
+                        checkpoint.record_messages(conv_id, messages)
+                    fetched = True
+                else:
+                    fetched = False
+                user_info['facebook_messages'][conv_id] = messages
+                for message in messages:
+                    for attachment in message['attachments']:
+                        downloader.submit(attachment)
+                # The newest inbound message opens the reply window, so no separate window request is needed
+                last_inbound = next((m for m in messages if m['sender']['id'] != conv['page_id'] and m.get('created_time')), None)
+                if last_inbound:
+                    window_cache.record_last_message(conv_id, parse_graph_time(last_inbound['created_time']), account_id)
+                else:
+                    window_cache.record_no_messages(conv_id, account_id)
+                can_send, hours_since, _ = window_cache.status(conv_id, account_id=account_id)
+                conv['can_send_message'] = can_send
+                conv['hours_since_last_message'] = round(hours_since, 1)
+                total_messages += len(messages)
+                sync_messages_fetched_total.inc(len(messages))
+                if time.perf_counter() - progress_reported >= SYNC_PROGRESS_EVENT_SECONDS:
+                    progress_reported = time.perf_counter()
+                    event_bus.publish('sync', {
+                        'status': 'progress',
+                        'conversations_done': done,
+                        'conversations_total': len(user_info['facebook_conversations']),
+                        'messages': total_messages
+                    }, account_id=account_id)
+                if log_sampler.should_log('sync_messages'):
+                    log.info("📨 Fetched messages for %d/%d conversations", done, len(user_info['facebook_conversations']),
+                             extra={'fields': {'messages': total_messages}})
+                log.debug("✅ Fetched %d messages for %s (conversation %s)", len(messages), participant_name, conv_id)
+                
+                # Add a small delay to avoid hitting rate limits
+                if fetched and self.conversation_delay:
+                    time.sleep(self.conversation_delay)
+            except Exception as e:
+                log.error("❌ Error fetching messages for conversation with %s: %s", participant_name, e)
+                user_info['facebook_messages'][conv_id] = []
+        
+        messages_seconds = time.perf_counter() - phase_started
+        sync_messages_per_second.set(round(total_messages / messages_seconds, 1) if messages_seconds else 0)
+        phase_started = self._end_sync_phase('messages', phase_started, account_id)
+        checkpoint.phase = 'attachments'
+        
+        cached_attachments = downloader.wait()
+        if cached_attachments:
+            log.info("📎 Cached %d attachments", cached_attachments)
+        phase_started = self._end_sync_phase('attachments', phase_started, account_id)
+        
+        log.info("🎉 Setup complete! Fetched %d messages from %d conversations", total_messages, len(user_info['facebook_conversations']))
+        
+        # Save data
+        checkpoint.phase = 'save'
+        log.info("💾 Saving data to JSON files...")
+        save_facebook_data(user_info)
+        save_messages_data(user_info)
+        participant_directory.save()
+        checkpoint.finish()
+        self._end_sync_phase('save', phase_started, account_id)
+        event_bus.publish('sync', {
+            'status': 'finished',
+            'conversations': len(user_info['facebook_conversations']),
+            'messages': total_messages
+        }, account_id=account_id)
+        
+        return user_info
+
+    @staticmethod
+    def _end_sync_phase(phase, started, account_id=None):
+        """Record a sync phase's duration and return the start time of the next one"""
+        now = time.perf_counter()
+        sync_phase_seconds.observe(now - started, phase=phase)
+        tracer.record(phase, 'phase', started, now)
+        event_bus.publish('sync', {'status': 'phase', 'phase': phase, 'seconds': round(now - started, 3)}, account_id=account_id)
+        return now
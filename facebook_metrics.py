@@ -0,0 +1,186 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cached read up to a slow sync phase
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+BYTES_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 * 1024, 16 * 1024 * 1024, 256 * 1024 * 1024)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    """Monotonic count, e.g. requests made"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. a store size"""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, with their sum and count"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the with-block took"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, {'counts': list(s['counts']), 'sum': s['sum'], 'count': s['count']}) for key, s in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return lines
+
+class MetricsRegistry:
+    """All metrics of this process, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+# Graph API
+graph_requests_total = metrics.counter("fb_graph_requests_total", "Graph API calls by endpoint, method and HTTP status (cache_hit when served from the response cache)", ("endpoint", "method", "status"))
+graph_request_seconds = metrics.histogram("fb_graph_request_duration_seconds", "Graph API call latency", ("endpoint", "method"))
+graph_retries_total = metrics.counter("fb_graph_retries_total", "Graph API calls retried after a rate limit or transient error", ("endpoint", "code"))
+graph_cache_events_total = metrics.counter("fb_graph_cache_events_total", "Graph response cache hits, revalidations, misses, stores and evictions", ("event",))
+graph_cache_size = metrics.gauge("fb_graph_cache_size", "Graph response cache memory tier size", ("unit",))
+
+# Sync
+sync_phase_seconds = metrics.histogram("fb_sync_phase_duration_seconds", "Duration of each setup_complete_user_data phase", ("phase",))
+sync_messages_fetched_total = metrics.counter("fb_sync_messages_fetched_total", "Messages fetched from Graph during syncs")
+sync_conversations_fetched_total = metrics.counter("fb_sync_conversations_fetched_total", "Conversations fetched from Graph during syncs")
+sync_messages_per_second = metrics.gauge("fb_sync_messages_per_second", "Message fetch rate of the last completed sync")
+
+# Attachments
+attachment_downloads_total = metrics.counter("fb_attachment_downloads_total", "Attachment downloads by result (stored, deduplicated, too_large, error)", ("result",))
+attachment_download_seconds = metrics.histogram("fb_attachment_download_duration_seconds", "Time to stream one attachment into the cache")
+attachment_download_bytes_total = metrics.counter("fb_attachment_download_bytes_total", "Attachment bytes downloaded")
+attachment_evictions_total = metrics.counter("fb_attachment_evictions_total", "Attachment blobs evicted from the cache")
+attachment_cache_bytes = metrics.gauge("fb_attachment_cache_bytes", "Size of the attachment blob cache")
+
+# Responses
+response_cache_events_total = metrics.counter("fb_response_cache_events_total", "Encoded response cache hits, misses, stores and evictions", ("event",))
+response_cache_bytes = metrics.gauge("fb_response_cache_bytes", "Size of the encoded response cache")
+
+# Sending
+messages_sent_total = metrics.counter("fb_messages_sent_total", "Messages sent through /facebook/send by result", ("result",))
+
+# Persistence
+persistence_write_seconds = metrics.histogram("fb_persistence_write_duration_seconds", "Time to write a JSON file", ("file",))
+persistence_write_bytes = metrics.histogram("fb_persistence_write_bytes", "Size of each JSON write", ("file",), BYTES_BUCKETS)
+
+# In-memory stores, refreshed on each scrape
+store_accounts = metrics.gauge("fb_store_accounts", "Accounts loaded in user_data")
+store_conversations = metrics.gauge("fb_store_conversations", "Conversations held per loaded account", ("account_id",))
+store_messages = metrics.gauge("fb_store_messages", "Messages held per loaded account", ("account_id",))
+store_participants = metrics.gauge("fb_store_participants", "Participant names held per loaded account", ("account_id",))
+window_cache_entries = metrics.gauge("fb_window_cache_entries", "Conversations with a cached message window status")
+
+# HTTP API
+http_requests_total = metrics.counter("fb_http_requests_total", "API requests by route, method and status", ("route", "method", "status"))
+http_request_seconds = metrics.histogram("fb_http_request_duration_seconds", "API request latency", ("route", "method"))
+
+_GRAPH_PATH_NAMES = {'me', 'accounts', 'conversations', 'messages', 'oauth', 'access_token', 'debug_token'}
+
+def graph_endpoint(path):
+    """Graph path with object ids replaced, e.g. /123/conversations -> /{id}/conversations, to keep label cardinality low"""
+    segments = [s if s in _GRAPH_PATH_NAMES else '{id}' for s in path.strip('/').split('/') if s]
+    return '/' + '/'.join(segments)
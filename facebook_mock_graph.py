@@ -0,0 +1,476 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+MOCK_GRAPH_VERSION = "v18.0"
+MOCK_USER_TOKEN = "mock-user-token"
+MOCK_USER_ID = "100000000000001"
+MOCK_PAGE_ID_BASE = 200000000000000
+MOCK_PARTICIPANT_ID_BASE = 300000000000000
+MOCK_FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn"]
+MOCK_LAST_NAMES = ["Smith", "Garcia", "Chen", "Okafor", "Novak", "Silva", "Kim", "Müller", "Haddad", "Rossi"]
+
+# Graph error bodies the mock can inject
+RATE_LIMIT_ERROR = {"message": "(#4) Application request limit reached", "type": "OAuthException", "code": 4}
+TRANSIENT_ERROR = {"message": "An unknown error has occurred.", "type": "OAuthException", "code": 1}
+
+# Attachment bodies come from a few distinct files, so many attachments share the same content
+MOCK_MEDIA_KINDS = [("photo.jpg", "image/jpeg", 96 * 1024), ("clip.mp4", "video/mp4", 768 * 1024), ("invoice.pdf", "application/pdf", 160 * 1024), ("sticker.png", "image/png", 24 * 1024)]
+
+def _graph_time(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%S+0000')
+
+class MockGraphFixture:
+    """Synthetic Graph data: pages with conversations and messages, generated on demand from indexes
+
+    Nothing is held per conversation, so 100k conversations cost no more memory than 10. A recorded
+    fixture (see save/load) replays exact responses instead.
+    """
+
+    def __init__(self, conversations=10, pages=1, messages_per_conversation=5, seed=0, now=None, attachment_every=0, participants_per_conversation=1):
+        self.conversations = conversations
+        self.pages = pages
+        self.messages_per_conversation = messages_per_conversation
+        self.seed = seed
+        # People besides the page in each conversation; above 1 every conversation is a group thread
+        self.participants_per_conversation = participants_per_conversation
+        # Every attachment_every-th message carries an attachment (0: none); URLs point at the server's /media
+        self.attachment_every = attachment_every
+        self.media_base_url = ""
+        self.now = now or datetime.now(timezone.utc).replace(microsecond=0)
+        self.recorded = None
+
+    # ---- ids ----
+
+    def page_id(self, page_index):
+        return str(MOCK_PAGE_ID_BASE + page_index)
+
+    def page_token(self, page_index):
+        return f"mock-page-token-{page_index}"
+
+    def conversation_id(self, page_index, index):
+        return f"t_{page_index}_{index}"
+
+    def participant_id(self, page_index, index, member=0):
+        # The odd step gives the members of a group thread different names
+        return str(MOCK_PARTICIPANT_ID_BASE + page_index * 10000000 + member * 1000000001 + index)
+
+    def participant_ids(self, page_index, index):
+        return [self.participant_id(page_index, index, member) for member in range(self.participants_per_conversation)]
+
+    def participant_name(self, participant_id):
+        n = int(participant_id) + self.seed
+        return f"{MOCK_FIRST_NAMES[n % len(MOCK_FIRST_NAMES)]} {MOCK_LAST_NAMES[(n // len(MOCK_FIRST_NAMES)) % len(MOCK_LAST_NAMES)]}"
+
+    def conversations_for_page(self, page_index):
+        """Conversations are spread over the pages, the first pages taking the remainder"""
+        count, remainder = divmod(self.conversations, self.pages)
+        return count + (1 if page_index < remainder else 0)
+
+    def parse_conversation_id(self, conversation_id):
+        try:
+            _, page_index, index = conversation_id.split('_')
+            page_index, index = int(page_index), int(index)
+        except ValueError:
+            return None
+        if 0 <= page_index < self.pages and 0 <= index < self.conversations_for_page(page_index):
+            return page_index, index
+        return None
+
+    # ---- objects ----
+
+    def profile(self):
+        return {"id": MOCK_USER_ID, "name": "Mock Owner", "email": "owner@example.com", "first_name": "Mock", "last_name": "Owner"}
+
+    def page_list(self):
+        return [
+            {"id": self.page_id(i), "name": f"Mock Page {i}", "access_token": self.page_token(i), "category": "Business"}
+            for i in range(self.pages)
+        ]
+
+    def last_message_time(self, page_index, index):
+        # Spread over the last 48 hours so about half the windows are open
+        return self.now - timedelta(minutes=(index * 37 + page_index * 11 + self.seed) % (48 * 60))
+
+    def conversation(self, page_index, index):
+        return {
+            "id": self.conversation_id(page_index, index),
+            "participants": {"data": [
+                {"id": participant_id, "name": self.participant_name(participant_id), "email": f"{participant_id}@facebook.com"}
+                for participant_id in self.participant_ids(page_index, index)
+            ] + [
+                {"id": self.page_id(page_index), "name": f"Mock Page {page_index}", "email": f"{self.page_id(page_index)}@facebook.com"}
+            ]},
+            "updated_time": _graph_time(self.last_message_time(page_index, index)),
+            "message_count": self.messages_per_conversation
+        }
+
+    def messages(self, page_index, index, limit):
+        """Newest first, alternating between the participants, in turn, and the page"""
+        participant_ids = self.participant_ids(page_index, index)
+        last_time = self.last_message_time(page_index, index)
+        messages = []
+        for i in range(min(limit, self.messages_per_conversation)):
+            inbound = i % 2 == 0
+            participant_id = participant_ids[(i // 2) % len(participant_ids)]
+            sender_id = participant_id if inbound else self.page_id(page_index)
+            sender_name = self.participant_name(participant_id) if inbound else f"Mock Page {page_index}"
+            messages.append({
+                "id": f"m_{page_index}_{index}_{i}",
+                "message": f"Message {i} in conversation {index}",
+                "from": {"id": sender_id, "name": sender_name},
+                "created_time": _graph_time(last_time - timedelta(minutes=7 * i))
+            })
+            n = index * self.messages_per_conversation + i
+            if self.attachment_every and n % self.attachment_every == 0:
+                messages[-1]["attachments"] = {"data": [self.attachment(n)]}
+        return messages
+
+    def attachment(self, n):
+        name, mime_type, size = MOCK_MEDIA_KINDS[(n // self.attachment_every) % len(MOCK_MEDIA_KINDS)]
+        attachment = {"id": f"{n}", "name": name, "mime_type": mime_type, "size": size}
+        url = f"{self.media_base_url}/{name}?n={n}"
+        if mime_type.startswith("image/"):
+            attachment["image_data"] = {"url": url, "preview_url": url}
+        elif mime_type.startswith("video/"):
+            attachment["video_data"] = {"url": url, "preview_url": url}
+        else:
+            attachment["file_url"] = url
+        return attachment
+
+    @staticmethod
+    def media_body(name):
+        """Deterministic bytes of one MOCK_MEDIA_KINDS file"""
+        for kind_name, mime_type, size in MOCK_MEDIA_KINDS:
+            if kind_name == name:
+                block = hashlib.sha256(name.encode('utf-8')).digest() * 32
+                return mime_type, (block * (size // len(block) + 1))[:size]
+        return None, None
+
+    # ---- recorded fixtures ----
+
+    def save(self, path, recorded=None):
+        """Save exact responses (path and query -> body) so a run can be replayed byte for byte"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "conversations": self.conversations,
+                "pages": self.pages,
+                "messages_per_conversation": self.messages_per_conversation,
+                "seed": self.seed,
+                "attachment_every": self.attachment_every,
+                "participants_per_conversation": self.participants_per_conversation,
+                "now": self.now.isoformat(),
+                "responses": recorded or {}
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        fixture = cls(data['conversations'], data['pages'], data['messages_per_conversation'], data['seed'], datetime.fromisoformat(data['now']), data.get('attachment_every', 0),
+                      data.get('participants_per_conversation', 1))
+        fixture.recorded = data.get('responses') or None
+        return fixture
+
+class MockGraphServer:
+    """Local stand-in for graph.facebook.com serving a MockGraphFixture
+
+    latency is added to every response (seconds, plus up to jitter), error_rate injects transient
+    Graph errors, and rate_limit (requests per second) answers with Graph's request limit error once exceeded.
+    """
+
+    def __init__(self, fixture=None, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None, page_size_max=100, record=False):
+        self.fixture = fixture or MockGraphFixture()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.page_size_max = page_size_max
+        self.record = record
+        self.recorded = {}
+        self._random = random.Random(self.fixture.seed)
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_count = 0
+        self.stats = {'requests': 0, 'not_modified': 0, 'errors_injected': 0, 'rate_limited': 0, 'messages_sent': 0, 'messages_tagged': 0, 'media_bytes': 0, 'by_endpoint': {}}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+        host, port = self._server.server_address[:2]
+        self.fixture.media_base_url = f"http://{host}:{port}/media"
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/{MOCK_GRAPH_VERSION}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-graph", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- request policy ----
+
+    def _count(self, endpoint):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['by_endpoint'][endpoint] = self.stats['by_endpoint'].get(endpoint, 0) + 1
+
+    def _rate_limited(self):
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= 1:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            if self._window_count > self.rate_limit:
+                self.stats['rate_limited'] += 1
+                return True
+            return False
+
+    def _inject_error(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            if self._random.random() < self.error_rate:
+                self.stats['errors_injected'] += 1
+                return True
+            return False
+
+    # ---- routing ----
+
+    def dispatch(self, method, path, query, form=None):
+        """Return (status, body) for one Graph call; also used for each item of a batch request"""
+        fixture = self.fixture
+        path = self._normalize(path)
+        token = query.get('access_token') or (form or {}).get('access_token')
+
+        if method == 'POST' and path == '/':
+            return 200, self._batch(form or {}, token)
+        if path == '/oauth/access_token':
+            self._count('oauth')
+            return 200, {"access_token": MOCK_USER_TOKEN, "token_type": "bearer", "expires_in": 60 * 24 * 3600}
+        if not token:
+            return 400, {"error": {"message": "An active access token must be used", "type": "OAuthException", "code": 2500}}
+
+        if method == 'POST' and path == '/me/messages':
+            self._count('send')
+            with self._lock:
+                self.stats['messages_sent'] += 1
+                sent = self.stats['messages_sent']
+                # Sends outside the reply window go out with a message tag
+                if (form or {}).get('messaging_type') == 'MESSAGE_TAG':
+                    self.stats['messages_tagged'] += 1
+            recipient = json.loads((form or {}).get('recipient', '{}'))
+            return 200, {"recipient_id": recipient.get('id'), "message_id": f"m_sent_{sent}"}
+        if method != 'GET':
+            return 400, {"error": {"message": "Unsupported post request", "type": "GraphMethodException", "code": 100}}
+
+        if fixture.recorded and f"{path}?{self._query_key(query)}" in fixture.recorded:
+            self._count('recorded')
+            return 200, fixture.recorded[f"{path}?{self._query_key(query)}"]
+        if path == '/me':
+            self._count('me')
+            return 200, fixture.profile()
+        if path == '/me/accounts':
+            self._count('accounts')
+            return 200, {"data": fixture.page_list(), "paging": {"cursors": {"before": "0", "after": str(fixture.pages - 1)}}}
+        if path == '/' and query.get('ids'):
+            self._count('ids')
+            ids = query['ids'].split(',')
+            return 200, {pid: {"id": pid, "name": fixture.participant_name(pid)} for pid in ids if pid.isdigit()}
+
+        parts = path.strip('/').split('/')
+        if len(parts) == 2 and parts[1] == 'conversations':
+            self._count('conversations')
+            return self._conversations(parts[0], query)
+        if len(parts) == 1:
+            self._count('conversation')
+            location = fixture.parse_conversation_id(parts[0])
+            if location is None:
+                return 404, {"error": {"message": f"Unsupported get request. Object with ID '{parts[0]}' does not exist", "type": "GraphMethodException", "code": 100}}
+            limit = int(query.get('limit', 25))
+            return 200, {"id": parts[0], "messages": {"data": fixture.messages(*location, limit)}}
+        return 404, {"error": {"message": f"Unknown path {path}", "type": "GraphMethodException", "code": 100}}
+
+    def _conversations(self, page_id, query):
+        fixture = self.fixture
+        page_index = int(page_id) - MOCK_PAGE_ID_BASE if page_id.isdigit() else -1
+        if not 0 <= page_index < fixture.pages:
+            return 404, {"error": {"message": f"Page {page_id} does not exist", "type": "GraphMethodException", "code": 100}}
+        total = fixture.conversations_for_page(page_index)
+        limit = min(int(query.get('limit', 25)), self.page_size_max)
+        start = int(query['after']) + 1 if query.get('after') else 0
+        end = min(start + limit, total)
+        body = {"data": [fixture.conversation(page_index, i) for i in range(start, end)]}
+        if end > start:
+            body["paging"] = {"cursors": {"before": str(start), "after": str(end - 1)}}
+            if end < total:
+                body["paging"]["next"] = f"{self.url}/{page_id}/conversations?limit={limit}&after={end - 1}"
+        return 200, body
+
+    def _batch(self, form, token):
+        """Graph batch requests: a JSON list of {method, relative_url} answered with {code, headers, body} items"""
+        self._count('batch')
+        try:
+            items = json.loads(form.get('batch', '[]'))
+        except ValueError:
+            return {"error": {"message": "Invalid batch parameter", "type": "OAuthException", "code": 100}}
+        results = []
+        for item in items:
+            parts = urlsplit('/' + item.get('relative_url', '').lstrip('/'))
+            query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            query.setdefault('access_token', token)
+            status, body = self.dispatch(item.get('method', 'GET').upper(), parts.path, query, parse_qs_body(item.get('body', '')))
+            results.append({"code": status, "headers": [{"name": "Content-Type", "value": "application/json"}], "body": json.dumps(body)})
+        return results
+
+    @staticmethod
+    def _normalize(path):
+        prefix = f"/{MOCK_GRAPH_VERSION}"
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+        return '/' + path.strip('/')
+
+    @staticmethod
+    def _query_key(query):
+        return '&'.join(f"{k}={v}" for k, v in sorted(query.items()) if k != 'access_token')
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; with Nagle on, keep-alive clients stall on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _media(self, name):
+                """Attachment bodies, served like a CDN: outside the Graph API, no token, sent in chunks"""
+                server._count('media')
+                mime_type, body = server.fixture.media_body(name)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', mime_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                for offset in range(0, len(body), 64 * 1024):
+                    self.wfile.write(body[offset:offset + 64 * 1024])
+                with server._lock:
+                    server.stats['media_bytes'] += len(body)
+
+            def _respond(self, method):
+                parts = urlsplit(self.path)
+                if method == 'GET' and parts.path.startswith('/media/'):
+                    self._media(parts.path[len('/media/'):])
+                    return
+                query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                form = {}
+                if method == 'POST':
+                    length = int(self.headers.get('Content-Length') or 0)
+                    form = parse_qs_body(self.rfile.read(length).decode('utf-8'))
+
+                if server.latency or server.jitter:
+                    time.sleep(server.latency + server._random.random() * server.jitter)
+                if server._rate_limited():
+                    status, body = 400, {"error": RATE_LIMIT_ERROR}
+                elif server._inject_error():
+                    status, body = 500, {"error": TRANSIENT_ERROR}
+                else:
+                    status, body = server.dispatch(method, parts.path, query, form)
+
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                etag = '"' + hashlib.md5(payload).hexdigest() + '"'
+                if method == 'GET' and status == 200:
+                    if server.record:
+                        key = f"{server._normalize(parts.path)}?{server._query_key(query)}"
+                        with server._lock:
+                            server.recorded[key] = body
+                    if self.headers.get('If-None-Match') == etag:
+                        with server._lock:
+                            server.stats['not_modified'] += 1
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(payload)))
+                if status == 200:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                self._respond('POST')
+
+        return Handler
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+def parse_qs_body(body):
+    return {k: v[0] for k, v in parse_qs(body or '').items()}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a mock Graph API for offline development and benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--messages-per-conversation", type=int, default=5)
+    parser.add_argument("--attachment-every", type=int, default=0, help="give every Nth message an attachment")
+    parser.add_argument("--participants-per-conversation", type=int, default=1, help="above 1, every conversation is a group thread")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per second before Graph's limit error")
+    parser.add_argument("--fixture", help="replay a recorded fixture file")
+    parser.add_argument("--record", help="on exit, save every GET response served to this fixture file")
+    args = parser.parse_args()
+
+    fixture = MockGraphFixture.load(args.fixture) if args.fixture else MockGraphFixture(
+        args.conversations, args.pages, args.messages_per_conversation, attachment_every=args.attachment_every,
+        participants_per_conversation=args.participants_per_conversation
+    )
+    mock = MockGraphServer(fixture, port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, rate_limit=args.rate_limit, record=bool(args.record))
+    print(f"🧪 Mock Graph API at {mock.url}")
+    print(f"   Run the app against it with FB_GRAPH_BASE_URL={mock.url}")
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Mock Graph API shutting down...")
+        if args.record:
+            fixture.save(args.record, mock.recorded)
+            print(f"💾 Recorded {len(mock.recorded)} responses to {args.record}")
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from facebook_config import PARTICIPANT_DIRECTORY_FILE, PARTICIPANT_CACHE_TTL_SECONDS, PARTICIPANT_CACHE_MAX_ENTRIES
+
+class ParticipantDirectory:
+    """Participant id to name cache with TTL and LRU eviction, persisted between runs"""
+
+    def __init__(self, path=PARTICIPANT_DIRECTORY_FILE, ttl=PARTICIPANT_CACHE_TTL_SECONDS, max_entries=PARTICIPANT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def get(self, participant_id, allow_stale=False):
+        """Return the cached name, or None if unknown or expired"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(participant_id)
+            if not entry:
+                return None
+            if not allow_stale and time.time() - entry['updated_at'] > self.ttl:
+                return None
+            self._entries.move_to_end(participant_id)
+            return entry['name']
+
+    def set(self, participant_id, name):
+        """Store a participant name, evicting the least recently used entries when full"""
+        if not participant_id or not name:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(participant_id)
+            if entry and entry['name'] == name and time.time() - entry['updated_at'] < self.ttl / 2:
+                # Fresh enough already, only refresh the LRU position
+                self._entries.move_to_end(participant_id)
+                return
+            self._entries[participant_id] = {'name': name, 'updated_at': time.time()}
+            self._entries.move_to_end(participant_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def update(self, names):
+        """Store several participant names from an id to name mapping"""
+        for participant_id, name in names.items():
+            self.set(participant_id, name)
+
+    def to_dict(self):
+        """Return all cached names as an id to name mapping"""
+        with self._lock:
+            self._ensure_loaded()
+            return {pid: entry['name'] for pid, entry in self._entries.items()}
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._entries)
+
+    def load(self):
+        """Load the directory from its JSON file, dropping expired entries"""
+        with self._lock:
+            self._loaded = True
+            try:
+                if os.path.exists(self.path):
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    now = time.time()
+                    # Entries are saved oldest first, so the LRU order survives restarts
+                    for participant_id, entry in data.get('participants', {}).items():
+                        if now - entry.get('updated_at', 0) <= self.ttl:
+                            self._entries[participant_id] = entry
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                return True
+            except Exception as e:
+                print(f"❌ Failed to load participant directory: {e}")
+                return False
+
+    def save(self):
+        """Save the directory to its JSON file if anything changed"""
+        with self._lock:
+            if not self._dirty:
+                return True
+            try:
+                data = {
+                    "total_participants": len(self._entries),
+                    "participants": dict(self._entries)
+                }
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+                return True
+            except Exception as e:
+                print(f"❌ Failed to save participant directory: {e}")
+                return False
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+def get_participant_directory(account_id):
+    """Return the participant directory of an account, persisted in its account directory"""
+    from facebook_accounts import account_file
+    
+    with _directories_lock:
+        if account_id not in _directories:
+            _directories[account_id] = ParticipantDirectory(path=account_file(account_id, PARTICIPANT_DIRECTORY_FILE))
+        return _directories[account_id]
@@ -0,0 +1,562 @@
+from datetime import datetime, timezone, timedelta
+from facebook_config import user_data, MESSAGE_WINDOW_HOURS
+from facebook_data_handlers import (
+    load_all_data, load_account, record_sent_message, record_received_message, count_messages,
+    conversation_participants, conversation_title, choose_recipient, replace_account_data
+)
+from facebook_messenger import FacebookMessenger
+from facebook_window_cache import window_cache, window_scheduler, parse_duration
+from facebook_startup import startup_state
+from facebook_accounts import account_registry, account_id_for, account_sync_lock
+from facebook_tokens import token_manager
+from facebook_graph_cache import graph_cache
+from facebook_tracing import tracer
+from facebook_attachments import attachment_store
+from facebook_events import event_bus, EVENT_TYPES
+from facebook_changes import get_change_log, record_sync, conversation_summary
+from facebook_json import dumps, response_cache
+from facebook_checkpoints import running_sync, running_syncs, has_sync_checkpoint
+from facebook_analytics import get_message_columns, drop_message_columns
+from facebook_export import EXPORT_FORMATS, iter_export_rows, export_chunks, parse_export_time, export_filename
+from facebook_metrics import (
+    metrics, messages_sent_total, graph_cache_size, store_accounts, store_conversations,
+    store_messages, store_participants, window_cache_entries, attachment_cache_bytes, response_cache_bytes
+)
+
+messenger = FacebookMessenger()
+
+DATA_LOAD_WAIT_SECONDS = 60
+MAX_CHANGES_PER_REQUEST = 10000
+
+def resolve_account(account_id=None):
+    """Return the id of the requested (or default) account once its data is loaded, or None"""
+    if startup_state.loading:
+        # Wait for a startup load in progress instead of racing it
+        startup_state.wait_for_data(DATA_LOAD_WAIT_SECONDS)
+    
+    resolved = account_registry.resolve(account_id)
+    if resolved is None:
+        if account_id is None and load_all_data():
+            return account_registry.resolve()
+        return None
+    if resolved in user_data:
+        return resolved
+    
+    # Other accounts are loaded on first access
+    return resolved if load_account(resolved) else None
+
+def find_conversation(account_id, conversation_id):
+    """Find a stored conversation of an account by its ID"""
+    for conv in user_data[account_id]['facebook_conversations']:
+        if conv['conversation_id'] == conversation_id:
+            return conv
+    return None
+
+def _login_required(account_id):
+    if account_id is None:
+        return {"error": "Please login first"}
+    return {"error": f"Unknown account {account_id}"}
+
+def complete_login(code):
+    """Exchange the OAuth code and setup complete user data with proper names"""
+    print("🔄 Exchanging code for token...")
+    token_data = messenger.get_access_token(code)
+    if not token_data:
+        return {"error": "Failed to get access token"}
+
+    access_token = token_data['access_token']
+
+    print("🔄 Getting long-lived token...")
+    long_token_data = messenger.get_long_lived_token(access_token, token_data.get('expires_in'))
+    long_lived_token = long_token_data['access_token']
+
+    profile = messenger.get_user_profile(long_lived_token)
+    account_id = account_id_for({'profile': profile})
+    
+    # One sync per account at a time; other accounts keep syncing and serving reads
+    sync_lock = account_sync_lock(account_id)
+    if not sync_lock.acquire(blocking=False):
+        return {"error": f"A sync is already running for account {account_id}"}
+    try:
+        # Known before the sync, so its Graph calls share cached responses with the previous login's
+        token_manager.register_user_token(account_id, long_lived_token, long_token_data.get('expires_in'))
+        # The previous sync's data is what the change feed diffs against
+        if account_id not in user_data and account_id in account_registry.account_ids():
+            load_account(account_id)
+        previous_data = user_data.get(account_id)
+        print("🔄 Setting up complete user data with proper participant names...")
+        sync_started = datetime.now().isoformat()
+        complete_data = messenger.setup_complete_user_data(long_lived_token, profile=profile)
+        # Messages sent or received while the sync ran are carried over into its data
+        replace_account_data(account_id, complete_data, sync_started)
+        record_sync(get_change_log(account_id), previous_data, complete_data)
+        drop_message_columns(account_id)
+        account_registry.register(account_id, profile, [page['id'] for page in complete_data['facebook_pages']])
+        token_manager.register_account(
+            account_id,
+            long_lived_token,
+            long_token_data.get('expires_in'),
+            {page['id']: page['access_token'] for page in complete_data['facebook_pages']}
+        )
+    finally:
+        sync_lock.release()
+
+    total_messages = count_messages(complete_data)
+    total_participants = len(complete_data.get('participant_names', {}))
+
+    print(f"✅ Setup complete!")
+    return {
+        "message": "🎉 Facebook login successful with proper name handling!",
+        "account_id": account_id,
+        "long_lived_token": long_token_data['long_lived'],
+        "token_expires_at": token_manager.expires_at(account_id),
+        "facebook_conversations": len(complete_data['facebook_conversations']),
+        "total_messages_fetched": total_messages,
+        "participant_names_collected": total_participants,
+        "improvements": [
+            "✅ Participant names from conversation data",
+            "✅ Names properly stored in messages JSON",
+            "✅ Names displayed when sending messages",
+            "✅ Enhanced error handling throughout"
+        ]
+    }
+
+def get_conversations(account_id=None):
+    """Get an account's Facebook conversations with proper participant names"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+
+    conversations = user_data[resolved]['facebook_conversations']
+    messages_data = user_data[resolved]['facebook_messages']
+    formatted_conversations = []
+    now = datetime.now(timezone.utc)
+
+    for i, conv in enumerate(conversations, 1):
+        # The live window status, falling back to the values stored at sync time
+        window = window_cache.status(conv['conversation_id'], now, resolved)
+        can_send, hours_since = window[:2] if window else (conv.get('can_send_message', False), conv.get('hours_since_last_message', 999))
+        status = "✅ Can send" if can_send else f"⏰ Wait {hours_since:.1f}h"
+        conv_messages = messages_data.get(conv['conversation_id'], [])
+        participants = conversation_participants(conv)
+
+        formatted_conversations.append({
+            'number': i,
+            'conversation_id': conv['conversation_id'],
+            'title': conversation_title(conv),
+            'participant_name': conv['participant_name'],
+            'participant_email': conv.get('participant_email', 'Not available'),
+            'participant_id': conv['participant_id'],
+            'participants': participants,
+            'is_group': len(participants) > 1,
+            'page_name': conv['page_name'],
+            'message_count': len(conv_messages),
+            'status': status,
+            'can_send': can_send,
+            'window_expires_at': window[2].isoformat() if window and window[2] else None,
+            'access_token': conv['page_access_token']
+        })
+
+    return {
+        "platform": "📘 Facebook",
+        "account_id": resolved,
+        "total_conversations": len(formatted_conversations),
+        "note": "Participant names come from conversation data",
+        "conversations": formatted_conversations
+    }
+
+def get_messages(conversation_id, account_id=None):
+    """Get all messages for a specific conversation with proper names"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+
+    messages = user_data[resolved]['facebook_messages'].get(conversation_id, [])
+    if not messages:
+        return {"error": f"No messages found for conversation {conversation_id}"}
+
+    conv = find_conversation(resolved, conversation_id)
+    conv_name = conversation_title(conv) if conv else "Unknown"
+
+    return {
+        "conversation_id": conversation_id,
+        "participant_name": conv_name,
+        "participants": conversation_participants(conv) if conv else [],
+        "total_messages": len(messages),
+        "note": "Names come from conversation participant data",
+        "messages": messages
+    }
+
+def get_messages_json(conversation_id, account_id=None, encoding=None):
+    """get_messages as (JSON bytes, content encoding), reused until the conversation's messages change"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+    messages = user_data[resolved]['facebook_messages'].get(conversation_id)
+    if not messages:
+        return get_messages(conversation_id, resolved)
+    key = (resolved, 'messages', conversation_id)
+    return response_cache.get(key, messages, encoding) or response_cache.put(key, messages, dumps(get_messages(conversation_id, resolved)), encoding)
+
+def get_participants(account_id=None):
+    """Get all participant names collected from conversations"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+
+    participant_names_data = user_data[resolved].get('participant_names', {})
+
+    return {
+        "total_participants": len(participant_names_data),
+        "note": "Names collected from conversation participant data",
+        "participant_names": participant_names_data
+    }
+
+def get_participants_json(account_id=None, encoding=None):
+    """get_participants as (JSON bytes, content encoding), reused until a sync replaces the names"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+    names = user_data[resolved].get('participant_names', {})
+    key = (resolved, 'participants')
+    return response_cache.get(key, names, encoding) or response_cache.put(key, names, dumps(get_participants(resolved)), encoding)
+
+def get_attachment(attachment_id, account_id=None):
+    """Path and metadata of one of an account's cached attachments, downloading it again if it was evicted"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+    # Other accounts' attachments are reported as unknown, so ids can't be probed across accounts
+    if not attachment_store.owned_by(attachment_id, resolved):
+        return {"error": f"Unknown attachment {attachment_id}"}
+    path, info = attachment_store.open(attachment_id)
+    if info is None:
+        return {"error": f"Unknown attachment {attachment_id}"}
+    if path is None:
+        # Evicted or never downloaded; the source URL may have expired, in which case a new sync refreshes it
+        if attachment_store.download(attachment_id) is None:
+            return {"error": f"Attachment {attachment_id} is not cached and could not be downloaded"}
+        path, info = attachment_store.open(attachment_id)
+        if path is None:
+            return {"error": f"Attachment {attachment_id} is not cached and could not be downloaded"}
+    return {
+        "attachment_id": attachment_id,
+        "path": path,
+        "sha256": info['sha256'],
+        "name": info.get('name'),
+        "mime_type": info.get('mime_type') or "application/octet-stream",
+        "size": info['size']
+    }
+
+def send_message(conversation_id, message_text, account_id=None, recipient_id=None):
+    """Send Facebook message with proper participant name display
+
+    In a group thread the message goes to recipient_id, or else to the participant who wrote last.
+    """
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+
+    if not conversation_id or not message_text:
+        return {"error": "conversation_id and message are required"}
+
+    target_conv = find_conversation(resolved, conversation_id)
+    if not target_conv:
+        return {"error": f"Conversation ID {conversation_id} not found"}
+    recipient = choose_recipient(target_conv, user_data[resolved]['facebook_messages'].get(conversation_id, []), recipient_id)
+    if recipient is None:
+        return {"error": f"{recipient_id} is not a participant of conversation {conversation_id}"}
+
+    # Send message with participant name
+    success, result = messenger.send_facebook_message_with_templates(
+        conversation_id,
+        recipient['id'],
+        message_text,
+        target_conv['page_access_token'],
+        recipient['name'],  # Pass the participant name
+        target_conv['page_id'],
+        resolved
+    )
+
+    messages_sent_total.inc(result='success' if success else 'failure')
+    if success:
+        # Store the sent message right away so the conversation view reflects it
+        sent_message = record_sent_message(resolved, target_conv, result, message_text)
+        get_change_log(resolved).record('message', sent_message, conversation_id)
+        get_message_columns(resolved).append(target_conv, sent_message)
+        event_bus.publish('sent', sent_message, account_id=resolved, conversation_id=conversation_id, page_id=target_conv['page_id'])
+        return {
+            "success": True,
+            "platform": "📘 Facebook",
+            "message": f"Message sent to {recipient['name']}",
+            "participant_name": recipient['name'],
+            "participant_email": target_conv.get('participant_email', 'Not available'),
+            "recipient_id": recipient['id'],
+            "conversation_id": conversation_id,
+            "message_id": result,
+            "sent_at": sent_message['retrieved_at']
+        }
+    else:
+        return {
+            "success": False,
+            "platform": "📘 Facebook",
+            "error": result,
+            "conversation_id": conversation_id,
+            "participant_name": recipient['name'],
+            "recipient_id": recipient['id']
+        }
+
+def list_accounts():
+    """List known accounts with their pages and per-account data usage"""
+    accounts = []
+    for account_id in account_registry.account_ids():
+        info = account_registry.info(account_id)
+        accounts.append({
+            'account_id': account_id,
+            'name': info.get('name', 'Unknown'),
+            'pages': len(info.get('page_ids', [])),
+            'last_login': info.get('last_login'),
+            'loaded': account_id in user_data,
+            'token_expires_at': token_manager.expires_at(account_id),
+            'usage': info.get('usage', {})
+        })
+    
+    return {
+        "total_accounts": len(accounts),
+        "default_account_id": account_registry.resolve(),
+        "accounts": accounts
+    }
+
+def render_metrics():
+    """Refresh the store size gauges and render all metrics in the Prometheus text format"""
+    account_ids = list(user_data.keys())
+    store_accounts.set(len(account_ids))
+    for gauge in (store_conversations, store_messages, store_participants):
+        gauge.clear()
+    for account_id in account_ids:
+        account = user_data.get(account_id)
+        if account is None:
+            continue
+        store_conversations.set(len(account.get('facebook_conversations', [])), account_id=account_id)
+        store_messages.set(count_messages(account), account_id=account_id)
+        store_participants.set(len(account.get('participant_names', {})), account_id=account_id)
+    window_cache_entries.set(len(window_cache))
+
+    cache = graph_cache.snapshot()
+    graph_cache_size.set(cache['entries'], unit='entries')
+    graph_cache_size.set(cache['bytes'], unit='bytes')
+    attachment_cache_bytes.set(attachment_store.snapshot()['bytes'])
+    responses = response_cache.snapshot()
+    response_cache_bytes.set(responses['bytes'])
+    return metrics.render()
+
+def export_messages(account_id=None, export_format='ndjson', since=None, until=None, page_id=None, conversation_id=None):
+    """Lazily encoded export of an account's messages; nothing is read from the store until the chunks are iterated"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+    try:
+        rows = iter_export_rows(resolved, user_data[resolved], parse_export_time(since), parse_export_time(until), page_id, conversation_id)
+        chunks = export_chunks(rows, export_format)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {
+        "chunks": chunks,
+        "media_type": EXPORT_FORMATS[export_format],
+        "filename": export_filename(resolved, export_format)
+    }
+
+def get_analytics(account_id=None, interval='day', since=None, until=None, page_id=None, conversation_id=None, top=20):
+    """Message volume histograms, reply time percentiles and inbound/outbound ratios of an account"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+    account = user_data[resolved]
+    columns = get_message_columns(resolved)
+    # Another worker may have stored messages these columns never saw
+    if columns.stale(account):
+        columns.build(account)
+    try:
+        since, until = parse_export_time(since), parse_export_time(until)
+        result = columns.summary(
+            interval, since.timestamp() if since else None, until.timestamp() if until else None,
+            page_id, conversation_id, max(0, top)
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+    result["account_id"] = resolved
+    return result
+
+def subscribe_events(types=None, account_id=None, conversation_id=None, page_id=None, loop=None):
+    """Subscribe to live events; types is a comma separated subset of EVENT_TYPES"""
+    type_list = [t.strip() for t in types.split(',') if t.strip()] if types else None
+    unknown = [t for t in type_list or [] if t not in EVENT_TYPES]
+    if unknown:
+        return {"error": f"Unknown event types {', '.join(unknown)}, expected some of {', '.join(EVENT_TYPES)}"}
+    return event_bus.subscribe(types=type_list, account_id=account_id, conversation_id=conversation_id, page_id=page_id, loop=loop)
+
+def get_expiring_windows(within='2h', limit=100, account_id=None):
+    """Conversations whose 24-hour window closes within the given duration, soonest first"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+    try:
+        within_seconds = parse_duration(within)
+    except ValueError as e:
+        return {"error": str(e)}
+    windows = window_cache.expiring(within_seconds, limit, account_id=resolved)
+    return {
+        "account_id": resolved,
+        "within_seconds": within_seconds,
+        "total": len(windows),
+        "windows": windows
+    }
+
+def close_expired_windows(expired):
+    """Window scheduler listener: mark conversations unsendable the moment their window closes"""
+    by_account = {}
+    for conversation_id, account_id, expires_at in expired:
+        by_account.setdefault(account_id, {})[conversation_id] = expires_at
+    for account_id, closed in by_account.items():
+        for conversation_id, expires_at in closed.items():
+            event_bus.publish('window', {'can_send': False, 'expired_at': expires_at.isoformat()}, account_id=account_id, conversation_id=conversation_id)
+        if account_id is None or account_id not in user_data:
+            continue
+
+        def flip(account):
+            for conv in account.get('facebook_conversations', []):
+                if conv['conversation_id'] in closed:
+                    conv['can_send_message'] = False
+                    conv['hours_since_last_message'] = float(MESSAGE_WINDOW_HOURS)
+
+        user_data.mutate(account_id, flip, conversation_ids=list(closed))
+        get_change_log(account_id).record_many([
+            ('window', {'can_send': False, 'expired_at': expires_at.isoformat()}, conversation_id)
+            for conversation_id, expires_at in closed.items()
+        ])
+
+window_scheduler.add_listener(close_expired_windows)
+
+def get_changes(since=0, limit=1000, account_id=None):
+    """Store changes after sequence number since; a reset means the client must refetch everything"""
+    resolved = resolve_account(account_id)
+    if resolved is None:
+        return _login_required(account_id)
+    result = get_change_log(resolved).since(since, max(1, min(limit, MAX_CHANGES_PER_REQUEST)))
+    result["account_id"] = resolved
+    if result["reset"]:
+        result["note"] = "Changes after this sequence number are no longer kept; refetch conversations and messages, then resume from latest_seq"
+    return result
+
+def get_sync_status():
+    """Running syncs with their progress, and accounts whose interrupted sync the next login resumes"""
+    running = [checkpoint.snapshot() for checkpoint in running_syncs()]
+    running_ids = {sync['account_id'] for sync in running}
+    return {
+        "running": running,
+        "resumable_account_ids": [
+            account_id for account_id in account_registry.account_ids()
+            if account_id not in running_ids and has_sync_checkpoint(account_id)
+        ]
+    }
+
+def _no_running_sync(account_id):
+    if account_id is None:
+        return {"error": "No sync is running; pass account_id when several are"}
+    return {"error": f"No sync is running for account {account_id}"}
+
+def get_partial_conversations(account_id=None):
+    """Conversations a running sync has fetched so far"""
+    checkpoint = running_sync(account_id)
+    if checkpoint is None:
+        return _no_running_sync(account_id)
+    conversations = checkpoint.conversations()
+    return {
+        "account_id": checkpoint.account_id,
+        "partial": True,
+        "sync": checkpoint.snapshot(),
+        "total_conversations": len(conversations),
+        "conversations": [
+            dict(conversation_summary(conv), has_messages=checkpoint.messages(conv['conversation_id']) is not None)
+            for conv in conversations
+        ]
+    }
+
+def get_partial_messages(conversation_id, account_id=None):
+    """Messages a running sync has fetched so far for one conversation"""
+    checkpoint = running_sync(account_id)
+    if checkpoint is None:
+        return _no_running_sync(account_id)
+    messages = checkpoint.messages(conversation_id)
+    if messages is None:
+        return {"error": f"The running sync has not fetched messages for conversation {conversation_id} yet"}
+    return {
+        "account_id": checkpoint.account_id,
+        "partial": True,
+        "conversation_id": conversation_id,
+        "total_messages": len(messages),
+        "messages": messages
+    }
+
+def get_sync_traces(limit=10, include_events=False):
+    """The last sync timelines with time per category and their slowest spans"""
+    return {
+        "tracing_enabled": tracer.enabled,
+        "note": "Enable with FB_TRACING=1; trace_file can be opened in chrome://tracing or ui.perfetto.dev",
+        "timelines": tracer.recent(limit, include_events)
+    }
+
+def handle_webhook_event(data):
+    """Process Messenger webhook events and keep message window statuses current"""
+    for entry in data.get('entry', []):
+        page_id = entry.get('id')
+        owner_id = account_registry.account_for_page(page_id)
+        account_id = resolve_account(owner_id) if owner_id else None
+        if account_id is None:
+            continue
+        conversations = user_data[account_id]['facebook_conversations']
+        for event in entry.get('messaging', []):
+            message = event.get('message')
+            if not message or message.get('is_echo'):
+                continue
+
+            sender_id = event.get('sender', {}).get('id')
+            timestamp = event.get('timestamp')
+            if not sender_id or not timestamp:
+                continue
+
+            # A new inbound message reopens the 24-hour window
+            message_time = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
+            for conv in conversations:
+                if conv['page_id'] != page_id:
+                    continue
+                sender = next((p for p in conversation_participants(conv) if p['id'] == sender_id), None)
+                if sender is not None:
+                    conv_id = conv['conversation_id']
+                    inbound = {
+                        'message_id': message.get('mid'),
+                        'message_text': message.get('text'),
+                        'created_time': message_time.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+                        'sender': {'id': sender_id, 'name': sender['name'], 'email': 'Not available (Facebook privacy policy)'},
+                        'attachments': [],
+                        'attachment_count': len(message.get('attachments', [])),
+                        'retrieved_at': datetime.now().isoformat()
+                    }
+                    # Stored first, like a send, so every feed entry and event is backed by stored data
+                    if not record_received_message(account_id, conv, inbound):
+                        continue
+                    previous = window_cache.get(conv_id, account_id)
+                    window_cache.record_last_message(conv_id, message_time, account_id)
+                    changes = [('message', inbound, conv_id)]
+                    get_message_columns(account_id).append(conv, inbound, message_time.timestamp())
+                    event_bus.publish('message', inbound, account_id=account_id, conversation_id=conv_id, page_id=page_id)
+                    if previous is None or not previous[0]:
+                        window = {
+                            'can_send': True,
+                            'expires_at': (message_time + timedelta(hours=MESSAGE_WINDOW_HOURS)).isoformat()
+                        }
+                        changes.append(('window', window, conv_id))
+                        event_bus.publish('window', window, account_id=account_id, conversation_id=conv_id, page_id=page_id)
+                    get_change_log(account_id).record_many(changes)
+
+    return {"status": "received"}
@@ -0,0 +1,90 @@
+import threading
+import time
+from datetime import datetime
+from facebook_data_handlers import load_all_data, LOAD_STEPS
+
+class StartupState:
+    """Tracks server boot and data loading so readiness can be signalled instead of slept on"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.server_ready = threading.Event()
+        self.data_ready = threading.Event()
+        self._lock = threading.Lock()
+        self._loading = False
+        self.current_step = None
+        self.completed_steps = []
+        self.data_loaded = False
+        self.error = None
+        self.load_seconds = None
+
+    def begin_loading(self):
+        """Mark the data load as started, returning False if it already was"""
+        with self._lock:
+            if self._loading or self.data_ready.is_set():
+                return False
+            self._loading = True
+            self.current_step = LOAD_STEPS[0]
+            return True
+
+    @property
+    def loading(self):
+        return self._loading and not self.data_ready.is_set()
+
+    def step(self, name):
+        """Record that a load step has finished"""
+        with self._lock:
+            self.completed_steps.append(name)
+            remaining = [s for s in LOAD_STEPS if s not in self.completed_steps]
+            self.current_step = remaining[0] if remaining else None
+
+    def finish_loading(self, loaded, error=None):
+        """Mark the data load as done and wake everyone waiting on it"""
+        with self._lock:
+            self.data_loaded = loaded
+            self.error = error
+            self.current_step = None
+            self.load_seconds = round(time.time() - self.started_at, 3)
+        self.data_ready.set()
+
+    def wait_for_data(self, timeout=None):
+        """Block until the data load has finished"""
+        return self.data_ready.wait(timeout)
+
+    def is_ready(self):
+        return self.server_ready.is_set() and self.data_ready.is_set()
+
+    def snapshot(self):
+        """Return the current startup progress"""
+        with self._lock:
+            return {
+                "ready": self.is_ready(),
+                "server_ready": self.server_ready.is_set(),
+                "data_ready": self.data_ready.is_set(),
+                "data_loaded": self.data_loaded,
+                "current_step": self.current_step,
+                "completed_steps": list(self.completed_steps),
+                "total_steps": len(LOAD_STEPS),
+                "load_seconds": self.load_seconds,
+                "error": self.error,
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                "checked_at": datetime.now().isoformat()
+            }
+
+startup_state = StartupState()
+
+def _load_data():
+    try:
+        loaded = load_all_data(progress=startup_state.step)
+        startup_state.finish_loading(loaded)
+    except Exception as e:
+        print(f"❌ Failed to load data on startup: {e}")
+        startup_state.finish_loading(False, str(e))
+
+def start_background_load():
+    """Load the JSON data in a background thread so it runs while the server boots"""
+    if not startup_state.begin_loading():
+        return None
+    loader = threading.Thread(target=_load_data, name="data-loader", daemon=True)
+    loader.start()
+    return loader
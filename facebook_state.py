@@ -0,0 +1,336 @@
+import copy
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+@contextmanager
+def locked_file(path):
+    """Hold an exclusive lock for writing path, across threads and worker processes"""
+    with _file_locks_guard:
+        thread_lock = _file_locks.setdefault(path, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Account fields kept per conversation: the SQLite backend stores each conversation and its messages as
+# one row, and a mutation copies only the conversations it names
+ACCOUNT_ROW_FIELDS = ('facebook_conversations', 'facebook_messages')
+
+def _working_copy(account, conversation_ids=None):
+    """A copy of an account for a mutation to edit, so readers keep a consistent view of the one they hold
+
+    With conversation_ids only those conversations and their message lists are copied, and the mutation
+    may change nothing else; without, everything but the message dicts is copied. Message dicts are
+    shared between versions and are replaced, never edited.
+    """
+    wanted = None if conversation_ids is None else set(conversation_ids)
+    if wanted is None:
+        working = copy.deepcopy({field: value for field, value in account.items() if field not in ACCOUNT_ROW_FIELDS})
+    else:
+        working = dict(account)
+    working['facebook_conversations'] = [
+        dict(conv) if wanted is None or conv['conversation_id'] in wanted else conv
+        for conv in account.get('facebook_conversations', [])
+    ]
+    working['facebook_messages'] = {
+        conversation_id: list(messages) if wanted is None or conversation_id in wanted else messages
+        for conversation_id, messages in account.get('facebook_messages', {}).items()
+    }
+    return working
+
+class InMemoryStateBackend:
+    """Default backend: a plain dict living in this process"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def mutate(self, key, fn, conversation_ids=None):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                return None
+            working = _working_copy(value, conversation_ids)
+            result = fn(working)
+            self._data[key] = working
+            return result
+
+class SQLiteStateBackend:
+    """Shared backend for several workers: SQLite in WAL mode with a per-process decoded cache
+
+    An account is one row of its other fields plus one row per conversation holding the conversation
+    and its messages, so a send or a window change writes a single conversation instead of the whole
+    account. Every write bumps the account's version and stamps the rows it wrote with it; a worker
+    whose cache is older decodes only the rows stamped since. Replacing an account moves its base
+    version, which tells the other workers to reload it completely.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS accounts (key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL,"
+            " base_version INTEGER NOT NULL, value_version INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations (key TEXT NOT NULL, conversation_id TEXT NOT NULL, position INTEGER NOT NULL,"
+            " value TEXT NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (key, conversation_id))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS conversations_version ON conversations (key, version)")
+        self._migrate_blobs()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, mode=""):
+        conn = self._connect()
+        conn.execute(f"BEGIN {mode}")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _migrate_blobs(self):
+        """Split accounts stored as one JSON blob (the former state table) into rows"""
+        with self._transaction("IMMEDIATE") as conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'state'").fetchone() is None:
+                return
+            for key, raw in conn.execute("SELECT key, value FROM state").fetchall():
+                self._write_all(conn, key, json.loads(raw))
+            conn.execute("DROP TABLE state")
+
+    def _load(self, conn, key):
+        """Bring the cached copy of an account up to date, decoding only rows written since; call inside a transaction"""
+        row = conn.execute("SELECT version, base_version, value_version FROM accounts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._cache_lock:
+                self._cache.pop(key, None)
+            return None
+        version, base_version, value_version = row
+        cached = self._cache.get(key)
+        if cached and cached['version'] == version:
+            return cached
+        if cached is None or cached['base_version'] != base_version:
+            cached, rows, since = None, {}, 0
+        else:
+            rows, since = dict(cached['rows']), cached['version']
+        if cached is None or cached['value_version'] != value_version:
+            fields = json.loads(conn.execute("SELECT value FROM accounts WHERE key = ?", (key,)).fetchone()[0])
+        else:
+            fields = cached['fields']
+        for conversation_id, position, raw in conn.execute(
+            "SELECT conversation_id, position, value FROM conversations WHERE key = ? AND version > ?", (key, since)
+        ):
+            item = json.loads(raw)
+            rows[conversation_id] = (position, item['conversation'], item['messages'])
+        entry = {
+            'version': version, 'base_version': base_version, 'value_version': value_version,
+            'fields': fields, 'rows': rows, 'account': _assemble(fields, rows)
+        }
+        with self._cache_lock:
+            self._cache[key] = entry
+        return entry
+
+    def get(self, key):
+        # Only the version is read on the hot path; rows are decoded again only after another worker's write
+        row = self._connect().execute("SELECT version FROM accounts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._cache_lock:
+                self._cache.pop(key, None)
+            return None
+        cached = self._cache.get(key)
+        if cached and cached['version'] == row[0]:
+            return cached['account']
+        with self._transaction() as conn:
+            entry = self._load(conn, key)
+        return entry['account'] if entry else None
+
+    def _write_all(self, conn, key, value):
+        """Replace every row of an account and return the cache entry for it"""
+        row = conn.execute("SELECT version FROM accounts WHERE key = ?", (key,)).fetchone()
+        version = row[0] + 1 if row else 1
+        fields = {field: item for field, item in value.items() if field not in ACCOUNT_ROW_FIELDS}
+        conn.execute(
+            "INSERT OR REPLACE INTO accounts (key, value, version, base_version, value_version) VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(fields, ensure_ascii=False), version, version, version)
+        )
+        conn.execute("DELETE FROM conversations WHERE key = ?", (key,))
+        rows = _rows(value)
+        conn.executemany(
+            "INSERT INTO conversations (key, conversation_id, position, value, version) VALUES (?, ?, ?, ?, ?)",
+            [(key, conversation_id, position, _encode_row(conv, messages), version) for conversation_id, (position, conv, messages) in rows.items()]
+        )
+        return {
+            'version': version, 'base_version': version, 'value_version': version,
+            'fields': fields, 'rows': rows, 'account': value
+        }
+
+    def set(self, key, value):
+        with self._transaction("IMMEDIATE") as conn:
+            entry = self._write_all(conn, key, value)
+        with self._cache_lock:
+            self._cache[key] = entry
+
+    def delete(self, key):
+        with self._transaction("IMMEDIATE") as conn:
+            conn.execute("DELETE FROM accounts WHERE key = ?", (key,))
+            conn.execute("DELETE FROM conversations WHERE key = ?", (key,))
+        with self._cache_lock:
+            self._cache.pop(key, None)
+
+    def keys(self):
+        return [row[0] for row in self._connect().execute("SELECT key FROM accounts")]
+
+    def mutate(self, key, fn, conversation_ids=None):
+        # BEGIN IMMEDIATE takes the write lock first, so concurrent workers cannot lose each other's updates
+        with self._transaction("IMMEDIATE") as conn:
+            current = self._load(conn, key)
+            if current is None:
+                return None
+            # fn edits a copy: threads reading the cached account never see a half-applied change
+            working = _working_copy(current['account'], conversation_ids)
+            result = fn(working)
+            if conversation_ids is None:
+                entry = self._write_all(conn, key, working)
+            else:
+                entry = self._write_conversations(conn, key, current, working, conversation_ids)
+        with self._cache_lock:
+            self._cache[key] = entry
+        return result
+
+    def _write_conversations(self, conn, key, current, working, conversation_ids):
+        """Write only the named conversations' rows of a mutated account"""
+        version = current['version'] + 1
+        rows = dict(current['rows'])
+        wanted = set(conversation_ids)
+        conversations = {conv['conversation_id']: conv for conv in working['facebook_conversations'] if conv['conversation_id'] in wanted}
+        next_position = max((position for position, _, _ in rows.values()), default=-1) + 1
+        for conversation_id in dict.fromkeys(conversation_ids):
+            conv = conversations.get(conversation_id)
+            messages = working['facebook_messages'].get(conversation_id)
+            if conv is None and messages is None:
+                continue
+            position = rows[conversation_id][0] if conversation_id in rows else next_position
+            next_position = max(next_position, position + 1)
+            rows[conversation_id] = (position, conv, messages)
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (key, conversation_id, position, value, version) VALUES (?, ?, ?, ?, ?)",
+                (key, conversation_id, position, _encode_row(conv, messages), version)
+            )
+        conn.execute("UPDATE accounts SET version = ? WHERE key = ?", (version, key))
+        # Assembled from the rows like other workers do, so a conversation added here is ordered the same everywhere
+        return dict(current, version=version, rows=rows, account=_assemble(current['fields'], rows))
+
+def _rows(account):
+    """conversation_id -> (position, conversation, messages) in the account's conversation order"""
+    rows = {}
+    for conv in account.get('facebook_conversations', []):
+        rows[conv['conversation_id']] = (len(rows), conv, None)
+    messages_by_conversation = account.get('facebook_messages', {})
+    for conversation_id, messages in messages_by_conversation.items():
+        position, conv, _ = rows.get(conversation_id, (len(rows), None, None))
+        rows[conversation_id] = (position, conv, messages)
+    return rows
+
+def _encode_row(conv, messages):
+    return json.dumps({'conversation': conv, 'messages': messages}, ensure_ascii=False)
+
+def _assemble(fields, rows):
+    """An account dict from its other fields and its conversation rows"""
+    account = dict(fields)
+    ordered = sorted(rows.items(), key=lambda item: item[1][0])
+    account['facebook_conversations'] = [conv for _, (_, conv, _) in ordered if conv is not None]
+    account['facebook_messages'] = {conversation_id: messages for conversation_id, (_, _, messages) in ordered if messages is not None}
+    return account
+
+class StateStore:
+    """Dict-like view of the state backend used for user_data"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getitem__(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.backend.set(key, value)
+
+    def __delitem__(self, key):
+        self.backend.delete(key)
+
+    def __contains__(self, key):
+        return self.backend.get(key) is not None
+
+    def __iter__(self):
+        return iter(self.backend.keys())
+
+    def __len__(self):
+        return len(self.backend.keys())
+
+    def get(self, key, default=None):
+        value = self.backend.get(key)
+        return default if value is None else value
+
+    def keys(self):
+        return self.backend.keys()
+
+    def mutate(self, key, fn, conversation_ids=None):
+        """Apply fn to a copy of the stored value and store the result
+
+        Pass conversation_ids when fn changes only those conversations and their messages; then only they
+        are copied and, with the SQLite backend, only their rows are written.
+        """
+        return self.backend.mutate(key, fn, conversation_ids)
+
+def create_state_store(backend='memory', db_path=None):
+    """Create the user_data store for the configured backend"""
+    if backend == 'sqlite':
+        return StateStore(SQLiteStateBackend(db_path or 'facebook_state.db'))
+    if backend != 'memory':
+        raise ValueError(f"Unknown state backend: {backend}")
+    return StateStore(InMemoryStateBackend())
@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+from facebook_config import TOKENS_FILE, TOKEN_REFRESH_MARGIN_SECONDS, TOKEN_REFRESH_CHECK_SECONDS
+from facebook_state import locked_file
+from facebook_accounts import account_file
+from facebook_logging import get_logger
+
+log = get_logger("tokens")
+
+# Graph API error code for expired, revoked or otherwise invalid access tokens
+INVALID_TOKEN_ERROR_CODE = 190
+
+class InvalidTokenError(Exception):
+    """Raised instead of calling Graph with a token already known to be invalid"""
+
+class TokenManager:
+    """Tracks user and page token expiry, refreshes them before they lapse and fails fast on invalid ones"""
+
+    def __init__(self, margin=TOKEN_REFRESH_MARGIN_SECONDS, interval=TOKEN_REFRESH_CHECK_SECONDS):
+        self.margin = margin
+        self.interval = interval
+        self._accounts = {}  # account_id -> {'user_token': {...}, 'page_tokens': {page_id: {...}}}
+        self._invalid = {}  # token -> error message
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self.messenger = None
+
+    # ---- bookkeeping ----
+
+    def register_account(self, account_id, user_token, expires_in=None, page_tokens=None, expires_at=None):
+        """Record an account's user token with its expiry, plus the page tokens derived from it"""
+        if expires_at is None and expires_in:
+            expires_at = time.time() + int(expires_in)
+        with self._lock:
+            self._accounts[account_id] = {
+                'user_token': {'token': user_token, 'expires_at': expires_at, 'updated_at': time.time()},
+                'page_tokens': {page_id: {'token': token, 'updated_at': time.time()} for page_id, token in (page_tokens or {}).items()}
+            }
+            for token in [user_token] + list((page_tokens or {}).values()):
+                self._invalid.pop(token, None)
+        self.save(account_id)
+
+    def register_user_token(self, account_id, user_token, expires_in=None):
+        """Record a new user token for an account before its sync, keeping the page tokens until fresh ones arrive"""
+        with self._lock:
+            info = self._accounts.get(account_id)
+            page_tokens = {page_id: page['token'] for page_id, page in info['page_tokens'].items()} if info else {}
+        self.register_account(account_id, user_token, expires_in, page_tokens)
+
+    def register_page_tokens(self, account_id, page_tokens):
+        """Record fresh page tokens of a registered account, e.g. the ones a sync gets from /me/accounts"""
+        with self._lock:
+            info = self._accounts.get(account_id)
+            if info is None:
+                return
+            for page_id, token in page_tokens.items():
+                info['page_tokens'][page_id] = {'token': token, 'updated_at': time.time()}
+                self._invalid.pop(token, None)
+        self.save(account_id)
+
+    def expires_at(self, account_id):
+        with self._lock:
+            info = self._accounts.get(account_id)
+            return info['user_token']['expires_at'] if info else None
+
+    def check(self, token):
+        """Raise InvalidTokenError if the token is already known to be invalid"""
+        if token and token in self._invalid:
+            raise InvalidTokenError(f"Access token is invalid: {self._invalid[token]}")
+
+    def mark_invalid(self, token, error_message):
+        """Remember an invalid token so later calls fail fast, and try to replace it in the background"""
+        if not token:
+            return
+        with self._lock:
+            self._invalid[token] = error_message
+        log.warning("🔐 Access token marked invalid: %s", error_message)
+        self._wake.set()
+
+    def is_invalid(self, token):
+        return token in self._invalid
+
+    def account_for_token(self, token):
+        with self._lock:
+            for account_id, info in self._accounts.items():
+                if info['user_token']['token'] == token:
+                    return account_id, None
+                for page_id, page in info['page_tokens'].items():
+                    if page['token'] == token:
+                        return account_id, page_id
+        return None, None
+
+    # ---- persistence ----
+
+    def save(self, account_id):
+        """Save an account's tokens next to its other JSON files"""
+        with self._lock:
+            info = self._accounts.get(account_id)
+            if not info:
+                return False
+            data = json.loads(json.dumps(info))
+        path = account_file(account_id, TOKENS_FILE)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with locked_file(path):
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2)
+            return True
+        except Exception as e:
+            log.error("❌ Failed to save tokens: %s", e)
+            return False
+
+    def load(self, account_id):
+        """Load an account's tokens saved by a previous run"""
+        path = account_file(account_id, TOKENS_FILE)
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                with self._lock:
+                    self._accounts[account_id] = data
+                # Tokens loaded after the refresh thread's last check may already be due
+                self._wake.set()
+                return True
+            return False
+        except Exception as e:
+            log.error("❌ Failed to load tokens: %s", e)
+            return False
+
+    # ---- refresh ----
+
+    def needs_refresh(self, account_id, now=None):
+        """True when the user token expires within the refresh margin or has been invalidated"""
+        now = now or time.time()
+        with self._lock:
+            info = self._accounts.get(account_id)
+            if not info or info.get('needs_login'):
+                return False
+            user_token = info['user_token']
+            if user_token['token'] in self._invalid:
+                return True
+            if any(page['token'] in self._invalid for page in info['page_tokens'].values()):
+                return True
+            return user_token['expires_at'] is not None and user_token['expires_at'] - now <= self.margin
+
+    def refresh_account(self, account_id):
+        """Exchange the user token for a fresh long-lived one and re-fetch the page tokens"""
+        with self._lock:
+            info = self._accounts.get(account_id)
+            if not info:
+                return False
+            user_token = info['user_token']['token']
+            expires_at = info['user_token']['expires_at']
+
+        if expires_at is not None and expires_at <= time.time():
+            log.warning("⚠️ User token for account %s has expired, a new login is required", account_id)
+            with self._lock:
+                self._invalid.setdefault(user_token, "expired")
+                info['needs_login'] = True
+            return False
+
+        if user_token not in self._invalid:
+            token_data = self.messenger.get_long_lived_token(user_token)
+            if token_data.get('long_lived'):
+                user_token = token_data['access_token']
+                expires_in = token_data.get('expires_in')
+                expires_at = time.time() + int(expires_in) if expires_in else None
+
+        page_tokens = self.messenger.get_page_tokens(user_token)
+        if page_tokens is None:
+            if user_token in self._invalid:
+                log.warning("⚠️ User token for account %s is invalid, a new login is required", account_id)
+                with self._lock:
+                    info['needs_login'] = True
+            return False
+
+        self.register_account(account_id, user_token, page_tokens=page_tokens, expires_at=expires_at)
+        apply_tokens_to_account(account_id, user_token, page_tokens)
+        log.info("🔄 Refreshed tokens for account %s (%d pages)", account_id, len(page_tokens))
+        return True
+
+    def run_due(self):
+        """Refresh every account whose tokens need it and return how many were attempted"""
+        attempted = 0
+        for account_id in list(self._accounts):
+            if self._stop.is_set():
+                break
+            if self.needs_refresh(account_id):
+                attempted += 1
+                try:
+                    self.refresh_account(account_id)
+                except Exception as e:
+                    log.warning("⚠️ Token refresh failed for account %s: %s", account_id, e)
+        return attempted
+
+    def _run(self):
+        # Check before the first wait: a token may already be inside the refresh margin at startup
+        while not self._stop.is_set():
+            self._wake.clear()
+            self.run_due()
+            self._wake.wait(self.interval)
+
+    def start(self, messenger):
+        """Start the background refresh thread"""
+        with self._lock:
+            self.messenger = messenger
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+def apply_tokens_to_account(account_id, user_token, page_tokens):
+    """Write refreshed tokens into the stored account data and its JSON file"""
+    from facebook_config import user_data
+    from facebook_data_handlers import save_facebook_data
+
+    def update(account):
+        account['access_token'] = user_token
+        for page in account.get('facebook_pages', []):
+            if page['id'] in page_tokens:
+                page['access_token'] = page_tokens[page['id']]
+        for conv in account.get('facebook_conversations', []):
+            if conv['page_id'] in page_tokens:
+                conv['page_access_token'] = page_tokens[conv['page_id']]
+        return account
+
+    account = user_data.mutate(account_id, update)
+    if account is not None:
+        save_facebook_data(account)
+
+token_manager = TokenManager()
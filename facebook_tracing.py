@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from facebook_config import TRACING_ENABLED, TRACE_DIR, TRACE_HISTORY, TRACE_MAX_SPANS
+from facebook_logging import get_logger
+
+log = get_logger("tracing")
+
+class Timeline:
+    """Spans recorded during one sync, exportable in the Chrome trace event format"""
+
+    def __init__(self, name, max_spans=TRACE_MAX_SPANS, **attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.max_spans = max_spans
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self.dropped_spans = 0
+        self.trace_file = None
+        self.thread_id = threading.get_ident()
+        self._lock = threading.Lock()
+
+    def add(self, name, category, start, end, args=None):
+        with self._lock:
+            if len(self.spans) >= self.max_spans:
+                self.dropped_spans += 1
+                return
+            self.spans.append((name, category, start, end, threading.get_ident(), args))
+
+    def summary(self):
+        """Time and span count per category, plus the slowest spans"""
+        by_category = {}
+        for name, category, start, end, _, _ in self.spans:
+            totals = by_category.setdefault(category, {'spans': 0, 'total_ms': 0.0})
+            totals['spans'] += 1
+            totals['total_ms'] += (end - start) * 1000
+        for totals in by_category.values():
+            totals['total_ms'] = round(totals['total_ms'], 2)
+        slowest = sorted(self.spans, key=lambda span: span[3] - span[2], reverse=True)[:10]
+        return {
+            "id": self.id,
+            "name": self.name,
+            "attrs": self.attrs,
+            "started_at": self.started_at,
+            "duration_ms": round(((self.end or time.perf_counter()) - self.start) * 1000, 2),
+            "spans": len(self.spans),
+            "dropped_spans": self.dropped_spans,
+            "by_category": by_category,
+            "slowest_spans": [
+                {"name": name, "category": category, "duration_ms": round((end - start) * 1000, 2), "args": args or {}}
+                for name, category, start, end, _, args in slowest
+            ],
+            "trace_file": self.trace_file
+        }
+
+    def trace_events(self):
+        """Complete ('X') events with microsecond offsets from the timeline start, as chrome://tracing and Perfetto expect"""
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": self.thread_id, "args": {"name": f"{self.name} {self.id}"}}]
+        events.append({
+            "name": self.name, "cat": "sync", "ph": "X", "pid": 1, "tid": self.thread_id,
+            "ts": 0, "dur": round(((self.end or time.perf_counter()) - self.start) * 1e6, 1), "args": self.attrs
+        })
+        for name, category, start, end, thread_id, args in self.spans:
+            events.append({
+                "name": name, "cat": category, "ph": "X", "pid": 1, "tid": thread_id,
+                "ts": round((start - self.start) * 1e6, 1), "dur": round((end - start) * 1e6, 1), "args": args or {}
+            })
+        return events
+
+class Tracer:
+    """Opt-in span recorder: spans are only kept while a timeline is open on the current thread"""
+
+    def __init__(self, enabled=TRACING_ENABLED, trace_dir=TRACE_DIR, history=TRACE_HISTORY):
+        self.enabled = enabled
+        self.trace_dir = trace_dir
+        self._timelines = deque(maxlen=history)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def current(self):
+        return getattr(self._local, 'timeline', None)
+
+    @contextmanager
+    def timeline(self, name, **attrs):
+        """Open a timeline for the with-block on this thread, then keep it in history and export it"""
+        if not self.enabled or self.current() is not None:
+            yield self.current()
+            return
+        timeline = Timeline(name, **attrs)
+        self._local.timeline = timeline
+        try:
+            yield timeline
+        finally:
+            timeline.end = time.perf_counter()
+            self._local.timeline = None
+            self.export(timeline)
+            with self._lock:
+                self._timelines.append(timeline)
+
+    @contextmanager
+    def bind(self, timeline):
+        """Make another thread's timeline current for the with-block, so pool workers record into the sync that queued them"""
+        previous = self.current()
+        self._local.timeline = timeline
+        try:
+            yield timeline
+        finally:
+            self._local.timeline = previous
+
+    def annotate(self, **attrs):
+        """Add attributes to the current timeline, e.g. the account id once the profile is known"""
+        timeline = self.current()
+        if timeline is not None:
+            timeline.attrs.update(attrs)
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """Time the with-block as a span of the current timeline; yields the span's args so callers can add results"""
+        timeline = self.current()
+        if timeline is None:
+            yield args
+            return
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            timeline.add(name, category, start, time.perf_counter(), args)
+
+    def record(self, name, category, start, end, **args):
+        """Add a span whose start and end (perf_counter seconds) were measured by the caller"""
+        timeline = self.current()
+        if timeline is not None:
+            timeline.add(name, category, start, end, args)
+
+    def export(self, timeline):
+        """Write a timeline as a Chrome trace file, loadable in chrome://tracing or ui.perfetto.dev"""
+        if not self.trace_dir:
+            return None
+        path = os.path.join(self.trace_dir, f"{timeline.name}-{timeline.started_at.replace(':', '').replace('.', '-')}-{timeline.id}.json")
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "traceEvents": timeline.trace_events(),
+                    "displayTimeUnit": "ms",
+                    "otherData": {"id": timeline.id, "started_at": timeline.started_at, "dropped_spans": timeline.dropped_spans, **timeline.attrs}
+                }, f, ensure_ascii=False, default=str)
+            timeline.trace_file = path
+            return path
+        except Exception as e:
+            log.warning("⚠️ Could not write trace file %s: %s", path, e)
+            return None
+
+    def recent(self, limit=10, include_events=False):
+        """The last limit timelines, newest first"""
+        with self._lock:
+            timelines = list(self._timelines)[-limit:][::-1] if limit > 0 else []
+        results = []
+        for timeline in timelines:
+            summary = timeline.summary()
+            if include_events:
+                summary["trace_events"] = timeline.trace_events()
+            results.append(summary)
+        return results
+
+tracer = Tracer()
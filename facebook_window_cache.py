@@ -0,0 +1,246 @@
+import heapq
+import threading
+from datetime import datetime, timezone, timedelta
+from facebook_config import MESSAGE_WINDOW_HOURS, WINDOW_CLOSED_RECHECK_SECONDS
+from facebook_logging import get_logger
+
+log = get_logger("windows")
+
+def parse_graph_time(created_time):
+    """Parse a Graph API timestamp such as 2024-01-01T12:00:00+0000"""
+    return datetime.fromisoformat(created_time.replace('Z', '+00:00'))
+
+def parse_duration(value):
+    """Seconds in a duration such as 90, 90s, 30m, 2h or 1d"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    text = str(value).strip().lower()
+    try:
+        if text and text[-1] in units:
+            return float(text[:-1]) * units[text[-1]]
+        return float(text)
+    except ValueError:
+        raise ValueError(f"Invalid duration {value!r}, expected e.g. 90s, 30m or 2h")
+
+class MessageWindowCache:
+    """Cache of the 24-hour messaging window status keyed by (account_id, conversation_id)
+
+    Two accounts managing the same page see the same conversation ids, so each keeps its own entry.
+    Open windows are also kept in a min-heap of (expires_at, key), so the windows closing next are
+    found without scanning every conversation. Superseded heap items are skipped lazily.
+    """
+
+    def __init__(self, window_hours=MESSAGE_WINDOW_HOURS, closed_ttl=WINDOW_CLOSED_RECHECK_SECONDS):
+        self.window_hours = window_hours
+        self.closed_ttl = closed_ttl
+        self._entries = {}
+        self._expiry_heap = []
+        self._lock = threading.Lock()
+        # Notified when a window opens that may close before the ones already scheduled
+        self.changed = threading.Condition(self._lock)
+
+    @staticmethod
+    def _key(conversation_id, account_id):
+        # '' rather than None, so heap items with equal expiry times still compare
+        return (account_id or '', conversation_id)
+
+    def record_last_message(self, conversation_id, last_message_time, account_id=None):
+        """Record the newest inbound message time seen for a conversation (from sync data or webhooks)"""
+        now = datetime.now(timezone.utc)
+        key = self._key(conversation_id, account_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['last_message_time'] and entry['last_message_time'] > last_message_time:
+                # An older message (e.g. a late webhook) must not shrink the window
+                entry['checked_at'] = now
+                return
+            expires_at = last_message_time + timedelta(hours=self.window_hours)
+            self._entries[key] = {
+                'last_message_time': last_message_time,
+                'expires_at': expires_at,
+                'checked_at': now
+            }
+            if entry and entry.get('expires_at') == expires_at:
+                return
+            if expires_at > now:
+                heapq.heappush(self._expiry_heap, (expires_at, key))
+                self._compact_heap()
+                if self._expiry_heap[0] == (expires_at, key):
+                    self.changed.notify_all()
+
+    def _compact_heap(self):
+        # Every reopened window leaves a superseded item behind; rebuild once they outnumber the live ones.
+        # Only the heap's current items are kept: windows pop_expired already handed out are no longer
+        # in it, while a window that closed but is not popped yet must still be reported once.
+        if len(self._expiry_heap) > 2 * len(self._entries) + 1024:
+            self._expiry_heap = [item for item in self._expiry_heap if self._is_current(item)]
+            heapq.heapify(self._expiry_heap)
+
+    def _is_current(self, item):
+        entry = self._entries.get(item[1])
+        return entry is not None and entry.get('expires_at') == item[0]
+
+    def record_no_messages(self, conversation_id, account_id=None):
+        """Record that a conversation has no messages, so the window is closed"""
+        with self._lock:
+            self._entries[self._key(conversation_id, account_id)] = {
+                'last_message_time': None,
+                'checked_at': datetime.now(timezone.utc)
+            }
+
+    def get(self, conversation_id, account_id=None):
+        """Return (can_send, hours_since) while the cached status is valid, otherwise None"""
+        with self._lock:
+            entry = self._entries.get(self._key(conversation_id, account_id))
+        if not entry:
+            return None
+
+        now = datetime.now(timezone.utc)
+        last_message_time = entry['last_message_time']
+        if last_message_time is not None:
+            hours_since = (now - last_message_time).total_seconds() / 3600
+            if hours_since <= self.window_hours:
+                # An open window stays valid until its 24-hour boundary
+                return True, hours_since
+        else:
+            hours_since = 999
+
+        # A closed window can reopen through a message we have not seen, so recheck it periodically
+        if (now - entry['checked_at']).total_seconds() < self.closed_ttl:
+            return False, hours_since
+        return None
+
+    def status(self, conversation_id, now=None, account_id=None):
+        """Return (can_send, hours_since, expires_at) from the recorded message time, or None if unknown
+
+        Unlike get(), this never asks for a recheck; it is what a conversation list shows.
+        """
+        with self._lock:
+            entry = self._entries.get(self._key(conversation_id, account_id))
+        if not entry:
+            return None
+        if entry['last_message_time'] is None:
+            return False, 999, None
+        now = now or datetime.now(timezone.utc)
+        return now < entry['expires_at'], (now - entry['last_message_time']).total_seconds() / 3600, entry['expires_at']
+
+    def expiring(self, within_seconds, limit=None, account_id=None):
+        """Open windows closing within within_seconds, soonest first
+
+        Walks the heap in order with a second, small heap of candidate positions, so k results cost
+        O(k log n) plus the superseded items passed on the way, never a scan of all conversations.
+        """
+        now = datetime.now(timezone.utc)
+        horizon = now + timedelta(seconds=within_seconds)
+        results = []
+        with self._lock:
+            heap = self._expiry_heap
+            candidates = [(heap[0], 0)] if heap else []
+            while candidates and (limit is None or len(results) < limit):
+                item, position = heapq.heappop(candidates)
+                if item[0] > horizon:
+                    break
+                for child in (2 * position + 1, 2 * position + 2):
+                    if child < len(heap):
+                        heapq.heappush(candidates, (heap[child], child))
+                if item[0] <= now or not self._is_current(item):
+                    continue
+                item_account_id, conversation_id = item[1]
+                if account_id and item_account_id != account_id:
+                    continue
+                results.append({
+                    'conversation_id': conversation_id,
+                    'account_id': item_account_id or None,
+                    'last_message_time': self._entries[item[1]]['last_message_time'].isoformat(),
+                    'expires_at': item[0].isoformat(),
+                    'seconds_left': round((item[0] - now).total_seconds(), 1)
+                })
+        return results
+
+    def pop_expired(self, now=None):
+        """Remove and return (conversation_id, account_id, expires_at) of every window that has closed by now"""
+        now = now or datetime.now(timezone.utc)
+        expired = []
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                item = heapq.heappop(self._expiry_heap)
+                if self._is_current(item):
+                    item_account_id, conversation_id = item[1]
+                    expired.append((conversation_id, item_account_id or None, item[0]))
+        return expired
+
+    def next_expiry(self):
+        """When the soonest open window closes, or None"""
+        with self._lock:
+            return self._expiry_heap[0][0] if self._expiry_heap else None
+
+    def invalidate(self, conversation_id, account_id=None):
+        """Drop the cached status for a conversation"""
+        with self._lock:
+            self._entries.pop(self._key(conversation_id, account_id), None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        """Drop all cached window statuses"""
+        with self._lock:
+            self._entries.clear()
+            self._expiry_heap = []
+
+class WindowExpiryScheduler:
+    """Background thread that sleeps until the next window closes and hands closed windows to listeners
+
+    Listeners get a list of (conversation_id, account_id, expires_at) right at the 24-hour boundary.
+    """
+
+    def __init__(self, cache, max_sleep_seconds=60):
+        self.cache = cache
+        self.max_sleep_seconds = max_sleep_seconds
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def run_due(self):
+        """Notify listeners of every window closed by now and return how many there were"""
+        expired = self.cache.pop_expired()
+        if expired:
+            for listener in self._listeners:
+                try:
+                    listener(expired)
+                except Exception as e:
+                    log.warning("⚠️ Window expiry listener failed: %s", e)
+        return len(expired)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_due()
+            with self.cache.changed:
+                if self._stop.is_set():
+                    break
+                next_expiry = self.cache._expiry_heap[0][0] if self.cache._expiry_heap else None
+                timeout = self.max_sleep_seconds
+                if next_expiry is not None:
+                    timeout = min(timeout, max(0.0, (next_expiry - datetime.now(timezone.utc)).total_seconds()))
+                if timeout > 0:
+                    # Woken early when a window opens that closes sooner, or on stop
+                    self.cache.changed.wait(timeout)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="window-expiry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self.cache.changed:
+            self.cache.changed.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+window_cache = MessageWindowCache()
+window_scheduler = WindowExpiryScheduler(window_cache)
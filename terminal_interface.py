@@ -1,191 +1,311 @@
-import requests
-import os
-from datetime import datetime
-from facebook_config import FACEBOOK_DATA_FILE, MESSAGES_DATA_FILE, USER_PROFILE_FILE
-from facebook_data_handlers import load_all_data
-
-def terminal_interface():
-    """Terminal interface with proper participant name display"""
-    print("\n" + "="*80)
-    print("🚀 ENHANCED FACEBOOK MESSENGER WITH PROPER NAME HANDLING")
-    print("✅ Participant names from conversation data")
-    print("✅ Names properly stored in messages JSON")
-    print("✅ Names displayed when sending messages")
-    print("="*80)
-    
-    load_all_data()
-    
-    while True:
-        try:
-            print("\n📋 MESSAGING OPTIONS:")
-            print("1. 📘 Send Facebook Message (with participant names)")
-            print("2. 📨 View Messages for Conversation")
-            print("3. 👥 View All Participant Names")
-            print("4. 📂 View JSON Files")
-            print("5. 🔄 Refresh Login")
-            print("6. Exit")
-            
-            choice = input("\n👉 Choose your option (1-6): ").strip()
-            
-            if choice == "1":
-                print("\n📘 FACEBOOK MESSAGING")
-                print("="*50)
-                
-                response = requests.get("http://localhost:8000/facebook/conversations")
-                if response.status_code == 200:
-                    data = response.json()
-                    if "error" in data:
-                        print(f"❌ {data['error']}")
-                        continue
-                    
-                    conversations = data.get('conversations', [])
-                    if not conversations:
-                        print("📭 No Facebook conversations found")
-                        continue
-                    
-                    print(f"\n💬 Available Facebook Conversations ({len(conversations)}):")
-                    for conv in conversations:
-                        print(f"{conv['number']:2d}. {conv['participant_name']} | {conv['page_name']} - {conv['status']}")
-                        print(f"     📨 {conv['message_count']} messages | ID: {conv['conversation_id']}")
-                        if not conv.get('can_send', False):
-                            print(f"     ⚠️ Outside messaging window - user needs to message you first")
-                    
-                    conv_selection = input(f"\n👉 Select conversation (1-{len(conversations)}) or enter conversation ID: ").strip()
-                    
-                    conversation_id = None
-                    selected_conv = None
-                    
-                    if conv_selection.isdigit() and 1 <= int(conv_selection) <= len(conversations):
-                        selected_conv = conversations[int(conv_selection) - 1]
-                        conversation_id = selected_conv['conversation_id']
-                    else:
-                        conversation_id = conv_selection
-                        # Find conversation by ID
-                        for conv in conversations:
-                            if conv['conversation_id'] == conversation_id:
-                                selected_conv = conv
-                                break
-                    
-                    if not selected_conv:
-                        print("❌ Conversation not found!")
-                        continue
-                    
-                    print(f"\n💬 Sending message to: {selected_conv['participant_name']}")
-                    message_text = input("📝 Enter your Facebook message: ").strip()
-                    
-                    if conversation_id and message_text:
-                        payload = {"conversation_id": conversation_id, "message": message_text}
-                        print(f"🔄 Sending Facebook message to {selected_conv['participant_name']}...")
-                        
-                        response = requests.post(
-                            "http://localhost:8000/facebook/send",
-                            json=payload,
-                            headers={"Content-Type": "application/json"}
-                        )
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            if result.get("success"):
-                                print(f"\n✅ SUCCESS: Message sent to {result.get('participant_name', 'Unknown')}")
-                                print(f"📨 Message ID: {result['message_id']}")
-                                print(f"🕒 Sent at: {result['sent_at']}")
-                            else:
-                                print(f"\n❌ FAILED: {result.get('error', 'Unknown error')}")
-                        else:
-                            print(f"\n❌ HTTP Error: {response.text}")
-                    else:
-                        print("❌ Both conversation ID and message are required!")
-                else:
-                    print("❌ Failed to get Facebook conversations")
-            
-            elif choice == "2":
-                print("\n📨 VIEW CONVERSATION MESSAGES")
-                print("="*50)
-                
-                response = requests.get("http://localhost:8000/facebook/conversations")
-                if response.status_code == 200:
-                    data = response.json()
-                    conversations = data.get('conversations', [])
-                    if not conversations:
-                        print("📭 No conversations found")
-                        continue
-                    
-                    print(f"\n💬 Select Conversation to View Messages:")
-                    for conv in conversations:
-                        print(f"{conv['number']:2d}. {conv['participant_name']} - {conv['message_count']} messages")
-                    
-                    conv_selection = input(f"\n👉 Select conversation (1-{len(conversations)}): ").strip()
-                    
-                    if conv_selection.isdigit() and 1 <= int(conv_selection) <= len(conversations):
-                        selected_conv = conversations[int(conv_selection) - 1]
-                        conv_id = selected_conv['conversation_id']
-                        
-                        response = requests.get(f"http://localhost:8000/facebook/messages/{conv_id}")
-                        if response.status_code == 200:
-                            msg_data = response.json()
-                            messages = msg_data.get('messages', [])
-                            participant_name = msg_data.get('participant_name', 'Unknown')
-                            
-                            print(f"\n📨 Messages for {participant_name} ({len(messages)} total):")
-                            print("-" * 80)
-                            
-                            for i, msg in enumerate(messages[-10:], 1):  # Show last 10 messages
-                                sender = msg.get('sender', {})
-                                print(f"{i}. {sender.get('name', 'Unknown')} - {msg.get('created_time')}")
-                                print(f"   💬 {msg.get('message_text')}")
-                                if msg.get('attachment_count', 0) > 0:
-                                    print(f"   📎 {msg.get('attachment_count')} attachments")
-                                print()
-                        else:
-                            print("❌ Failed to get messages")
-                else:
-                    print("❌ Failed to get conversations")
-            
-            elif choice == "3":
-                print("\n👥 ALL PARTICIPANT NAMES")
-                print("="*50)
-                
-                response = requests.get("http://localhost:8000/facebook/participants")
-                if response.status_code == 200:
-                    data = response.json()
-                    participants = data.get('participant_names', {})
-                    
-                    print(f"\n📊 Total Participants: {len(participants)}")
-                    print("✅ Names collected from conversation participant data")
-                    print("-" * 80)
-                    
-                    for participant_id, name in participants.items():
-                        print(f"👤 {name} (ID: {participant_id})")
-                else:
-                    print("❌ Failed to get participant names")
-            
-            elif choice == "4":
-                print("\n📂 JSON FILES INFORMATION:")
-                print("="*50)
-                
-                for filename in [FACEBOOK_DATA_FILE, MESSAGES_DATA_FILE, USER_PROFILE_FILE]:
-                    if os.path.exists(filename):
-                        stat = os.stat(filename)
-                        print(f"✅ {filename}")
-                        print(f"   Size: {round(stat.st_size / 1024, 2)} KB")
-                        print(f"   Modified: {datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')}")
-                    else:
-                        print(f"❌ {filename} - Not found")
-            
-            elif choice == "5":
-                print("🔄 To refresh your data and fetch new messages with participant names:")
-                print("   Visit: http://localhost:8000/login")
-                print("   This will fetch fresh conversations, messages, and participant names.")
-            
-            elif choice == "6":
-                print("👋 Goodbye!")
-                break
-            
-            else:
-                print("❌ Invalid choice. Please enter 1-6.")
-                
-        except KeyboardInterrupt:
-            print("\n👋 Goodbye!")
-            break
-        except Exception as e:
-            print(f"❌ Error: {str(e)}")
+import requests
+import json
+import os
+import sys
+from datetime import datetime
+from facebook_config import FACEBOOK_DATA_FILE, MESSAGES_DATA_FILE, USER_PROFILE_FILE
+from facebook_accounts import account_registry, account_file
+
+class LocalClient:
+    """Calls the service layer directly when the terminal runs in the server process"""
+
+    def __init__(self):
+        import facebook_service
+        self.service = facebook_service
+
+    def get_conversations(self):
+        return self.service.get_conversations()
+
+    def get_messages(self, conversation_id):
+        return self.service.get_messages(conversation_id)
+
+    def get_participants(self):
+        return self.service.get_participants()
+
+    def send_message(self, conversation_id, message_text, recipient_id=None):
+        return self.service.send_message(conversation_id, message_text, recipient_id=recipient_id)
+
+    def watch_events(self, types=None):
+        subscription = self.service.subscribe_events(types)
+        if isinstance(subscription, dict):
+            yield {'type': 'error', 'data': subscription}
+            return
+        try:
+            while True:
+                events, dropped = subscription.wait(1.0)
+                if dropped:
+                    yield {'type': 'overflow', 'data': {'dropped': dropped}}
+                yield from events
+        finally:
+            self.service.event_bus.unsubscribe(subscription)
+
+class HttpClient:
+    """Talks to a (possibly remote) server over its HTTP API"""
+
+    def __init__(self, base_url="http://localhost:8000"):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def _get(self, path):
+        response = self.session.get(f"{self.base_url}{path}", timeout=30)
+        if response.status_code != 200:
+            return {"error": f"HTTP {response.status_code}: {response.text}"}
+        return response.json()
+
+    def get_conversations(self):
+        return self._get("/facebook/conversations")
+
+    def get_messages(self, conversation_id):
+        return self._get(f"/facebook/messages/{conversation_id}")
+
+    def get_participants(self):
+        return self._get("/facebook/participants")
+
+    def send_message(self, conversation_id, message_text, recipient_id=None):
+        response = self.session.post(
+            f"{self.base_url}/facebook/send",
+            json={"conversation_id": conversation_id, "message": message_text, "recipient_id": recipient_id},
+            timeout=60
+        )
+        if response.status_code != 200:
+            return {"error": f"HTTP {response.status_code}: {response.text}"}
+        return response.json()
+
+    def watch_events(self, types=None):
+        """Read the server's /facebook/stream Server-Sent Events as dicts"""
+        params = {'types': types} if types else {}
+        with self.session.get(f"{self.base_url}/facebook/stream", params=params, stream=True, timeout=(10, None)) as response:
+            if response.status_code != 200:
+                yield {'type': 'error', 'data': {"error": f"HTTP {response.status_code}: {response.text}"}}
+                return
+            event_type, data = None, []
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith('event:'):
+                    event_type = line[6:].strip()
+                elif line.startswith('data:'):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    event = json.loads('\n'.join(data))
+                    yield event if 'type' in event else {'type': event_type, 'data': event}
+                    event_type, data = None, []
+
+def format_event(event):
+    """One line per live event for the terminal"""
+    data = event.get('data') or {}
+    if event['type'] == 'message':
+        return f"📨 {data.get('sender', {}).get('name', 'Unknown')}: {data.get('message_text')} ({event.get('conversation_id')})"
+    if event['type'] == 'sent':
+        return f"📤 Sent to {event.get('conversation_id')}: {data.get('message_text')}"
+    if event['type'] == 'window':
+        return f"{'✅ Window open' if data.get('can_send') else '⏰ Window closed'} for {event.get('conversation_id')}"
+    if event['type'] == 'sync':
+        if data.get('status') == 'progress':
+            return f"🔄 Sync: {data.get('conversations_done')}/{data.get('conversations_total')} conversations, {data.get('messages')} messages"
+        if data.get('status') == 'phase':
+            return f"🔄 Sync phase {data.get('phase')} done in {data.get('seconds')}s"
+        return f"🔄 Sync {data.get('status')}"
+    if event['type'] == 'overflow':
+        return f"⚠️ Missed {data.get('dropped')} events - refresh the views you rely on"
+    return f"❌ {data.get('error', data)}"
+
+def terminal_interface(client=None):
+    """Terminal interface with proper participant name display"""
+    if client is None:
+        client = LocalClient()
+    
+    print("\n" + "="*80)
+    print("🚀 ENHANCED FACEBOOK MESSENGER WITH PROPER NAME HANDLING")
+    print("✅ Participant names from conversation data")
+    print("✅ Names properly stored in messages JSON")
+    print("✅ Names displayed when sending messages")
+    print("="*80)
+    
+    while True:
+        try:
+            print("\n📋 MESSAGING OPTIONS:")
+            print("1. 📘 Send Facebook Message (with participant names)")
+            print("2. 📨 View Messages for Conversation")
+            print("3. 👥 View All Participant Names")
+            print("4. 📂 View JSON Files")
+            print("5. 🔄 Refresh Login")
+            print("6. 📡 Watch Live Events")
+            print("7. Exit")
+            
+            choice = input("\n👉 Choose your option (1-7): ").strip()
+            
+            if choice == "1":
+                print("\n📘 FACEBOOK MESSAGING")
+                print("="*50)
+                
+                data = client.get_conversations()
+                if "error" not in data:
+                    conversations = data.get('conversations', [])
+                    if not conversations:
+                        print("📭 No Facebook conversations found")
+                        continue
+                    
+                    print(f"\n💬 Available Facebook Conversations ({len(conversations)}):")
+                    for conv in conversations:
+                        print(f"{conv['number']:2d}. {conv['title']} | {conv['page_name']} - {conv['status']}")
+                        print(f"     📨 {conv['message_count']} messages | ID: {conv['conversation_id']}")
+                        if not conv.get('can_send', False):
+                            print(f"     ⚠️ Outside messaging window - user needs to message you first")
+                    
+                    conv_selection = input(f"\n👉 Select conversation (1-{len(conversations)}) or enter conversation ID: ").strip()
+                    
+                    conversation_id = None
+                    selected_conv = None
+                    
+                    if conv_selection.isdigit() and 1 <= int(conv_selection) <= len(conversations):
+                        selected_conv = conversations[int(conv_selection) - 1]
+                        conversation_id = selected_conv['conversation_id']
+                    else:
+                        conversation_id = conv_selection
+                        # Find conversation by ID
+                        for conv in conversations:
+                            if conv['conversation_id'] == conversation_id:
+                                selected_conv = conv
+                                break
+                    
+                    if not selected_conv:
+                        print("❌ Conversation not found!")
+                        continue
+                    
+                    recipient_id = None
+                    if selected_conv.get('is_group'):
+                        # The Send API reaches one person; by default whoever wrote last
+                        print(f"\n👥 Group conversation with {selected_conv['title']}:")
+                        for n, participant in enumerate(selected_conv['participants'], 1):
+                            print(f"{n:2d}. {participant['name']} (ID: {participant['id']})")
+                        recipient_selection = input(f"👉 Select recipient (1-{len(selected_conv['participants'])}) or press Enter for whoever wrote last: ").strip()
+                        if recipient_selection.isdigit() and 1 <= int(recipient_selection) <= len(selected_conv['participants']):
+                            recipient_id = selected_conv['participants'][int(recipient_selection) - 1]['id']
+                    
+                    print(f"\n💬 Sending message to: {selected_conv['title']}")
+                    message_text = input("📝 Enter your Facebook message: ").strip()
+                    
+                    if conversation_id and message_text:
+                        print(f"🔄 Sending Facebook message to {selected_conv['title']}...")
+                        
+                        result = client.send_message(conversation_id, message_text, recipient_id)
+                        if result.get("success"):
+                            print(f"\n✅ SUCCESS: Message sent to {result.get('participant_name', 'Unknown')}")
+                            print(f"📨 Message ID: {result['message_id']}")
+                            print(f"🕒 Sent at: {result['sent_at']}")
+                        else:
+                            print(f"\n❌ FAILED: {result.get('error', 'Unknown error')}")
+                    else:
+                        print("❌ Both conversation ID and message are required!")
+                else:
+                    print(f"❌ {data['error']}")
+            
+            elif choice == "2":
+                print("\n📨 VIEW CONVERSATION MESSAGES")
+                print("="*50)
+                
+                data = client.get_conversations()
+                if "error" not in data:
+                    conversations = data.get('conversations', [])
+                    if not conversations:
+                        print("📭 No conversations found")
+                        continue
+                    
+                    print(f"\n💬 Select Conversation to View Messages:")
+                    for conv in conversations:
+                        print(f"{conv['number']:2d}. {conv['title']} - {conv['message_count']} messages")
+                    
+                    conv_selection = input(f"\n👉 Select conversation (1-{len(conversations)}): ").strip()
+                    
+                    if conv_selection.isdigit() and 1 <= int(conv_selection) <= len(conversations):
+                        selected_conv = conversations[int(conv_selection) - 1]
+                        conv_id = selected_conv['conversation_id']
+                        
+                        msg_data = client.get_messages(conv_id)
+                        if "error" not in msg_data:
+                            messages = msg_data.get('messages', [])
+                            participant_name = msg_data.get('participant_name', 'Unknown')
+                            
+                            print(f"\n📨 Messages for {participant_name} ({len(messages)} total):")
+                            print("-" * 80)
+                            
+                            for i, msg in enumerate(messages[-10:], 1):  # Show last 10 messages
+                                sender = msg.get('sender', {})
+                                print(f"{i}. {sender.get('name', 'Unknown')} - {msg.get('created_time')}")
+                                print(f"   💬 {msg.get('message_text')}")
+                                if msg.get('attachment_count', 0) > 0:
+                                    print(f"   📎 {msg.get('attachment_count')} attachments")
+                                print()
+                        else:
+                            print(f"❌ Failed to get messages: {msg_data['error']}")
+                else:
+                    print(f"❌ Failed to get conversations: {data['error']}")
+            
+            elif choice == "3":
+                print("\n👥 ALL PARTICIPANT NAMES")
+                print("="*50)
+                
+                data = client.get_participants()
+                if "error" not in data:
+                    participants = data.get('participant_names', {})
+                    
+                    print(f"\n📊 Total Participants: {len(participants)}")
+                    print("✅ Names collected from conversation participant data")
+                    print("-" * 80)
+                    
+                    for participant_id, name in participants.items():
+                        print(f"👤 {name} (ID: {participant_id})")
+                else:
+                    print(f"❌ Failed to get participant names: {data['error']}")
+            
+            elif choice == "4":
+                print("\n📂 JSON FILES INFORMATION:")
+                print("="*50)
+                
+                account_id = account_registry.resolve()
+                if account_id is None:
+                    print("❌ No account data yet - please login first")
+                    continue
+                
+                for filename in [account_file(account_id, name) for name in (FACEBOOK_DATA_FILE, MESSAGES_DATA_FILE, USER_PROFILE_FILE)]:
+                    if os.path.exists(filename):
+                        stat = os.stat(filename)
+                        print(f"✅ {filename}")
+                        print(f"   Size: {round(stat.st_size / 1024, 2)} KB")
+                        print(f"   Modified: {datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')}")
+                    else:
+                        print(f"❌ {filename} - Not found")
+            
+            elif choice == "5":
+                print("🔄 To refresh your data and fetch new messages with participant names:")
+                print("   Visit: http://localhost:8000/login")
+                print("   This will fetch fresh conversations, messages, and participant names.")
+            
+            elif choice == "6":
+                print("\n📡 LIVE EVENTS (Ctrl+C to return to the menu)")
+                print("="*50)
+                types = input("👉 Event types (message,sent,window,sync) or Enter for all: ").strip() or None
+                try:
+                    for event in client.watch_events(types):
+                        print(format_event(event))
+                        if event['type'] == 'error':
+                            break
+                except KeyboardInterrupt:
+                    print()
+            
+            elif choice == "7":
+                print("👋 Goodbye!")
+                break
+            
+            else:
+                print("❌ Invalid choice. Please enter 1-7.")
+                
+        except KeyboardInterrupt:
+            print("\n👋 Goodbye!")
+            break
+        except Exception as e:
+            print(f"❌ Error: {str(e)}")
+
+if __name__ == "__main__":
+    # Remote use: python terminal_interface.py http://server:8000
+    server_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000"
+    terminal_interface(HttpClient(server_url))
@@ -0,0 +1,35 @@
+from facebook_accounts import AccountRegistry
+
+def test_default_account_set_by_another_worker_is_seen(tmp_path):
+    path = str(tmp_path / "accounts.json")
+    first, second = AccountRegistry(path), AccountRegistry(path)
+    first.register('a1', {'name': 'A'}, ['p1'])
+    assert second.resolve() == 'a1'
+
+    second.register('a2', {'name': 'B'}, ['p2'])
+    assert first.resolve() == 'a2'
+    assert first.account_for_page('p2') == 'a2'
+    assert sorted(first.account_ids()) == ['a1', 'a2']
+
+def test_concurrent_registrations_keep_each_other(tmp_path):
+    path = str(tmp_path / "accounts.json")
+    first, second = AccountRegistry(path), AccountRegistry(path)
+    first.load(), second.load()
+    first.register('a1', {'name': 'A'}, ['p1'])
+    # second has not read the file since, and must not write a1 away
+    second.register('a2', {'name': 'B'}, ['p2'], make_default=False)
+    assert sorted(AccountRegistry(path).account_ids()) == ['a1', 'a2']
+    assert AccountRegistry(path).resolve() == 'a1'
+
+def test_usage_survives_a_restart(tmp_path):
+    path = str(tmp_path / "accounts.json")
+    registry = AccountRegistry(path)
+    registry.register('a1', {'name': 'A'}, ['p1'])
+    registry.record_usage('a1', {'total_conversations': 3, 'total_messages': 10, 'total_participants': 2}, 1234)
+    usage = AccountRegistry(path).info('a1')['usage']
+    assert usage == {'conversations': 3, 'messages': 10, 'participants': 2, 'approx_bytes': 1234}
+
+def test_first_registration_creates_the_accounts_directory(tmp_path):
+    path = str(tmp_path / "accounts" / "accounts.json")
+    AccountRegistry(path).register('a1', {'name': 'A'}, ['p1'])
+    assert AccountRegistry(path).resolve() == 'a1'
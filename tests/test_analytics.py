@@ -0,0 +1,101 @@
+import pytest
+import facebook_analytics
+from facebook_analytics import MessageColumns
+
+def _message(message_id, created_time, sender_id):
+    return {'message_id': message_id, 'created_time': created_time, 'sender': {'id': sender_id}}
+
+def _account():
+    # Stored newest first, like a sync leaves them
+    return {
+        'facebook_conversations': [
+            {'conversation_id': 'c1', 'page_id': 'p1', 'page_name': 'Page 1', 'participant_name': 'Ann'},
+            {'conversation_id': 'c2', 'page_id': 'p2', 'page_name': 'Page 2', 'participant_name': 'Bob'}
+        ],
+        'facebook_messages': {
+            'c1': [
+                _message('m4', '2024-01-02T09:00:00+0000', 'p1'),
+                _message('m3', '2024-01-01T12:00:00+0000', 'p1'),
+                _message('m2', '2024-01-01T10:10:00+0000', 'u1'),
+                _message('m1', '2024-01-01T10:00:00+0000', 'u1')
+            ],
+            'c2': [
+                _message('m6', '2024-01-02T08:01:00+0000', 'p2'),
+                _message('m5', '2024-01-02T08:00:00+0000', 'u2')
+            ]
+        }
+    }
+
+def _columns(account=None):
+    columns = MessageColumns()
+    columns.build(account or _account())
+    return columns
+
+def _comparable(summary):
+    return {key: value for key, value in summary.items() if key not in ('vectorized', 'query_ms')}
+
+def test_summary_counts_directions_volume_and_reply_times():
+    summary = _columns().summary('day')
+
+    assert (summary['messages'], summary['inbound'], summary['outbound']) == (6, 3, 3)
+    assert summary['active_participants'] == 2
+    assert summary['buckets'] == ['2024-01-01T00:00:00+00:00', '2024-01-02T00:00:00+00:00']
+    assert summary['volume'] == [3, 3]
+    # Replies are timed from the first unanswered inbound message; a second reply in a row is not one
+    assert summary['response_times']['replies'] == 2
+    assert summary['response_times']['p50_seconds'] == (7200 + 60) / 2
+    assert [page['page_id'] for page in summary['pages']] == ['p1', 'p2']
+    assert [conv['conversation_id'] for conv in summary['conversations']['top']] == ['c1', 'c2']
+    assert summary['conversations']['top'][0]['participant_name'] == 'Ann'
+
+def test_filters_narrow_every_section():
+    columns = _columns()
+    by_page = columns.summary('day', page_id='p2')
+    assert by_page['messages'] == 2 and [page['page_id'] for page in by_page['pages']] == ['p2']
+    assert columns.summary('day', conversation_id='unknown')['messages'] == 0
+    since = columns.summary('hour', since=1704182400)  # 2024-01-02T08:00:00Z
+    assert since['messages'] == 3 and since['volume'] == [2, 1]
+
+def test_week_buckets_start_on_monday():
+    assert _columns().summary('week')['buckets'] == ['2024-01-01T00:00:00+00:00']
+
+def test_appended_messages_are_counted_and_keep_the_columns_fresh():
+    account = _account()
+    columns = _columns(account)
+    assert not columns.stale(account)
+
+    message = _message('m7', '2024-01-02T10:00:00+0000', 'u2')
+    account['facebook_messages']['c2'].insert(0, message)
+    assert columns.stale(account)
+    columns.append(account['facebook_conversations'][1], message)
+    assert not columns.stale(account)
+    assert columns.summary('day', conversation_id='c2')['inbound'] == 2
+
+    # A message another worker stored is noticed, and rebuilding picks it up
+    account['facebook_messages']['c1'].insert(0, _message('m8', '2024-01-02T11:00:00+0000', 'u1'))
+    assert columns.stale(account)
+    columns.build(account)
+    assert len(columns) == 8 and not columns.stale(account)
+
+def test_append_before_build_is_ignored():
+    columns = MessageColumns()
+    columns.append({'conversation_id': 'c1', 'page_id': 'p1'}, _message('m1', '2024-01-01T10:00:00+0000', 'u1'))
+    assert len(columns) == 0 and columns.stale(_account())
+
+def test_python_fallback_matches_numpy(monkeypatch):
+    if facebook_analytics.numpy is None:
+        pytest.skip("numpy is not installed")
+    vectorized = _columns().summary('hour', top=1)
+    monkeypatch.setattr(facebook_analytics, 'numpy', None)
+    fallback = _columns().summary('hour', top=1)
+    assert not fallback['vectorized']
+    assert _comparable(fallback) == _comparable(vectorized)
+
+def test_bad_intervals_are_rejected():
+    columns = _columns()
+    with pytest.raises(ValueError):
+        columns.summary('month')
+    account = _account()
+    account['facebook_messages']['c2'].insert(0, _message('m9', '2025-01-01T00:00:00+0000', 'u2'))
+    with pytest.raises(ValueError):
+        _columns(account).summary('hour')
@@ -0,0 +1,106 @@
+import os
+import threading
+import pytest
+from facebook_attachments import AttachmentDownloader, AttachmentStore, attachment_source_url
+from facebook_benchmark import bench_sync
+from facebook_mock_graph import MockGraphFixture, MockGraphServer, MOCK_MEDIA_KINDS
+
+@pytest.fixture(scope='module')
+def mock():
+    with MockGraphServer(MockGraphFixture()) as server:
+        yield server
+
+def _media_url(mock, name, n=0):
+    return f"{mock.fixture.media_base_url}/{name}?n={n}"
+
+def test_source_url_prefers_files_then_video_then_image():
+    assert attachment_source_url({'file_url': 'f', 'video_data': {'url': 'v'}, 'image_data': {'url': 'i'}}) == 'f'
+    assert attachment_source_url({'video_data': {'url': 'v'}, 'image_data': {'url': 'i'}}) == 'v'
+    assert attachment_source_url({'image_data': {'url': 'i'}}) == 'i'
+    assert attachment_source_url({}) is None
+
+def test_identical_content_is_stored_once_and_survives_a_reload(tmp_path, mock):
+    store = AttachmentStore(root=str(tmp_path))
+    store.register('a1', _media_url(mock, 'photo.jpg', 1), name='photo.jpg', account_id='111')
+    first = store.download('a1')
+    second = store.download('a2', _media_url(mock, 'photo.jpg', 2))
+    assert first == second
+    assert store.snapshot() == {'attachments': 2, 'blobs': 1, 'bytes': MOCK_MEDIA_KINDS[0][2], 'max_bytes': store.max_bytes}
+    # A cached blob is not downloaded again
+    requests_before = mock.snapshot()['by_endpoint']['media']
+    assert store.download('a1') == first
+    assert mock.snapshot()['by_endpoint']['media'] == requests_before
+
+    path, info = store.open('a1')
+    assert path == store.blob_path(first) and os.path.getsize(path) == MOCK_MEDIA_KINDS[0][2]
+    assert (info['mime_type'], info['name'], info['accounts']) == ('image/jpeg', 'photo.jpg', ['111'])
+    assert store.owned_by('a1', '111') and not store.owned_by('a2', '111')
+    assert not os.listdir(tmp_path / 'tmp')
+
+    assert store.save()
+    reloaded = AttachmentStore(root=str(tmp_path))
+    assert reloaded.info('a2')['cached'] and reloaded.snapshot()['blobs'] == 1
+    # Blobs missing from disk are dropped from the index, their entries stay so they can be fetched again
+    os.remove(path)
+    reloaded.load()
+    assert reloaded.snapshot()['blobs'] == 0 and reloaded.info('a1')['cached'] is False
+    assert reloaded.open('a1')[0] is None
+
+def test_least_recently_used_blobs_are_evicted(tmp_path, mock):
+    sizes = {name: size for name, _, size in MOCK_MEDIA_KINDS}
+    store = AttachmentStore(root=str(tmp_path), max_bytes=sizes['photo.jpg'] + sizes['invoice.pdf'] + 4096)
+    store.download('photo', _media_url(mock, 'photo.jpg'))
+    store.download('sticker', _media_url(mock, 'sticker.png'))
+    store.open('photo')
+    store.download('invoice', _media_url(mock, 'invoice.pdf'))
+
+    assert [store.info(name)['cached'] for name in ('photo', 'sticker', 'invoice')] == [True, False, True]
+    assert store.snapshot()['bytes'] == sizes['photo.jpg'] + sizes['invoice.pdf']
+    assert store.download('sticker') is not None and store.info('sticker')['cached']
+
+def test_failed_and_oversized_downloads_are_not_cached(tmp_path, mock):
+    store = AttachmentStore(root=str(tmp_path), max_file_bytes=64 * 1024)
+    assert store.download('missing', _media_url(mock, 'missing.bin')) is None
+    assert store.download('large', _media_url(mock, 'photo.jpg')) is None
+    assert store.download('unknown') is None
+    assert store.snapshot()['blobs'] == 0 and not os.listdir(tmp_path / 'tmp')
+    assert store.download('small', _media_url(mock, 'sticker.png')) is not None
+
+def test_concurrent_requests_share_one_download(tmp_path, mock):
+    store = AttachmentStore(root=str(tmp_path))
+    store.register('clip', _media_url(mock, 'clip.mp4'))
+    requests_before = mock.snapshot()['by_endpoint'].get('media', 0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.download('clip'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 1 and results[0] is not None
+    assert mock.snapshot()['by_endpoint']['media'] == requests_before + 1
+
+def test_downloader_fills_in_cache_fields(tmp_path, mock):
+    store = AttachmentStore(root=str(tmp_path))
+    attachments = [
+        {'attachment_id': 'p', 'url': _media_url(mock, 'photo.jpg'), 'mime_type': 'image/jpeg', 'name': 'photo.jpg'},
+        {'attachment_id': 'm', 'url': _media_url(mock, 'missing.bin')},
+        {'attachment_id': 'n', 'url': None}
+    ]
+    downloader = AttachmentDownloader(store, account_id='111', workers=2)
+    for attachment in attachments:
+        downloader.submit(attachment)
+    assert downloader.wait() == 1
+    assert [(a.get('cached'), a.get('sha256') is not None) for a in attachments] == [(True, True), (False, False), (None, False)]
+    assert os.path.exists(store.index_path) and store.owned_by('m', '111')
+
+    # Without workers attachments are only registered, to be downloaded on first request
+    lazy = AttachmentDownloader(AttachmentStore(root=str(tmp_path / 'lazy')), account_id='111', workers=0)
+    lazy.submit({'attachment_id': 'p', 'url': _media_url(mock, 'photo.jpg')})
+    assert lazy.wait() == 0 and lazy.store.info('p')['cached'] is False
+
+def test_sync_downloads_each_distinct_attachment_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    result = bench_sync(8, messages_per_conversation=4, attachment_every=2)
+    assert result['complete']
+    assert result['attachments'] == 16
+    assert result['attachment_blobs'] == len(MOCK_MEDIA_KINDS)
@@ -0,0 +1,59 @@
+import json
+import pytest
+from facebook_benchmark import (
+    api_server, bench_endpoints, bench_persistence, bench_sync, compare_reports, latency_stats, main, quiet
+)
+from facebook_config import user_data
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    for account_id in list(user_data.keys()):
+        del user_data[account_id]
+
+def test_latency_stats():
+    stats = latency_stats([0.001 * i for i in range(1, 101)], 2, 2.0)
+    assert (stats['requests'], stats['errors']) == (100, 2)
+    assert (stats['p50_ms'], stats['p99_ms'], stats['max_ms']) == (51.0, 100.0, 100.0)
+    assert stats['requests_per_second'] == 50.0
+    assert latency_stats([], 0, 0)['p50_ms'] is None
+
+def test_sync_benchmark_is_complete(workdir):
+    result = bench_sync(12, pages=2, messages_per_conversation=3)
+    assert result['complete']
+    assert result['synced_messages'] == 36
+    # Profile, page list, a conversations page per page, one request per conversation
+    assert result['graph_requests'] == 1 + 1 + 2 + 12
+
+def test_persistence_benchmark_reloads_everything(workdir):
+    with quiet():
+        result = bench_persistence(20, messages_per_conversation=4)
+    assert result['complete']
+    assert result['facebook_data_bytes'] > 0 and result['messages_data_bytes'] > 0
+
+def test_endpoint_benchmark_sends_inside_the_window(workdir):
+    with quiet(), api_server() as base_url:
+        result = bench_endpoints(base_url, 30, messages_per_conversation=4, requests_per_endpoint=20, concurrency=4)
+    assert {name: stats['errors'] for name, stats in result['endpoints'].items()} == {'conversations': 0, 'messages': 0, 'send': 0}
+    assert result['endpoints']['send']['fallbacks'] == 0
+    # The window is known from the stored messages, so each send is a single Graph call
+    assert result['graph_requests_by_endpoint'] == {'send': 20}
+
+def test_compare_reports(workdir):
+    def report(path, seconds, extra):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'results': [
+                {'benchmark': 'sync', 'conversations': 10, 'seconds': seconds, 'complete': True, 'graph': {'requests': 14}},
+                {'benchmark': 'sync', 'conversations': extra, 'seconds': 1.0}
+            ]}, f)
+    report('old.json', 2.0, 100)
+    report('new.json', 1.5, 1000)
+
+    rows = compare_reports('old.json', 'new.json')
+    assert rows == [
+        {'benchmark': 'sync', 'conversations': 10, 'metric': 'seconds', 'old': 2.0, 'new': 1.5, 'change_percent': -25.0},
+        {'benchmark': 'sync', 'conversations': 10, 'metric': 'graph.requests', 'old': 14, 'new': 14, 'change_percent': 0.0}
+    ]
+    with quiet():
+        assert main(['compare', 'old.json', 'new.json']) == rows
@@ -0,0 +1,98 @@
+import json
+from facebook_changes import ChangeLog, diff_account, record_sync
+
+def _seqs(result):
+    return [change['seq'] for change in result['changes']]
+
+def _account(messages_by_conversation):
+    return {
+        'facebook_conversations': [{'conversation_id': cid, 'page_id': 'p1', 'updated_time': '2024-01-01'} for cid in messages_by_conversation],
+        'facebook_messages': {
+            cid: [{'message_id': mid} for mid in message_ids] for cid, message_ids in messages_by_conversation.items()
+        }
+    }
+
+def test_sequence_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'changes.jsonl')
+    log = ChangeLog(path=path, retention=100)
+    assert [c['seq'] for c in log.record_many([('message', {'n': i}, 'c1') for i in range(3)])] == [1, 2, 3]
+
+    reopened = ChangeLog(path=path, retention=100)
+    assert reopened.record('message', {'n': 3}, 'c1')['seq'] == 4
+    assert _seqs(reopened.since(1)) == [2, 3, 4]
+
+def test_workers_sharing_a_file_hand_out_one_sequence(tmp_path):
+    path = str(tmp_path / 'changes.jsonl')
+    first = ChangeLog(path=path, retention=100)
+    second = ChangeLog(path=path, retention=100)
+
+    first.record('message', {'from': 'first'}, 'c1')
+    second.record('message', {'from': 'second'}, 'c1')
+    first.record_many([('message', {'from': 'first'}, 'c2'), ('window', {}, 'c2')])
+
+    for log in (first, second):
+        result = log.since(0)
+        assert _seqs(result) == [1, 2, 3, 4]
+        assert [change['data'].get('from') for change in result['changes']] == ['first', 'second', 'first', None]
+        assert result['latest_seq'] == 4 and not result['has_more']
+
+def test_reader_ignores_a_line_still_being_written(tmp_path):
+    path = str(tmp_path / 'changes.jsonl')
+    log = ChangeLog(path=path, retention=100)
+    log.record('message', {}, 'c1')
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'seq': 2, 'op': 'message', 'data': {}})[:10])
+    assert log.since(0)['latest_seq'] == 1
+
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'seq': 2, 'op': 'message', 'data': {}})[10:] + '\n')
+    assert _seqs(log.since(0)) == [1, 2]
+
+def test_other_worker_catches_up_after_compaction(tmp_path):
+    path = str(tmp_path / 'changes.jsonl')
+    writer = ChangeLog(path=path, retention=5)
+    reader = ChangeLog(path=path, retention=5)
+    writer.record_many([('message', {}, 'c1') for _ in range(4)])
+    assert reader.since(0)['latest_seq'] == 4
+
+    # Past twice the retention the writer rewrites the file, which gets a new inode
+    for _ in range(8):
+        writer.record('message', {}, 'c1')
+    with open(path, encoding='utf-8') as f:
+        assert len(f.readlines()) <= 2 * writer.retention
+
+    assert _seqs(reader.since(7)) == [8, 9, 10, 11, 12]
+    assert reader.record('message', {}, 'c1')['seq'] == 13
+    assert writer.since(12)['changes'][0]['seq'] == 13
+
+def test_since_pages_and_resets(tmp_path):
+    log = ChangeLog(path=str(tmp_path / 'changes.jsonl'), retention=5)
+    log.record_many([('message', {}, 'c1') for _ in range(8)])
+
+    page = log.since(3, limit=2)
+    assert _seqs(page) == [4, 5] and page['has_more'] and page['next_since'] == 5
+    assert _seqs(log.since(page['next_since'])) == [6, 7, 8]
+    # Older than the retained changes, or ahead of the log: the client must start over
+    assert log.since(1)['reset']
+    assert log.since(9)['reset']
+    assert log.since(8) == {'reset': False, 'latest_seq': 8, 'oldest_seq': 4, 'next_since': 8, 'has_more': False, 'changes': []}
+
+def test_diff_account_lists_new_messages_oldest_first_and_removals():
+    previous = _account({'c1': ['m1'], 'c2': ['x1']})
+    current = _account({'c1': ['m3', 'm2', 'm1'], 'c3': []})
+
+    entries = diff_account(previous, current)
+
+    assert [(op, cid) for op, _, cid in entries] == [
+        ('message', 'c1'), ('message', 'c1'), ('conversation', 'c3'), ('conversation_deleted', 'c2')
+    ]
+    assert [data['message_id'] for op, data, _ in entries if op == 'message'] == ['m2', 'm3']
+
+def test_record_sync_falls_back_to_a_snapshot(tmp_path):
+    log = ChangeLog(path=str(tmp_path / 'changes.jsonl'), retention=3)
+    current = _account({'c1': ['m1', 'm2']})
+
+    assert [c['op'] for c in record_sync(log, None, current)] == ['snapshot']
+    big = _account({'c1': ['m%d' % i for i in range(10)]})
+    assert [c['op'] for c in record_sync(log, current, big)] == ['snapshot']
+    assert [c['op'] for c in record_sync(log, big, _account({'c1': ['new'] + ['m%d' % i for i in range(10)]}))] == ['message']
@@ -0,0 +1,127 @@
+import json
+import os
+import time
+import pytest
+import facebook_messenger
+from facebook_checkpoints import SyncCheckpoint, has_sync_checkpoint
+from facebook_graph_cache import graph_cache
+from facebook_mock_graph import MockGraphFixture, MockGraphServer, MOCK_USER_ID, MOCK_USER_TOKEN
+
+def _conversation(conversation_id, participant_id):
+    return {'conversation_id': conversation_id, 'page_id': 'p1', 'participants': [{'id': participant_id, 'name': participant_id}]}
+
+def _interrupted_sync(path):
+    """A sync that journaled one page of conversations and one conversation's messages, then died"""
+    checkpoint = SyncCheckpoint('acct', path)
+    assert not checkpoint.start()
+    checkpoint.record_conversations('p1', [_conversation('c1', 'u1'), _conversation('c2', 'u2')], {'u1': 'Ann'}, 'cursor-2', False)
+    checkpoint.record_messages('c1', [{'message_id': 'm1'}])
+    checkpoint.close()
+    return checkpoint
+
+def test_resume_restores_pages_cursor_and_messages(tmp_path):
+    path = str(tmp_path / 'sync_checkpoint.jsonl')
+    first = _interrupted_sync(path)
+
+    resumed = SyncCheckpoint('acct', path)
+    assert resumed.start()
+    assert resumed.sync_id == first.sync_id
+    assert resumed.page_cursor('p1') == ('cursor-2', False)
+    assert resumed.page_cursor('p2') == (None, False)
+    assert [conv['conversation_id'] for conv in resumed.page_conversations('p1')] == ['c1', 'c2']
+    assert resumed.restored_participant_names() == {'u1': 'Ann'}
+    assert resumed.restored_messages('c1') == [{'message_id': 'm1'}]
+    assert resumed.restored_messages('c2') is None
+
+    # Steps taken after resuming are appended and restored by the next resume
+    resumed.record_conversations('p1', [_conversation('c3', 'u3')], {}, None, True)
+    resumed.record_messages('c2', [])
+    resumed.close()
+    again = SyncCheckpoint('acct', path)
+    assert again.start()
+    assert again.page_cursor('p1') == (None, True)
+    assert [conv['conversation_id'] for conv in again.conversations()] == ['c1', 'c2', 'c3']
+    assert again.restored_messages('c2') == []
+    assert again.snapshot()['restored_message_conversations'] == 2
+    again.close()
+
+def test_partial_last_line_is_dropped(tmp_path):
+    path = str(tmp_path / 'sync_checkpoint.jsonl')
+    _interrupted_sync(path)
+    with open(path, 'ab') as f:
+        f.write(b'{"type": "messages", "conversation_id": "c2", "mess')
+
+    resumed = SyncCheckpoint('acct', path)
+    assert resumed.start()
+    assert resumed.restored_messages('c2') is None
+    resumed.record_messages('c2', [{'message_id': 'm2'}])
+    resumed.close()
+    with open(path, 'rb') as f:
+        assert [json.loads(line)['type'] for line in f] == ['start', 'conversations', 'messages', 'messages']
+
+def test_group_thread_journaled_per_participant_is_merged(tmp_path):
+    path = str(tmp_path / 'sync_checkpoint.jsonl')
+    checkpoint = SyncCheckpoint('acct', path)
+    checkpoint.start()
+    checkpoint.record_conversations('p1', [_conversation('g1', 'u1'), _conversation('g1', 'u2')], {}, None, True)
+    checkpoint.close()
+
+    resumed = SyncCheckpoint('acct', path)
+    resumed.start()
+    [conv] = resumed.page_conversations('p1')
+    assert [p['id'] for p in conv['participants']] == ['u1', 'u2']
+    resumed.close()
+
+def test_old_checkpoint_is_discarded(tmp_path):
+    path = str(tmp_path / 'sync_checkpoint.jsonl')
+    first = _interrupted_sync(path)
+    with open(path, 'rb') as f:
+        lines = f.readlines()
+    start = json.loads(lines[0])
+    start['started_at'] = time.time() - 3600
+    with open(path, 'wb') as f:
+        f.write(json.dumps(start).encode() + b'\n' + b''.join(lines[1:]))
+
+    fresh = SyncCheckpoint('acct', path, max_age=60)
+    assert not fresh.start()
+    assert fresh.sync_id != first.sync_id
+    assert fresh.page_cursor('p1') == (None, False)
+    assert fresh.restored_messages('c1') is None
+    fresh.close()
+
+def test_finish_removes_the_journal(tmp_path):
+    path = str(tmp_path / 'sync_checkpoint.jsonl')
+    checkpoint = SyncCheckpoint('acct', path)
+    checkpoint.start()
+    checkpoint.finish()
+    assert not os.path.exists(path)
+    fresh = SyncCheckpoint('acct', path)
+    assert not fresh.start()
+    fresh.close()
+
+def test_sync_interrupted_before_saving_resumes_without_refetching(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    graph_cache.clear()
+    with MockGraphServer(MockGraphFixture(6, 1, 3)) as mock:
+        messenger = facebook_messenger.FacebookMessenger(base_url=mock.url)
+        messenger.conversation_delay = 0
+        save = facebook_messenger.save_facebook_data
+
+        def crash(data):
+            raise RuntimeError("process died")
+        monkeypatch.setattr(facebook_messenger, 'save_facebook_data', crash)
+        with pytest.raises(RuntimeError):
+            messenger.setup_complete_user_data(MOCK_USER_TOKEN)
+        first = dict(mock.snapshot()['by_endpoint'])
+        assert has_sync_checkpoint(MOCK_USER_ID)
+
+        monkeypatch.setattr(facebook_messenger, 'save_facebook_data', save)
+        graph_cache.clear()
+        data = messenger.setup_complete_user_data(MOCK_USER_TOKEN)
+        second = mock.snapshot()['by_endpoint']
+
+    # Only the profile and page list are asked again; conversations and messages come from the journal
+    assert second['conversations'] == first['conversations']
+    assert second['conversation'] == first['conversation']
+    assert sum(len(messages) for messages in data['facebook_messages'].values()) == 18
+    assert not has_sync_checkpoint(MOCK_USER_ID)
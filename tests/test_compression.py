@@ -0,0 +1,95 @@
+import asyncio
+import gzip
+import zlib
+import pytest
+from facebook_compression import (
+    CompressionMiddleware, StreamCompressor, compress, negotiate, is_compressible, brotli, zstandard, SUPPORTED_ENCODINGS
+)
+
+def _decompress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'br':
+        return brotli.decompress(data)
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+def _app(status=200, content_type=b'application/json', chunks=(b'{}',), headers=()):
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', content_type)] + list(headers)})
+        for i, chunk in enumerate(chunks):
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': i < len(chunks) - 1})
+    return app
+
+def _call(app, accept_encoding, min_bytes=100):
+    """Run one request through the middleware; returns (headers, body messages)"""
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': [(b'accept-encoding', accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, min_bytes=min_bytes)(scope, receive, send))
+    return dict(sent[0]['headers']), [message for message in sent[1:]]
+
+def test_negotiate_honours_weights_and_server_preference():
+    assert negotiate('') is None
+    assert negotiate('identity') is None
+    assert negotiate('gzip') == 'gzip'
+    assert negotiate('gzip;q=0.5, br;q=0.1') == 'gzip'
+    assert negotiate('gzip, deflate, br, zstd') == SUPPORTED_ENCODINGS[0]
+    assert negotiate('*;q=0.2, gzip;q=0') in set(SUPPORTED_ENCODINGS) - {'gzip'}
+    assert negotiate('gzip;q=0') is None
+    assert negotiate('gzip;q=oops') is None
+
+def test_compressible_types():
+    assert is_compressible('application/json; charset=utf-8')
+    assert is_compressible('text/CSV')
+    assert not is_compressible('image/png')
+    assert not is_compressible(None)
+
+@pytest.mark.parametrize('encoding', SUPPORTED_ENCODINGS)
+def test_stream_compressor_output_is_decodable_after_every_chunk(encoding):
+    compressor = StreamCompressor(encoding)
+    chunks = [b'{"n": %d}\n' % i * 50 for i in range(5)]
+    data = b''
+    for done, chunk in enumerate(chunks, 1):
+        data += compressor.compress(chunk)
+        # Flushed per chunk: what was sent so far already decodes to everything given so far
+        if encoding == 'gzip':
+            assert zlib.decompressobj(31).decompress(data) == b''.join(chunks[:done])
+    data += compressor.finish()
+    assert _decompress(data, encoding) == b''.join(chunks)
+    assert _decompress(compress(b''.join(chunks), encoding), encoding) == b''.join(chunks)
+
+def test_large_complete_body_is_compressed_with_its_new_length():
+    body = b'{"data": "' + b'x' * 5000 + b'"}'
+    headers, messages = _call(_app(chunks=(body,), headers=[(b'content-length', str(len(body)).encode())]), 'gzip')
+
+    assert headers[b'content-encoding'] == b'gzip'
+    assert headers[b'vary'] == b'Accept-Encoding'
+    assert int(headers[b'content-length']) == len(messages[0]['body']) < len(body)
+    assert gzip.decompress(messages[0]['body']) == body
+
+def test_small_and_binary_and_encoded_bodies_pass_through():
+    headers, messages = _call(_app(chunks=(b'{}',)), 'gzip')
+    assert b'content-encoding' not in headers and headers[b'vary'] == b'Accept-Encoding'
+    assert messages[0]['body'] == b'{}'
+
+    headers, messages = _call(_app(content_type=b'image/png', chunks=(b'\x89PNG' * 100,)), 'gzip')
+    assert b'content-encoding' not in headers and messages[0]['body'] == b'\x89PNG' * 100
+
+    cached = gzip.compress(b'{"cached": true}' * 100)
+    headers, messages = _call(_app(chunks=(cached,), headers=[(b'content-encoding', b'gzip')]), 'gzip')
+    assert messages[0]['body'] == cached
+
+def test_streamed_body_is_compressed_chunk_by_chunk():
+    chunks = [b'{"row": %d}\n' % i for i in range(10)]
+    headers, messages = _call(_app(content_type=b'application/x-ndjson', chunks=chunks), 'gzip', min_bytes=10 ** 6)
+
+    assert headers[b'content-encoding'] == b'gzip' and b'content-length' not in headers
+    assert len(messages) == len(chunks)
+    assert [message['more_body'] for message in messages] == [True] * 9 + [False]
+    assert gzip.decompress(b''.join(message['body'] for message in messages)) == b''.join(chunks)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+import requests
+import facebook_api_endpoints
+from facebook_benchmark import api_server, bench_sync, install_account, synthetic_account
+from facebook_config import user_data
+from facebook_data_handlers import conversation_participants
+from facebook_events import EventBus, Subscription, event_bus, format_sse
+from facebook_mock_graph import MockGraphFixture
+from facebook_service import handle_webhook_event, subscribe_events
+from facebook_window_cache import window_cache
+
+def test_subscriptions_only_receive_matching_events():
+    bus = EventBus()
+    assert bus.publish('message', {}) is None and bus.published == 0
+
+    everything = bus.subscribe()
+    sends = bus.subscribe(types=['sent'], account_id='a1')
+    conversation = bus.subscribe(conversation_id='t_1')
+    bus.publish('message', {'n': 1}, account_id='a1', conversation_id='t_1')
+    bus.publish('sent', {'n': 2}, account_id='a1', conversation_id='t_2')
+    bus.publish('sent', {'n': 3}, account_id='a2', conversation_id='t_1')
+
+    def received(subscription):
+        return [event['data']['n'] for event in subscription.drain()[0]]
+    assert (received(everything), received(sends), received(conversation)) == ([1, 2, 3], [2], [1, 3])
+    assert bus.snapshot() == {'subscribers': 3, 'published': 3, 'buffered': 0}
+
+    bus.unsubscribe(everything)
+    bus.publish('window', {'n': 4}, conversation_id='t_1')
+    assert everything.drain() == ([], 0) and received(conversation) == [4]
+
+def test_slow_readers_lose_the_oldest_events_and_are_told_how_many():
+    subscription = Subscription(buffer_size=2)
+    for n in range(5):
+        subscription.put({'id': n})
+    events, dropped = subscription.drain()
+    assert ([event['id'] for event in events], dropped) == ([3, 4], 3)
+    assert subscription.drain() == ([], 0)
+    assert subscription.delivered == 2
+
+def test_waiting_threads_wake_up_on_publish():
+    bus = EventBus()
+    subscription = bus.subscribe()
+    started = time.perf_counter()
+    assert subscription.wait(timeout=0.05) == ([], 0)
+    assert time.perf_counter() - started >= 0.05
+
+    threading.Timer(0.05, bus.publish, ('sync', {'status': 'started'})).start()
+    events, _ = subscription.wait(timeout=5)
+    assert [event['type'] for event in events] == ['sync']
+
+def test_async_readers_are_woken_from_other_threads():
+    bus = EventBus()
+
+    async def read():
+        subscription = bus.subscribe(loop=asyncio.get_running_loop())
+        assert await subscription.wait_async(0.05) == ([], 0)
+        threading.Timer(0.05, bus.publish, ('sent', {'text': 'hi'})).start()
+        started = time.perf_counter()
+        events, _ = await subscription.wait_async(5)
+        return events, time.perf_counter() - started
+
+    events, seconds = asyncio.run(read())
+    assert [event['data'] for event in events] == [{'text': 'hi'}] and seconds < 5
+
+def test_event_types_are_validated_and_formatted_as_sse():
+    assert 'error' in subscribe_events('message,typing')
+    subscription = subscribe_events(' sent , window ')
+    try:
+        assert subscription.types == {'sent', 'window'}
+    finally:
+        event_bus.unsubscribe(subscription)
+
+    event = {'id': 7, 'type': 'sent', 'data': {'text': 'héllo'}}
+    wire = format_sse(event)
+    assert wire.startswith("id: 7\nevent: sent\ndata: ") and wire.endswith("\n\n")
+    assert json.loads(wire.split('data: ', 1)[1]) == event
+
+@pytest.fixture
+def account(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    account_id = install_account(synthetic_account(MockGraphFixture(3, 1, 2)))
+    yield account_id
+    del user_data[account_id]
+
+def test_webhook_messages_publish_message_and_window_events(account):
+    conv = user_data[account]['facebook_conversations'][1]
+    sender = conversation_participants(conv)[0]
+    # With no window on record, the inbound message opens one
+    window_cache.clear()
+    delivery = {'entry': [{'id': conv['page_id'], 'messaging': [{
+        'sender': {'id': sender['id']}, 'timestamp': int(time.time() * 1000), 'message': {'mid': 'm_new', 'text': 'hello'}
+    }]}]}
+    subscription = event_bus.subscribe(account_id=account)
+    try:
+        handle_webhook_event(delivery)
+        # Facebook retries deliveries; a message already stored is not published again
+        handle_webhook_event(delivery)
+        events, _ = subscription.drain()
+    finally:
+        event_bus.unsubscribe(subscription)
+
+    assert [(event['type'], event['conversation_id']) for event in events] == [('message', conv['conversation_id']), ('window', conv['conversation_id'])]
+    assert events[0]['data']['message_text'] == 'hello' and events[1]['data']['can_send']
+
+def test_sync_progress_is_published(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    subscription = event_bus.subscribe(types=['sync'])
+    try:
+        assert bench_sync(3, messages_per_conversation=2)['complete']
+        events, dropped = subscription.drain()
+    finally:
+        event_bus.unsubscribe(subscription)
+        for account_id in list(user_data.keys()):
+            del user_data[account_id]
+
+    statuses = [event['data']['status'] for event in events]
+    assert dropped == 0 and statuses[0] == 'started' and 'phase' in statuses
+    assert events[-1]['data'] == {'status': 'finished', 'conversations': 3, 'messages': 6}
+
+def test_stream_endpoint_sends_filtered_events(account, monkeypatch):
+    monkeypatch.setattr(facebook_api_endpoints, 'EVENT_STREAM_HEARTBEAT_SECONDS', 0.2)
+    with api_server() as base_url:
+        assert requests.get(f"{base_url}/facebook/stream", params={'types': 'typing'}, timeout=10).status_code == 400
+        with requests.get(f"{base_url}/facebook/stream", params={'types': 'sent'}, stream=True, timeout=10) as response:
+            assert response.headers['content-type'].startswith('text/event-stream')
+            lines = response.iter_lines(decode_unicode=True)
+            assert next(lines) == 'retry: 3000'
+            event_bus.publish('message', {'text': 'not this one'}, account_id=account)
+            event_bus.publish('sent', {'text': 'this one'}, account_id=account)
+            data = next(line for line in lines if line.startswith('data: '))
+    assert json.loads(data[len('data: '):])['data'] == {'text': 'this one'}
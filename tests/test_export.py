@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+import pytest
+from facebook_export import EXPORT_COLUMNS, export_chunks, iter_export_rows, parse_export_time, pyarrow
+
+def _message(message_id, created_time, sender_id):
+    return {'message_id': message_id, 'created_time': created_time, 'sender': {'id': sender_id, 'name': sender_id},
+            'message_text': f'text of {message_id}, with "quotes"\nand a newline', 'attachment_count': 0}
+
+ACCOUNT = {
+    'facebook_conversations': [
+        {'conversation_id': 'c1', 'page_id': 'p1', 'page_name': 'Page 1', 'participant_id': 'u1', 'participant_name': 'Ann'},
+        {'conversation_id': 'c2', 'page_id': 'p2', 'page_name': 'Page 2', 'participant_id': 'u2', 'participant_name': 'Bob'}
+    ],
+    'facebook_messages': {
+        'c1': [_message('m2', '2024-01-02T10:00:00+0000', 'p1'), _message('m1', '2024-01-01T10:00:00+0000', 'u1')],
+        'c2': [_message('m3', '2024-01-03T10:00:00+0000', 'u2'), _message('m0', None, 'u2')]
+    }
+}
+
+def _ids(rows):
+    return [row['message_id'] for row in rows]
+
+def test_parse_export_time_formats():
+    assert parse_export_time(None) is None and parse_export_time('') is None
+    assert parse_export_time('1704067200') == datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert parse_export_time('2024-01-01') == datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert parse_export_time('2024-01-01T12:00:00+0200') == datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+    for bad in ('inf', '1e30', 'yesterday'):
+        with pytest.raises(ValueError):
+            parse_export_time(bad)
+
+def test_rows_are_filtered_by_time_page_and_conversation():
+    assert _ids(iter_export_rows('acct', ACCOUNT)) == ['m2', 'm1', 'm3', 'm0']
+    # A time filter skips messages without a created_time; until is exclusive
+    since, until = parse_export_time('2024-01-02'), parse_export_time('2024-01-03T10:00:00+0000')
+    assert _ids(iter_export_rows('acct', ACCOUNT, since=since)) == ['m2', 'm3']
+    assert _ids(iter_export_rows('acct', ACCOUNT, until=until)) == ['m2', 'm1']
+    assert _ids(iter_export_rows('acct', ACCOUNT, page_id='p2')) == ['m3', 'm0']
+    assert _ids(iter_export_rows('acct', ACCOUNT, conversation_id='c1', since=since)) == ['m2']
+
+    row = next(iter_export_rows('acct', ACCOUNT))
+    assert list(row) == EXPORT_COLUMNS
+    assert (row['account_id'], row['direction'], row['participant_name']) == ('acct', 'outbound', 'Ann')
+    assert [r['direction'] for r in iter_export_rows('acct', ACCOUNT)] == ['outbound', 'inbound', 'inbound', 'inbound']
+
+def test_ndjson_and_csv_round_trip():
+    rows = list(iter_export_rows('acct', ACCOUNT))
+
+    ndjson = ''.join(export_chunks(iter(rows), 'ndjson'))
+    assert [json.loads(line) for line in ndjson.splitlines()] == rows
+
+    text = ''.join(export_chunks(iter(rows), 'csv'))
+    parsed = list(csv.DictReader(io.StringIO(text, newline='')))
+    assert [r['message_text'] for r in parsed] == [r['message_text'] for r in rows]
+    assert list(parsed[0]) == EXPORT_COLUMNS
+
+def test_empty_csv_export_still_has_a_header():
+    assert ''.join(export_chunks(iter([]), 'csv')).strip() == ','.join(EXPORT_COLUMNS)
+
+def test_columnar_batches():
+    rows = list(iter_export_rows('acct', ACCOUNT))
+    lines = [json.loads(line) for line in ''.join(export_chunks(iter(rows), 'columnar', batch_rows=3)).splitlines()]
+    assert lines[0] == {'schema': EXPORT_COLUMNS}
+    assert [line['rows'] for line in lines[1:]] == [3, 1]
+    assert lines[1]['columns']['message_id'] + lines[2]['columns']['message_id'] == _ids(rows)
+
+def test_first_row_is_sent_before_the_rest_is_encoded():
+    encoded = []
+
+    def rows():
+        for row in iter_export_rows('acct', ACCOUNT):
+            encoded.append(row['message_id'])
+            yield row
+    chunks = export_chunks(rows(), 'ndjson')
+    first = next(chunks)
+    assert json.loads(first)['message_id'] == 'm2'
+    assert encoded == ['m2']
+
+@pytest.mark.skipif(pyarrow is None, reason="pyarrow is not installed")
+def test_arrow_stream_round_trip():
+    rows = list(iter_export_rows('acct', ACCOUNT))
+    data = b''.join(export_chunks(iter(rows), 'arrow', batch_rows=3))
+    table = pyarrow.ipc.open_stream(data).read_all()
+    assert table.column_names == EXPORT_COLUMNS
+    assert table.column('message_id').to_pylist() == _ids(rows)
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        export_chunks(iter([]), 'xml')
@@ -0,0 +1,86 @@
+import os
+import pytest
+from facebook_graph_cache import GraphResponseCache, graph_cache
+from facebook_messenger import FacebookMessenger
+from facebook_mock_graph import MockGraphFixture, MockGraphServer, MOCK_USER_TOKEN
+
+def _cache(**kwargs):
+    options = dict(ttls=[(r"^/me$", 3600)], uncached_paths=[r"^/oauth/"], memory_only_paths=[r"^/me/accounts$"],
+                   max_entries=100, max_bytes=10000, disk_dir='', disk_max_entries=100)
+    options.update(kwargs)
+    return GraphResponseCache(**options)
+
+@pytest.fixture
+def mock_graph():
+    graph_cache.clear()
+    with MockGraphServer(MockGraphFixture(2, 1, 3)) as mock:
+        yield mock
+    graph_cache.clear()
+
+def test_ttl_policy_and_keys():
+    cache = _cache()
+    assert cache.ttl_for('/oauth/access_token') is None
+    assert cache.ttl_for('/me') == 3600
+    assert cache.ttl_for('/t_123') == 0
+    assert not cache.on_disk('/me/accounts') and cache.on_disk('/me')
+    # The token itself is not part of the key, whose token it was is
+    assert cache.make_key('u', {'access_token': 'a', 'fields': 'id'}, 'acct:user') == cache.make_key('u', {'fields': 'id', 'access_token': 'b'}, 'acct:user')
+    assert cache.make_key('u', {}, 'acct:user') != cache.make_key('u', {}, 'other:user')
+
+def test_responses_without_etag_or_ttl_are_not_kept():
+    cache = _cache()
+    cache.store('k', 0, None, '{}')
+    assert cache.get('k') is None
+    cache.store('k', 0, '"e1"', '{}')
+    entry = cache.get('k')
+    assert entry['etag'] == '"e1"' and not cache.is_fresh(entry)
+
+def test_evicts_least_recently_used_by_entries_and_bytes():
+    cache = _cache(max_entries=3, max_bytes=25)
+    for key in ('a', 'b', 'c'):
+        cache.store(key, 60, None, '12345')
+    cache.get('a')
+    cache.store('d', 60, None, '12345')
+    assert [key for key in 'abcd' if cache.get(key)] == ['a', 'c', 'd']
+
+    cache.store('big', 60, None, 'x' * 20)
+    assert cache.snapshot()['bytes'] <= 25
+    assert cache.get('big') and not cache.get('a')
+    assert cache.stats['evictions'] == 3
+
+def test_disk_tier_survives_a_restart_but_not_page_tokens(tmp_path):
+    disk_dir = str(tmp_path / 'graph_cache')
+    cache = _cache(disk_dir=disk_dir)
+    cache.store('me#acct:user', 60, '"e1"', '{"id": "1"}', on_disk=cache.on_disk('/me'))
+    cache.store('accounts#acct:user', 60, '"e2"', '{"data": []}', on_disk=cache.on_disk('/me/accounts'))
+    cache.store('me#other:user', 60, '"e3"', '{"id": "2"}')
+
+    restarted = _cache(disk_dir=disk_dir)
+    assert restarted.get('me#acct:user')['body'] == '{"id": "1"}'
+    assert restarted.get('accounts#acct:user') is None
+
+    restarted.invalidate_principal('acct:user')
+    assert _cache(disk_dir=disk_dir).get('me#acct:user') is None
+    assert _cache(disk_dir=disk_dir).get('me#other:user') is not None
+    assert len(os.listdir(disk_dir)) == 1
+
+def test_fresh_entries_are_served_without_asking_graph(mock_graph):
+    messenger = FacebookMessenger(base_url=mock_graph.url)
+    first = messenger._graph_request('GET', '/me', {'access_token': MOCK_USER_TOKEN})
+    second = messenger._graph_request('GET', '/me', {'access_token': MOCK_USER_TOKEN})
+
+    assert second.json() == first.json()
+    assert getattr(second, 'from_cache', False) and not second.revalidated
+    assert mock_graph.snapshot()['by_endpoint']['me'] == 1
+
+def test_stale_entries_are_revalidated_with_their_etag(mock_graph):
+    messenger = FacebookMessenger(base_url=mock_graph.url)
+    path = '/' + mock_graph.fixture.conversation_id(0, 0)
+    params = {'access_token': MOCK_USER_TOKEN, 'fields': 'messages'}
+    first = messenger._graph_request('GET', path, params)
+    second = messenger._graph_request('GET', path, params)
+
+    assert second.status_code == 200 and second.revalidated
+    assert second.json() == first.json()
+    assert mock_graph.snapshot()['not_modified'] == 1
+    assert mock_graph.snapshot()['by_endpoint']['conversation'] == 2
@@ -0,0 +1,91 @@
+import pytest
+import facebook_service
+from facebook_benchmark import bench_sync, install_account, synthetic_account
+from facebook_config import user_data
+from facebook_data_handlers import (
+    choose_recipient, conversation_participants, conversation_title, load_account, merge_conversation_entries, save_facebook_data
+)
+from facebook_graph_cache import graph_cache
+from facebook_mock_graph import MockGraphFixture, MockGraphServer
+from facebook_window_cache import window_cache
+
+ANN, BOB, CY = ({'id': '1', 'name': 'Ann'}, {'id': '2', 'name': 'Bob'}, {'id': '3', 'name': 'Cy'})
+
+def _legacy_entry(conversation_id, participant):
+    """A conversation entry as syncs stored it per participant, before the participants list"""
+    return {'conversation_id': conversation_id, 'participant_id': participant['id'], 'participant_name': participant['name'], 'page_id': 'p'}
+
+def test_repeated_entries_fold_into_one_conversation():
+    merged = merge_conversation_entries([
+        _legacy_entry('t_1', ANN), _legacy_entry('t_2', CY), _legacy_entry('t_1', BOB), _legacy_entry('t_1', ANN)
+    ])
+    assert [conv['conversation_id'] for conv in merged] == ['t_1', 't_2']
+    assert merged[0]['participants'] == [ANN, BOB] and merged[0]['participant_name'] == 'Ann'
+    assert conversation_title(merged[0]) == 'Ann, Bob'
+    assert conversation_participants(_legacy_entry('t_3', CY)) == [CY]
+    assert conversation_title({'participants': [{'id': '4', 'name': None}]}) == 'Unknown User'
+
+def test_group_messages_go_to_the_last_writer_unless_named():
+    group = {'participants': [ANN, BOB, CY]}
+    # Stored newest first; the page's own messages are skipped
+    messages = [{'sender': {'id': 'p'}}, {'sender': {'id': '2'}}, {'sender': {'id': '1'}}]
+    assert choose_recipient(group, messages) == BOB
+    assert choose_recipient(group, messages, recipient_id='3') == CY
+    assert choose_recipient(group, messages, recipient_id='9') is None
+    assert choose_recipient(group, [{'sender': {'id': 'p'}}]) == ANN
+    assert choose_recipient({'participants': [CY]}, messages) == CY
+
+def test_group_threads_are_fetched_once_per_conversation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    result = bench_sync(6, messages_per_conversation=4, participants_per_conversation=3)
+    assert result['complete'] and result['synced_conversations'] == 6
+    assert result['graph_requests_by_endpoint']['conversation'] == 6
+
+@pytest.fixture
+def group_account(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    graph_cache.clear()
+    window_cache.clear()
+    fixture = MockGraphFixture(3, 1, 6, participants_per_conversation=3)
+    with MockGraphServer(fixture) as mock:
+        monkeypatch.setattr(facebook_service.messenger, 'base_url', mock.url)
+        account_id = install_account(synthetic_account(fixture))
+        yield account_id, fixture
+    del user_data[account_id]
+    window_cache.clear()
+
+def test_group_conversations_are_listed_once_and_answered_to_one_participant(group_account):
+    account_id, fixture = group_account
+    listed = facebook_service.get_conversations()['conversations']
+    assert len(listed) == len({conv['conversation_id'] for conv in listed}) == 3
+    assert all(conv['is_group'] and len(conv['participants']) == 3 for conv in listed)
+
+    conversation_id = fixture.conversation_id(0, 0)
+    messages = user_data[account_id]['facebook_messages'][conversation_id]
+    last_writer = next(m['sender']['id'] for m in messages if m['sender']['id'] != fixture.page_id(0))
+    result = facebook_service.send_message(conversation_id, 'hello all')
+    assert result.get('success'), result
+    assert result['recipient_id'] == last_writer
+
+    named = fixture.participant_ids(0, 0)[-1]
+    assert facebook_service.send_message(conversation_id, 'hi', recipient_id=named)['recipient_id'] == named
+    assert 'error' in facebook_service.send_message(conversation_id, 'hi', recipient_id='nobody')
+
+def test_stores_written_per_participant_load_as_one_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = synthetic_account(MockGraphFixture(2, 1, 2, participants_per_conversation=2))
+    account_id = data['profile']['id']
+    data['facebook_conversations'] = [
+        dict({key: value for key, value in conv.items() if key != 'participants'}, participant_id=participant['id'], participant_name=participant['name'])
+        for conv in data['facebook_conversations'] for participant in conv['participants']
+    ]
+    assert len(data['facebook_conversations']) == 4
+    save_facebook_data(data)
+    try:
+        assert load_account(account_id)
+        conversations = user_data[account_id]['facebook_conversations']
+        assert len(conversations) == 2
+        assert [len(conv['participants']) for conv in conversations] == [2, 2]
+    finally:
+        if account_id in user_data:
+            del user_data[account_id]
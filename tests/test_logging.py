@@ -0,0 +1,49 @@
+import json
+import logging
+import sys
+import pytest
+from facebook_logging import ConsoleFormatter, JsonFormatter, LogSampler, configure_logging, get_logger
+
+def _record(msg, *args, fields=None, exc_info=None):
+    record = logging.LogRecord('facebook.test', logging.WARNING, __file__, 1, msg, args, exc_info)
+    if fields:
+        record.fields = fields
+    return record
+
+def test_json_formatter_merges_fields():
+    entry = json.loads(JsonFormatter().format(_record("Fetched %d messages", 12, fields={'conversation_id': 't_1'})))
+    assert entry['msg'] == "Fetched 12 messages"
+    assert (entry['level'], entry['logger'], entry['conversation_id']) == ('warning', 'facebook.test', 't_1')
+
+def test_console_formatter_appends_fields_and_tracebacks():
+    assert ConsoleFormatter().format(_record("📨 Fetched %d", 3, fields={'messages': 40})) == "📨 Fetched 3 messages=40"
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        line = ConsoleFormatter().format(_record("failed", exc_info=sys.exc_info()))
+    assert line.startswith("failed\nTraceback") and line.endswith("RuntimeError: boom")
+
+def test_sampler_lets_one_in_n_through_per_key():
+    sampler = LogSampler(every=3)
+    assert [sampler.should_log('a') for _ in range(7)] == [True, False, False, True, False, False, True]
+    assert sampler.should_log('b')
+    sampler.reset('a')
+    assert sampler.should_log('a')
+    assert all(LogSampler(every=1).should_log('a') for _ in range(3))
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / 'app.log'
+    yield path
+    configure_logging()
+
+def test_queued_json_output_respects_the_level(log_file):
+    configure_logging(level='INFO', json_output=True, log_file=str(log_file))
+    log = get_logger("test")
+    log.debug("hidden")
+    log.info("Synced %d conversations", 5, extra={'fields': {'account_id': 'a1'}})
+    # Reconfiguring stops the listener once it has written out the queue
+    configure_logging()
+
+    entries = [json.loads(line) for line in log_file.read_text(encoding='utf-8').splitlines()]
+    assert [(e['logger'], e['msg'], e['account_id']) for e in entries] == [('facebook.test', 'Synced 5 conversations', 'a1')]
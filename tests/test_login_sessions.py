@@ -0,0 +1,75 @@
+import json
+from CompleteCode import LoginSessionStore, LOGIN_TRACK_FILE
+
+def _line_count(path):
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+def test_add_and_update_are_appended_and_reloaded(tmp_path):
+    path = str(tmp_path / 'login_track.jsonl')
+    store = LoginSessionStore(path=path, retention=10)
+    first = store.add({'user_name': 'Ann'})
+    second = store.add({'user_name': 'Bob'})
+    assert store.active_sessions == 2
+
+    assert store.update(first, {'status': 'logout'})
+    assert not store.update('unknown', {'status': 'logout'})
+    assert store.active_sessions == 1
+    # One line per login or update, nothing rewritten
+    assert _line_count(path) == 3
+
+    reloaded = LoginSessionStore(path=path, retention=10)
+    history = reloaded.history()
+    assert history['total_logins'] == 2 and history['active_sessions'] == 1
+    assert [s['session_id'] for s in history['login_sessions']] == [first, second]
+    assert reloaded.sessions[first]['status'] == 'logout'
+    assert history['last_login'] == reloaded.sessions[second]['login_time']
+
+def test_retention_trims_oldest_sessions_and_keeps_counters(tmp_path):
+    path = str(tmp_path / 'login_track.jsonl')
+    store = LoginSessionStore(path=path, retention=3)
+    ids = [store.add({'n': i}) for i in range(5)]
+    store.update(ids[0], {'status': 'expired'})  # already trimmed: nothing to update
+
+    assert list(store.sessions) == ids[-3:]
+    assert store.total_logins == 5 and store.active_sessions == 3
+    assert [s['n'] for s in store.recent(2)] == [3, 4]
+
+def test_compaction_rewrites_the_log_without_losing_totals(tmp_path):
+    path = str(tmp_path / 'login_track.jsonl')
+    store = LoginSessionStore(path=path, retention=3)
+    for i in range(120):
+        store.update(store.add({'n': i}), {'status': 'logout'})
+
+    assert _line_count(path) <= 2 * store.retention + 101
+    reloaded = LoginSessionStore(path=path, retention=3)
+    assert reloaded.total_logins == 120
+    assert reloaded.active_sessions == 0
+    assert [s['n'] for s in reloaded.sessions.values()] == [117, 118, 119]
+
+def test_partial_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / 'login_track.jsonl')
+    store = LoginSessionStore(path=path, retention=10)
+    session_id = store.add({'user_name': 'Ann'})
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "update", "session_id": "%s", "chan' % session_id)
+
+    reloaded = LoginSessionStore(path=path, retention=10)
+    assert reloaded.total_logins == 1
+    assert reloaded.sessions[session_id]['status'] == 'active'
+
+def test_legacy_track_file_is_migrated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sessions = [
+        {'session_id': 'a', 'login_time': '2024-01-01T10:00:00', 'status': 'logout'},
+        {'session_id': 'b', 'login_time': '2024-01-02T10:00:00', 'status': 'active'}
+    ]
+    with open(LOGIN_TRACK_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'total_logins': 7, 'last_login': '2024-01-02T10:00:00', 'login_sessions': sessions}, f)
+
+    store = LoginSessionStore(path='login_track.jsonl', retention=10)
+    assert store.total_logins == 7 and store.active_sessions == 1
+    assert list(store.sessions) == ['a', 'b']
+
+    reloaded = LoginSessionStore(path='login_track.jsonl', retention=10)
+    assert reloaded.history() == store.history()
@@ -0,0 +1,73 @@
+import requests
+from facebook_benchmark import api_server, install_account, synthetic_account
+from facebook_config import user_data
+from facebook_graph_cache import GraphResponseCache
+from facebook_metrics import MetricsRegistry, graph_cache_events_total, graph_endpoint
+from facebook_mock_graph import MockGraphFixture
+
+def _sample(text, line_start):
+    """Value of the first exposition line starting with line_start"""
+    return float(next(line for line in text.splitlines() if line.startswith(line_start)).rsplit(' ', 1)[1])
+
+def test_counter_gauge_and_labels_render_in_exposition_format():
+    registry = MetricsRegistry()
+    counter = registry.counter("t_requests_total", "Requests", ("route",))
+    counter.inc(route='/a')
+    counter.inc(2, route='/a')
+    counter.inc(route='say "hi"\n')
+    gauge = registry.gauge("t_size", "Size")
+    gauge.set(1.5)
+    # Registering the same name again returns the metric already there
+    assert registry.counter("t_requests_total", "Requests", ("route",)) is counter
+
+    assert registry.render().splitlines() == [
+        '# HELP t_requests_total Requests',
+        '# TYPE t_requests_total counter',
+        't_requests_total{route="/a"} 3',
+        't_requests_total{route="say \\"hi\\"\\n"} 1',
+        '# HELP t_size Size',
+        '# TYPE t_size gauge',
+        't_size 1.5'
+    ]
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("t_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 5):
+        histogram.observe(value)
+    with histogram.time():
+        pass
+
+    lines = registry.render().splitlines()
+    assert lines[2:5] == ['t_seconds_bucket{le="0.1"} 2', 't_seconds_bucket{le="1"} 4', 't_seconds_bucket{le="+Inf"} 5']
+    assert lines[-1] == 't_seconds_count 5'
+    assert abs(_sample('\n'.join(lines), 't_seconds_sum') - 6.25) < 0.01
+
+def test_graph_endpoint_hides_object_ids():
+    assert graph_endpoint('/123/conversations') == '/{id}/conversations'
+    assert graph_endpoint('/me/accounts') == '/me/accounts'
+    assert graph_endpoint('/t_1_2') == '/{id}'
+
+def test_cache_events_are_counted():
+    cache = GraphResponseCache(disk_dir='')
+    before = graph_cache_events_total._values.get(('hits',), 0)
+    cache.record_hit()
+    cache.record_hit()
+    assert graph_cache_events_total._values[('hits',)] == before + 2
+    assert cache.stats['hits'] == 2
+
+def test_metrics_endpoint_reports_requests_by_route_and_store_sizes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    account_id = install_account(synthetic_account(MockGraphFixture(4, 1, 3)))
+    try:
+        with api_server() as base_url:
+            for conversation_id in ('t_0_0', 't_0_1'):
+                assert requests.get(f"{base_url}/facebook/messages/{conversation_id}", timeout=10).status_code == 200
+            text = requests.get(f"{base_url}/metrics", timeout=10).text
+    finally:
+        del user_data[account_id]
+
+    route = 'fb_http_requests_total{route="/facebook/messages/{conversation_id}",method="GET",status="200"}'
+    assert _sample(text, route) >= 2
+    assert _sample(text, f'fb_store_messages{{account_id="{account_id}"}}') == 12
+    assert '# TYPE fb_graph_cache_events_total counter' in text
@@ -0,0 +1,88 @@
+import json
+import requests
+from facebook_mock_graph import MockGraphFixture, MockGraphServer, MOCK_USER_TOKEN, MOCK_MEDIA_KINDS
+
+def _get(mock, path, **params):
+    params.setdefault('access_token', MOCK_USER_TOKEN)
+    return requests.get(f"{mock.url}{path}", params=params, timeout=10)
+
+def test_conversations_page_through_every_page():
+    fixture = MockGraphFixture(conversations=11, pages=2)
+    assert [fixture.conversations_for_page(i) for i in range(2)] == [6, 5]
+    with MockGraphServer(fixture) as mock:
+        ids, url = [], f"{mock.url}/{fixture.page_id(0)}/conversations?limit=4"
+        while url:
+            body = requests.get(url, params={'access_token': MOCK_USER_TOKEN}, timeout=10).json()
+            ids.extend(conv['id'] for conv in body['data'])
+            url = body['paging'].get('next')
+        assert ids == [fixture.conversation_id(0, i) for i in range(6)]
+        assert mock.snapshot()['by_endpoint'] == {'conversations': 2}
+
+        assert _get(mock, f"/{fixture.page_id(5)}/conversations").status_code == 404
+        assert _get(mock, '/t_1_5').status_code == 404
+        assert _get(mock, '/me', access_token='').json()['error']['code'] == 2500
+
+def test_fixture_is_deterministic_and_windows_spread_over_two_days():
+    first = MockGraphFixture(50, seed=3)
+    second = MockGraphFixture(50, seed=3, now=first.now)
+    assert first.messages(0, 7, 5) == second.messages(0, 7, 5)
+    assert [m['from']['id'] for m in first.messages(0, 7, 4)] == [first.participant_id(0, 7), first.page_id(0)] * 2
+    ages = [(first.now - first.last_message_time(0, i)).total_seconds() / 3600 for i in range(50)]
+    assert min(ages) >= 0 and max(ages) < 48
+    assert 10 < sum(1 for age in ages if age <= 24) < 40
+
+def test_group_threads_and_attachments():
+    fixture = MockGraphFixture(2, participants_per_conversation=3, messages_per_conversation=6, attachment_every=2)
+    participants = fixture.conversation(0, 1)['participants']['data']
+    assert len(participants) == 4 and len({p['name'] for p in participants}) == 4
+    messages = fixture.messages(0, 1, 6)
+    assert [m['from']['id'] for m in messages[::2]] == fixture.participant_ids(0, 1)
+    assert sum('attachments' in m for m in messages) == 3
+
+    name, mime_type, size = MOCK_MEDIA_KINDS[0]
+    assert fixture.media_body(name) == (mime_type, fixture.media_body(name)[1])
+    assert len(fixture.media_body(name)[1]) == size
+    assert fixture.media_body('missing.bin') == (None, None)
+
+def test_injected_errors_and_rate_limits():
+    with MockGraphServer(MockGraphFixture(), error_rate=1.0) as mock:
+        response = _get(mock, '/me')
+        assert response.status_code == 500 and response.json()['error']['code'] == 1
+        assert mock.snapshot()['errors_injected'] == 1
+
+    with MockGraphServer(MockGraphFixture(), rate_limit=2) as mock:
+        # Five quick requests span at most two one-second windows, so at least one is over the limit
+        responses = [_get(mock, '/me') for _ in range(5)]
+        limited = [r for r in responses if r.status_code != 200]
+        assert limited and all(r.json()['error']['code'] == 4 for r in limited)
+        assert mock.snapshot()['rate_limited'] == len(limited)
+
+def test_batch_requests_are_answered_item_by_item():
+    fixture = MockGraphFixture(3)
+    with MockGraphServer(fixture) as mock:
+        batch = [{'method': 'GET', 'relative_url': f"{fixture.conversation_id(0, i)}?fields=messages"} for i in range(3)]
+        batch.append({'method': 'GET', 'relative_url': 'unknown/path/here'})
+        results = requests.post(f"{mock.url}/", data={'batch': json.dumps(batch), 'access_token': MOCK_USER_TOKEN}, timeout=10).json()
+        assert [item['code'] for item in results] == [200, 200, 200, 404]
+        assert json.loads(results[0]['body'])['id'] == fixture.conversation_id(0, 0)
+
+def test_recorded_responses_are_replayed(tmp_path):
+    path = str(tmp_path / 'fixture.json')
+    fixture = MockGraphFixture(4, seed=1)
+    with MockGraphServer(fixture, record=True) as mock:
+        accounts = _get(mock, '/me/accounts').json()
+        messages = _get(mock, '/t_0_2', fields='messages').json()
+        fixture.save(path, mock.recorded)
+
+    replayed = MockGraphFixture.load(path)
+    assert replayed.now == fixture.now and replayed.conversations == 4
+    with MockGraphServer(replayed) as mock:
+        assert _get(mock, '/me/accounts').json() == accounts
+        assert _get(mock, '/t_0_2', fields='messages').json() == messages
+        assert mock.snapshot()['by_endpoint'] == {'recorded': 2}
+
+def test_unchanged_responses_answer_304():
+    with MockGraphServer(MockGraphFixture()) as mock:
+        first = _get(mock, '/me')
+        second = requests.get(f"{mock.url}/me", params={'access_token': MOCK_USER_TOKEN}, headers={'If-None-Match': first.headers['ETag']}, timeout=10)
+        assert second.status_code == 304 and mock.snapshot()['not_modified'] == 1
@@ -0,0 +1,58 @@
+import os
+import shutil
+import pytest
+from facebook_accounts import account_dir, account_registry
+from facebook_benchmark import synthetic_account
+from facebook_config import FACEBOOK_DATA_FILE, MESSAGES_DATA_FILE, USER_PROFILE_FILE, user_data
+from facebook_data_handlers import load_all_data, save_facebook_data, save_messages_data, save_user_profile
+from facebook_mock_graph import MockGraphFixture
+from facebook_service import get_conversations, get_messages, resolve_account
+
+def _save_account(account_id, conversations):
+    """Write an account's JSON files and register it, as a login does"""
+    data = synthetic_account(MockGraphFixture(conversations, 1, 2))
+    data['profile'] = dict(data['profile'], id=account_id, name=f'Owner {account_id}')
+    save_user_profile(data['profile'])
+    save_facebook_data(data)
+    save_messages_data(data)
+    account_registry.register(account_id, data['profile'], [page['id'] for page in data['facebook_pages']])
+    return data
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    for account_id in list(user_data.keys()):
+        del user_data[account_id]
+
+def test_accounts_are_loaded_on_first_access_and_kept_apart(workdir):
+    first = _save_account('111', 2)
+    _save_account('222', 3)
+    for account_id in list(user_data.keys()):
+        del user_data[account_id]
+
+    # The last login is the default account
+    assert resolve_account() == '222'
+    assert '111' not in user_data
+    assert get_conversations()['total_conversations'] == 3
+
+    assert get_conversations('111')['total_conversations'] == 2
+    assert '111' in user_data
+    conversation_id = first['facebook_conversations'][0]['conversation_id']
+    assert get_messages(conversation_id, '111')['total_messages'] == 2
+
+    assert resolve_account('333') is None
+    assert 'error' in get_conversations('333')
+
+def test_single_account_files_are_moved_into_an_account_directory(workdir):
+    _save_account('111', 2)
+    for filename in (FACEBOOK_DATA_FILE, USER_PROFILE_FILE, MESSAGES_DATA_FILE):
+        shutil.move(os.path.join(account_dir('111'), filename), filename)
+    shutil.rmtree('accounts')
+    del user_data['111']
+
+    assert load_all_data()
+    assert not os.path.exists(FACEBOOK_DATA_FILE)
+    assert os.path.exists(os.path.join(account_dir('111'), FACEBOOK_DATA_FILE))
+    assert account_registry.resolve() == '111'
+    assert len(user_data['111']['facebook_conversations']) == 2
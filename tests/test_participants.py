@@ -0,0 +1,92 @@
+import json
+import time
+from facebook_config import PARTICIPANT_LOOKUP_BATCH_SIZE
+from facebook_messenger import FacebookMessenger
+from facebook_participants import ParticipantDirectory
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = json.dumps(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+class FakeGraphMessenger(FacebookMessenger):
+    """Answers multi-id lookups from a name table and records the ids asked for"""
+
+    def __init__(self, known_names, fail=False):
+        super().__init__(base_url='http://graph.invalid')
+        self.known_names = known_names
+        self.fail = fail
+        self.lookups = []
+
+    def _graph_request(self, method, path, params=None, data=None, timeout=30, use_cache=True):
+        ids = params['ids'].split(',')
+        self.lookups.append(ids)
+        if self.fail:
+            return FakeResponse(500, {'error': {'message': 'boom', 'code': 2}})
+        return FakeResponse(200, {pid: {'id': pid, 'name': self.known_names[pid]} for pid in ids if pid in self.known_names})
+
+def _directory(tmp_path, **kwargs):
+    return ParticipantDirectory(path=str(tmp_path / 'participant_directory.json'), **kwargs)
+
+def test_unknown_names_are_looked_up_in_batches(tmp_path):
+    ids = [str(1000 + i) for i in range(PARTICIPANT_LOOKUP_BATCH_SIZE + 5)]
+    messenger = FakeGraphMessenger({pid: f'Person {pid}' for pid in ids})
+    directory = _directory(tmp_path)
+    directory.set(ids[0], 'Known')
+
+    names = messenger.get_participant_names(ids + ids[:3] + [''], 'token', directory)
+
+    assert names == dict({pid: f'Person {pid}' for pid in ids}, **{ids[0]: 'Known'})
+    # Cached and repeated ids are not asked for, and the rest go in as few requests as the batch size allows
+    assert [len(batch) for batch in messenger.lookups] == [PARTICIPANT_LOOKUP_BATCH_SIZE, 4]
+    assert ids[0] not in messenger.lookups[0]
+
+    messenger.lookups.clear()
+    assert messenger.get_participant_names(ids, 'token', directory) == names
+    assert messenger.lookups == []
+
+def test_expired_names_are_refreshed_and_kept_when_graph_fails(tmp_path):
+    directory = _directory(tmp_path, ttl=60)
+    directory.set('1', 'Old name')
+    directory._entries['1']['updated_at'] = time.time() - 120
+
+    failing = FakeGraphMessenger({}, fail=True)
+    assert failing.get_participant_names(['1', '2'], 'token', directory) == {'1': 'Old name'}
+    assert failing.lookups == [['1', '2']]
+
+    working = FakeGraphMessenger({'1': 'New name'})
+    assert working.get_participant_names(['1'], 'token', directory) == {'1': 'New name'}
+    assert directory.get('1') == 'New name'
+
+def test_directory_evicts_least_recently_used(tmp_path):
+    directory = _directory(tmp_path, max_entries=2)
+    directory.set('a', 'A')
+    directory.set('b', 'B')
+    directory.get('a')
+    directory.set('c', 'C')
+    assert directory.to_dict() == {'a': 'A', 'c': 'C'}
+
+def test_directory_persists_order_and_drops_expired_entries(tmp_path):
+    directory = _directory(tmp_path, ttl=60)
+    directory.update({'a': 'A', 'b': 'B', 'c': 'C'})
+    directory._entries['b']['updated_at'] = time.time() - 120
+    directory.get('a')
+    assert directory.save()
+
+    reloaded = _directory(tmp_path, ttl=60)
+    assert list(reloaded.to_dict()) == ['c', 'a']
+    assert reloaded.get('b') is None
+
+def test_unchanged_directory_is_not_rewritten(tmp_path):
+    directory = _directory(tmp_path)
+    directory.set('a', 'A')
+    directory.save()
+    stamp = (tmp_path / 'participant_directory.json').stat().st_mtime_ns
+
+    directory.set('a', 'A')
+    assert directory.save()
+    assert (tmp_path / 'participant_directory.json').stat().st_mtime_ns == stamp
@@ -0,0 +1,76 @@
+import gzip
+import json
+import pytest
+from facebook_benchmark import install_account, synthetic_account
+from facebook_config import COMPRESSION_MIN_BYTES, user_data
+from facebook_data_handlers import record_sent_message
+from facebook_json import EncodedResponseCache, dumps, response_cache
+from facebook_mock_graph import MockGraphFixture
+from facebook_service import find_conversation, get_messages_json, get_participants_json
+
+@pytest.fixture
+def account_id(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    response_cache.clear()
+    account_id = install_account(synthetic_account(MockGraphFixture(2, 1, 5)))
+    yield account_id
+    del user_data[account_id]
+    response_cache.clear()
+
+def test_body_is_reused_while_its_source_is_unchanged():
+    cache = EncodedResponseCache(max_bytes=10000)
+    source = [1, 2]
+    assert cache.get('k', source) is None
+    assert cache.put('k', source, b'[1,2]') == (b'[1,2]', None)
+    assert cache.get('k', source) == (b'[1,2]', None)
+
+    # The same contents in another object, or the same object grown, are new data
+    assert cache.get('k', [1, 2]) is None
+    source.insert(0, 0)
+    assert cache.get('k', source) is None
+    assert cache.snapshot()['hits'] == 1 and cache.snapshot()['misses'] == 3
+
+def test_compressed_copies_are_kept_and_small_bodies_are_not_compressed():
+    cache = EncodedResponseCache(max_bytes=10 ** 6)
+    source = {}
+    body = dumps({'data': 'x' * COMPRESSION_MIN_BYTES})
+    compressed, encoding = cache.put('k', source, body, 'gzip')
+    assert encoding == 'gzip' and gzip.decompress(compressed) == body
+    assert cache.get('k', source, 'gzip')[0] is compressed
+    assert cache.snapshot()['bytes'] == len(body) + len(compressed)
+
+    assert cache.put('small', source, b'{}', 'gzip') == (b'{}', None)
+
+def test_evicts_least_recently_used_bodies():
+    cache = EncodedResponseCache(max_bytes=10)
+    a, b, c = [], [], []
+    cache.put('a', a, b'aaaa')
+    cache.put('b', b, b'bbbb')
+    cache.get('a', a)
+    cache.put('c', c, b'cccc')
+    assert cache.get('b', b) is None
+    assert cache.get('a', a) and cache.get('c', c)
+    # A body larger than the cache is returned but not kept
+    assert cache.put('big', [], b'x' * 11) == (b'x' * 11, None)
+    assert cache.snapshot()['entries'] == 2
+
+def test_sent_message_shows_up_in_the_cached_messages_body(account_id):
+    conversation_id = user_data[account_id]['facebook_conversations'][0]['conversation_id']
+    body, _ = get_messages_json(conversation_id, account_id)
+    assert get_messages_json(conversation_id, account_id)[0] is body
+
+    record_sent_message(account_id, find_conversation(account_id, conversation_id), 'm_sent_1', 'hello')
+
+    messages = json.loads(get_messages_json(conversation_id, account_id)[0])
+    assert messages['total_messages'] == json.loads(body)['total_messages'] + 1
+    assert messages['messages'][0]['message_id'] == 'm_sent_1'
+
+def test_replaced_participant_names_are_served_fresh(account_id):
+    body, _ = get_participants_json(account_id)
+    assert get_participants_json(account_id)[0] is body
+
+    def rename(account):
+        account['participant_names'] = dict(account['participant_names'], extra='Extra Person')
+    user_data.mutate(account_id, rename)
+
+    assert json.loads(get_participants_json(account_id)[0])['participant_names']['extra'] == 'Extra Person'
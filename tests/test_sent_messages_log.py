@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+import pytest
+from facebook_config import user_data
+from facebook_data_handlers import (
+    append_sent_message, load_sent_messages_log, clear_sent_messages_log, save_facebook_data, load_account,
+    replace_account_data
+)
+
+ACCOUNT_ID = '9001'
+
+def message(message_id, retrieved_at=None):
+    return {
+        'message_id': message_id,
+        'message_text': message_id,
+        'created_time': '2024-01-01T00:00:00+0000',
+        'sender': {'id': 'page', 'name': 'Page'},
+        'attachments': [],
+        'attachment_count': 0,
+        'retrieved_at': retrieved_at or datetime.now().isoformat()
+    }
+
+def account(messages):
+    return {
+        'profile': {'id': ACCOUNT_ID, 'name': 'Test'},
+        'facebook_pages': [],
+        'facebook_conversations': [{'conversation_id': 'c1', 'page_id': 'page', 'message_count': len(messages)}],
+        'facebook_messages': {'c1': list(messages)},
+        'participant_names': {}
+    }
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    yield
+    if ACCOUNT_ID in user_data:
+        del user_data[ACCOUNT_ID]
+
+def test_clear_keeps_entries_the_saved_data_lacks():
+    append_sent_message(ACCOUNT_ID, 'c1', message('m1'))
+    append_sent_message(ACCOUNT_ID, 'c1', message('m2'))
+    append_sent_message(ACCOUNT_ID, 'c2', message('m3'))
+    clear_sent_messages_log(ACCOUNT_ID, account([message('m1')]))
+    assert [entry['message']['message_id'] for entry in load_sent_messages_log(ACCOUNT_ID)] == ['m2', 'm3']
+
+    clear_sent_messages_log(ACCOUNT_ID, {'facebook_messages': {'c1': [message('m2')], 'c2': [message('m3')]}})
+    assert load_sent_messages_log(ACCOUNT_ID) == []
+
+def test_message_logged_after_the_snapshot_survives_a_save_and_reload():
+    snapshot = account([message('m1')])
+    append_sent_message(ACCOUNT_ID, 'c1', message('m1'))
+    # Sent after the snapshot was taken, before it is saved
+    append_sent_message(ACCOUNT_ID, 'c1', message('m2'))
+    save_facebook_data(snapshot)
+    assert load_account(ACCOUNT_ID)
+    assert [m['message_id'] for m in user_data[ACCOUNT_ID]['facebook_messages']['c1']] == ['m2', 'm1']
+
+def test_sync_replacement_carries_messages_stored_while_it_ran():
+    sync_started = datetime.now().isoformat()
+    before = (datetime.now() - timedelta(hours=1)).isoformat()
+    user_data[ACCOUNT_ID] = account([message('during', sync_started), message('deleted-upstream', before)])
+    synced = account([message('synced', before)])
+
+    replace_account_data(ACCOUNT_ID, synced, sync_started)
+    stored = user_data[ACCOUNT_ID]
+    assert [m['message_id'] for m in stored['facebook_messages']['c1']] == ['during', 'synced']
+    assert stored['facebook_conversations'][0]['message_count'] == 2
+    # The sync's own data is left as it was built
+    assert [m['message_id'] for m in synced['facebook_messages']['c1']] == ['synced']
+    assert synced['facebook_conversations'][0]['message_count'] == 1
+
+def test_first_sync_of_an_account_is_stored_as_is():
+    synced = account([message('synced')])
+    replace_account_data(ACCOUNT_ID, synced, datetime.now().isoformat())
+    assert user_data[ACCOUNT_ID]['facebook_messages'] == synced['facebook_messages']
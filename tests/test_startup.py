@@ -0,0 +1,59 @@
+import threading
+import facebook_startup
+from facebook_data_handlers import LOAD_STEPS
+from facebook_startup import StartupState, start_background_load
+from main import wait_for_server
+
+class FakeServer:
+    def __init__(self, started_after=None):
+        self.started = False
+        if started_after is not None:
+            threading.Timer(started_after, setattr, (self, 'started', True)).start()
+
+def test_steps_and_readiness():
+    state = StartupState()
+    assert state.begin_loading()
+    assert not state.begin_loading()
+    assert state.loading and state.current_step == LOAD_STEPS[0]
+
+    state.step(LOAD_STEPS[0])
+    assert state.snapshot()['current_step'] == LOAD_STEPS[1]
+    state.finish_loading(True)
+    assert not state.loading and not state.is_ready()
+    # Loading again after it finished is refused too
+    assert not state.begin_loading()
+
+    state.server_ready.set()
+    snapshot = state.snapshot()
+    assert snapshot['ready'] and snapshot['data_loaded'] and snapshot['current_step'] is None
+
+def test_waiters_wake_when_loading_finishes():
+    state = StartupState()
+    assert not state.wait_for_data(timeout=0.01)
+    threading.Timer(0.05, state.finish_loading, (False, 'disk full')).start()
+    assert state.wait_for_data(timeout=5)
+    assert state.snapshot()['error'] == 'disk full'
+
+def test_background_load_of_an_empty_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state = StartupState()
+    monkeypatch.setattr(facebook_startup, 'startup_state', state)
+
+    loader = start_background_load()
+    assert start_background_load() is None
+    loader.join(10)
+
+    assert state.data_ready.is_set() and not state.data_loaded
+    assert state.completed_steps == LOAD_STEPS
+
+def test_wait_for_server_returns_as_soon_as_uvicorn_listens(monkeypatch):
+    state = StartupState()
+    monkeypatch.setattr('main.startup_state', state)
+
+    assert wait_for_server(FakeServer(started_after=0.05), timeout=5)
+    assert state.server_ready.is_set()
+
+    state = StartupState()
+    monkeypatch.setattr('main.startup_state', state)
+    assert not wait_for_server(FakeServer(), timeout=0.1)
+    assert not state.server_ready.is_set()
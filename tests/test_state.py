@@ -0,0 +1,120 @@
+import json
+import sqlite3
+import pytest
+from facebook_state import SQLiteStateBackend, create_state_store
+
+def _account(conversation_ids, messages_per_conversation=2):
+    return {
+        'user_id': 'u1',
+        'facebook_conversations': [{'conversation_id': cid, 'updated_time': '2024-01-01'} for cid in conversation_ids],
+        'facebook_messages': {
+            cid: [{'message_id': f'{cid}-{i}', 'message': 'hi'} for i in range(messages_per_conversation)]
+            for cid in conversation_ids
+        }
+    }
+
+def _append_message(conversation_id, message_id):
+    def change(account):
+        account['facebook_messages'][conversation_id].append({'message_id': message_id, 'message': 'new'})
+        return message_id
+    return change
+
+def _conversation_versions(path):
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT conversation_id, version FROM conversations WHERE key = 'acct'"))
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'state.db')
+
+def test_memory_mutate_copies_only_named_conversations():
+    store = create_state_store('memory')
+    store['acct'] = _account(['c1', 'c2'])
+    before = store['acct']
+
+    assert store.mutate('acct', _append_message('c1', 'm-new'), conversation_ids=['c1']) == 'm-new'
+
+    after = store['acct']
+    assert [m['message_id'] for m in after['facebook_messages']['c1']] == ['c1-0', 'c1-1', 'm-new']
+    # A reader holding the previous version keeps a consistent view, untouched lists are shared
+    assert len(before['facebook_messages']['c1']) == 2
+    assert after['facebook_messages']['c2'] is before['facebook_messages']['c2']
+    assert store.mutate('missing', _append_message('c1', 'x')) is None
+
+def test_sqlite_mutate_writes_only_named_conversation_rows(db_path):
+    store = create_state_store('sqlite', db_path)
+    store['acct'] = _account(['c1', 'c2', 'c3'])
+    assert _conversation_versions(db_path) == {'c1': 1, 'c2': 1, 'c3': 1}
+
+    store.mutate('acct', _append_message('c2', 'm-new'), conversation_ids=['c2'])
+
+    assert _conversation_versions(db_path) == {'c1': 1, 'c2': 2, 'c3': 1}
+    assert [conv['conversation_id'] for conv in store['acct']['facebook_conversations']] == ['c1', 'c2', 'c3']
+    assert store['acct']['facebook_messages']['c2'][-1]['message_id'] == 'm-new'
+
+def test_sqlite_second_worker_sees_row_updates_and_new_conversations(db_path):
+    first = create_state_store('sqlite', db_path)
+    second = create_state_store('sqlite', db_path)
+    first['acct'] = _account(['c1', 'c2'])
+    assert len(second['acct']['facebook_messages']['c1']) == 2
+
+    def add_conversation(account):
+        account['facebook_conversations'].insert(0, {'conversation_id': 'c0', 'updated_time': '2024-02-01'})
+        account['facebook_messages']['c0'] = [{'message_id': 'c0-0', 'message': 'hello'}]
+    first.mutate('acct', _append_message('c1', 'm-new'), conversation_ids=['c1'])
+    first.mutate('acct', add_conversation, conversation_ids=['c0'])
+
+    account = second['acct']
+    assert account['facebook_messages']['c1'][-1]['message_id'] == 'm-new'
+    assert account['facebook_messages']['c0'][0]['message_id'] == 'c0-0'
+    # A conversation added by a row write goes after the existing ones
+    assert [conv['conversation_id'] for conv in account['facebook_conversations']] == ['c1', 'c2', 'c0']
+    assert account == first['acct']
+
+def test_sqlite_concurrent_workers_do_not_lose_updates(db_path):
+    first = create_state_store('sqlite', db_path)
+    second = create_state_store('sqlite', db_path)
+    first['acct'] = _account(['c1'])
+    second.get('acct')
+
+    first.mutate('acct', _append_message('c1', 'from-first'), conversation_ids=['c1'])
+    # second's cache is stale; the mutation must start from the stored version
+    second.mutate('acct', _append_message('c1', 'from-second'), conversation_ids=['c1'])
+
+    assert [m['message_id'] for m in first['acct']['facebook_messages']['c1']][-2:] == ['from-first', 'from-second']
+
+def test_sqlite_replacing_an_account_reloads_it_everywhere(db_path):
+    first = create_state_store('sqlite', db_path)
+    second = create_state_store('sqlite', db_path)
+    first['acct'] = _account(['c1', 'c2'])
+    second.get('acct')
+
+    def rename(account):
+        account['user_id'] = 'u2'
+    first.mutate('acct', rename)
+    assert second['acct']['user_id'] == 'u2'
+
+    first['acct'] = _account(['c3'])
+    assert list(second['acct']['facebook_messages']) == ['c3']
+
+    del first['acct']
+    assert 'acct' not in second
+    assert second.keys() == []
+
+def test_sqlite_migrates_accounts_stored_as_one_blob(db_path):
+    legacy = _account(['c1', 'c2'])
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("INSERT INTO state (key, value) VALUES (?, ?)", ('acct', json.dumps(legacy)))
+
+    store = create_state_store('sqlite', db_path)
+
+    assert store['acct'] == legacy
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'state'").fetchone() is None
+    # Opening again finds nothing left to migrate
+    assert SQLiteStateBackend(db_path).get('acct') == legacy
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_state_store('redis')
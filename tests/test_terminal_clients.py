@@ -0,0 +1,47 @@
+import pytest
+import facebook_service
+from facebook_benchmark import api_server, install_account, synthetic_account
+from facebook_config import user_data
+from facebook_graph_cache import graph_cache
+from facebook_mock_graph import MockGraphFixture, MockGraphServer
+from facebook_window_cache import window_cache
+from terminal_interface import HttpClient, LocalClient
+
+@pytest.fixture
+def account(tmp_path, monkeypatch):
+    """A synthetic account as the default account, with sends going to the mock Graph server"""
+    monkeypatch.chdir(tmp_path)
+    graph_cache.clear()
+    window_cache.clear()
+    fixture = MockGraphFixture(3, 1, 4)
+    with MockGraphServer(fixture) as mock:
+        monkeypatch.setattr(facebook_service.messenger, 'base_url', mock.url)
+        account_id = install_account(synthetic_account(fixture))
+        yield account_id, fixture, mock
+    del user_data[account_id]
+    window_cache.clear()
+
+def test_local_client_calls_the_service_without_http(account):
+    account_id, fixture, mock = account
+    client = LocalClient()
+    conversation_id = fixture.conversation_id(0, 0)
+
+    assert client.get_conversations()['account_id'] == account_id
+    assert client.get_messages(conversation_id)['total_messages'] == 4
+    assert client.get_participants()['total_participants'] == 3
+
+    result = client.send_message(conversation_id, 'hello')
+    assert result.get('success'), result
+    assert client.get_messages(conversation_id)['total_messages'] == 5
+    assert mock.snapshot()['by_endpoint'] == {'send': 1}
+
+def test_http_client_returns_what_the_local_client_does(account):
+    _, fixture, _ = account
+    conversation_id = fixture.conversation_id(0, 1)
+    local = LocalClient()
+    with api_server() as base_url:
+        remote = HttpClient(base_url)
+        assert remote.get_messages(conversation_id) == local.get_messages(conversation_id)
+        assert remote.get_participants() == local.get_participants()
+        assert remote.get_conversations()['total_conversations'] == local.get_conversations()['total_conversations']
+        assert 'error' in remote.get_messages('missing')
@@ -0,0 +1,61 @@
+import time
+import pytest
+import facebook_tokens
+from facebook_tokens import TokenManager, InvalidTokenError
+
+class FakeMessenger:
+    def __init__(self):
+        self.exchanged = []
+
+    def get_long_lived_token(self, token, expires_in=None):
+        self.exchanged.append(token)
+        return {'access_token': f"{token}-renewed", 'long_lived': True, 'expires_in': 60 * 24 * 3600}
+
+    def get_page_tokens(self, token):
+        return {'p1': f"page-{token}"}
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(facebook_tokens, 'apply_tokens_to_account', lambda *args: None)
+    manager = TokenManager(margin=3600, interval=3600)
+    yield manager
+    manager.stop()
+
+def test_needs_refresh_inside_the_margin_only(manager):
+    manager.register_account('a', 'fresh', expires_in=7 * 24 * 3600)
+    manager.register_account('b', 'soon', expires_in=600)
+    manager.register_account('c', 'unknown-expiry')
+    assert not manager.needs_refresh('a')
+    assert manager.needs_refresh('b')
+    assert not manager.needs_refresh('c')
+
+def test_token_due_at_startup_is_refreshed_without_waiting_an_interval(manager):
+    manager.register_account('a', 'soon', expires_in=600, page_tokens={'p1': 'old-page'})
+    messenger = FakeMessenger()
+    manager.start(messenger)
+    deadline = time.time() + 5
+    while manager.account_for_token('soon-renewed')[0] is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert messenger.exchanged == ['soon']
+    assert manager.account_for_token('soon-renewed') == ('a', None)
+    assert manager.account_for_token('page-soon-renewed') == ('a', 'p1')
+    assert not manager.needs_refresh('a')
+
+def test_expired_token_needs_a_new_login(manager):
+    manager.register_account('a', 'gone', expires_at=time.time() - 10)
+    manager.messenger = FakeMessenger()
+    assert manager.run_due() == 1
+    assert manager.messenger.exchanged == []
+    with pytest.raises(InvalidTokenError):
+        manager.check('gone')
+    # Waiting for a login, so later checks leave it alone
+    assert manager.run_due() == 0
+
+def test_invalid_page_token_triggers_a_refresh(manager):
+    manager.register_account('a', 'user', expires_in=7 * 24 * 3600, page_tokens={'p1': 'page'})
+    manager.mark_invalid('page', 'revoked')
+    assert manager.needs_refresh('a')
+    manager.messenger = FakeMessenger()
+    assert manager.run_due() == 1
+    assert manager.account_for_token('page-user-renewed') == ('a', 'p1')
@@ -0,0 +1,83 @@
+import json
+import threading
+from collections import deque
+from facebook_benchmark import bench_sync
+from facebook_tracing import Timeline, Tracer, tracer
+
+def test_timeline_summary_and_trace_events():
+    timeline = Timeline('sync', max_spans=2, account_id='a1')
+    timeline.add('GET /me', 'graph', timeline.start + 0.001, timeline.start + 0.004, {'status': 200})
+    timeline.add('GET /t_1', 'graph', timeline.start + 0.004, timeline.start + 0.005)
+    timeline.add('fetch_messages', 'messages', timeline.start, timeline.start + 0.01)
+    timeline.end = timeline.start + 0.02
+
+    summary = timeline.summary()
+    assert (summary['spans'], summary['dropped_spans'], summary['duration_ms']) == (2, 1, 20.0)
+    assert summary['by_category'] == {'graph': {'spans': 2, 'total_ms': 4.0}}
+    assert [span['name'] for span in summary['slowest_spans']] == ['GET /me', 'GET /t_1']
+
+    events = timeline.trace_events()
+    assert [event['ph'] for event in events] == ['M', 'X', 'X', 'X']
+    assert (events[1]['dur'], events[1]['args']) == (20000.0, {'account_id': 'a1'})
+    assert (events[2]['ts'], events[2]['dur'], events[2]['args']) == (1000.0, 3000.0, {'status': 200})
+
+def test_spans_are_only_kept_inside_an_open_timeline(tmp_path):
+    traces = Tracer(enabled=True, trace_dir='', history=2)
+    with traces.span('outside', 'graph') as args:
+        args['ignored'] = True
+    with traces.timeline('sync') as timeline:
+        # A nested timeline joins the open one instead of starting another
+        with traces.timeline('inner') as inner:
+            assert inner is timeline
+        with traces.span('fetch', 'messages', conversation_id='t_1') as args:
+            args['messages'] = 3
+        traces.annotate(account_id='a1')
+    assert traces.current() is None
+    assert timeline.spans[0][5] == {'conversation_id': 't_1', 'messages': 3}
+    assert timeline.attrs == {'account_id': 'a1'}
+
+    disabled = Tracer(enabled=False, trace_dir=str(tmp_path))
+    with disabled.timeline('sync') as nothing:
+        disabled.record('GET /me', 'graph', 0, 1)
+    assert nothing is None and disabled.recent() == [] and not list(tmp_path.iterdir())
+
+def test_worker_threads_record_into_the_bound_timeline():
+    traces = Tracer(enabled=True, trace_dir='')
+    def work(timeline):
+        with traces.bind(timeline):
+            traces.record('download', 'attachments', 0.0, 0.5)
+        traces.record('unbound', 'attachments', 0.0, 0.5)
+
+    with traces.timeline('sync') as timeline:
+        worker = threading.Thread(target=work, args=(timeline,))
+        worker.start()
+        worker.join()
+    assert [span[0] for span in timeline.spans] == ['download']
+    assert timeline.spans[0][4] == worker.ident
+
+def test_timelines_are_exported_and_kept_newest_first(tmp_path):
+    traces = Tracer(enabled=True, trace_dir=str(tmp_path / 'traces'), history=2)
+    for n in range(3):
+        with traces.timeline('sync', run=n):
+            traces.record('GET /me', 'graph', 0, 0)
+
+    recent = traces.recent(include_events=True)
+    assert [summary['attrs']['run'] for summary in recent] == [2, 1]
+    assert traces.recent(limit=0) == []
+    with open(recent[0]['trace_file'], encoding='utf-8') as f:
+        exported = json.load(f)
+    assert exported['otherData']['run'] == 2
+    assert exported['traceEvents'] == recent[0]['trace_events']
+    assert len(list((tmp_path / 'traces').iterdir())) == 3
+
+def test_sync_records_graph_calls_and_phases(monkeypatch):
+    monkeypatch.setattr(tracer, 'enabled', True)
+    monkeypatch.setattr(tracer, 'trace_dir', '')
+    monkeypatch.setattr(tracer, '_timelines', deque(maxlen=1))
+    assert bench_sync(4, messages_per_conversation=2)['complete']
+
+    summary, = tracer.recent()
+    assert summary['name'] == 'sync' and summary['attrs']['account_id']
+    assert summary['by_category']['messages']['spans'] == 4
+    assert summary['by_category']['graph']['spans'] >= 1 + 1 + 1 + 4
+    assert summary['by_category']['phase']['spans'] >= 1
@@ -0,0 +1,122 @@
+from datetime import datetime, timezone, timedelta
+import pytest
+from facebook_graph_cache import graph_cache
+from facebook_messenger import FacebookMessenger
+from facebook_mock_graph import MockGraphFixture, MockGraphServer, MOCK_USER_TOKEN
+from facebook_window_cache import MessageWindowCache, window_cache
+
+def _reopen_many(cache, conversation_id, times, start):
+    """Push enough superseded heap items to make the heap compact itself"""
+    for i in range(times):
+        cache.record_last_message(conversation_id, start + timedelta(seconds=i))
+
+def test_compaction_does_not_report_closed_windows_again():
+    cache = MessageWindowCache()
+    now = datetime.now(timezone.utc)
+    cache.record_last_message('closed', now - timedelta(hours=25))
+    _reopen_many(cache, 'busy', 1100, now - timedelta(hours=1))
+    assert len(cache._expiry_heap) <= 2 * len(cache) + 1024
+    assert cache.pop_expired(now + timedelta(minutes=1)) == []
+
+def test_compaction_keeps_popped_windows_out():
+    cache = MessageWindowCache()
+    now = datetime.now(timezone.utc)
+    cache.record_last_message('a', now - timedelta(hours=24) + timedelta(seconds=5), 'acct')
+    expired = cache.pop_expired(now + timedelta(seconds=10))
+    assert [item[0] for item in expired] == ['a']
+    _reopen_many(cache, 'busy', 1100, now - timedelta(hours=1))
+    assert cache.pop_expired(now + timedelta(seconds=10)) == []
+
+def test_compaction_keeps_closed_windows_not_yet_popped():
+    cache = MessageWindowCache()
+    now = datetime.now(timezone.utc)
+    cache.record_last_message('a', now - timedelta(hours=24) + timedelta(seconds=5), 'acct')
+    _reopen_many(cache, 'busy', 1100, now - timedelta(hours=1))
+    later = now + timedelta(seconds=10)
+    assert [item[0] for item in cache.pop_expired(later)] == ['a']
+    assert cache.pop_expired(later) == []
+
+def test_expiring_is_ordered_and_skips_superseded_items():
+    cache = MessageWindowCache()
+    now = datetime.now(timezone.utc)
+    ages = {'c1': 23, 'c2': 20, 'c3': 22, 'c4': 10, 'c5': 21}
+    for conversation_id, hours in ages.items():
+        cache.record_last_message(conversation_id, now - timedelta(hours=hours), 'acct' if conversation_id != 'c5' else 'other')
+    # c1 gets a newer message: its old heap item must not show up
+    cache.record_last_message('c1', now - timedelta(hours=19), 'acct')
+
+    windows = cache.expiring(6 * 3600)
+    assert [w['conversation_id'] for w in windows] == ['c3', 'c5', 'c2', 'c1']
+    assert [w['expires_at'] for w in windows] == sorted(w['expires_at'] for w in windows)
+
+    assert [w['conversation_id'] for w in cache.expiring(6 * 3600, limit=2)] == ['c3', 'c5']
+    assert [w['conversation_id'] for w in cache.expiring(6 * 3600, account_id='acct')] == ['c3', 'c2', 'c1']
+    assert [w['conversation_id'] for w in cache.expiring(3.5 * 3600)] == ['c3', 'c5']
+
+def test_accounts_sharing_a_conversation_keep_their_own_windows():
+    cache = MessageWindowCache()
+    now = datetime.now(timezone.utc)
+    # Two accounts managing the same page see the same conversation id
+    cache.record_last_message('shared', now - timedelta(hours=23), 'acct')
+    cache.record_last_message('shared', now - timedelta(hours=22), 'other')
+
+    assert [w['expires_at'] for w in cache.expiring(3 * 3600, account_id='acct')] == [(now + timedelta(hours=1)).isoformat()]
+    assert [w['expires_at'] for w in cache.expiring(3 * 3600, account_id='other')] == [(now + timedelta(hours=2)).isoformat()]
+    assert cache.get('shared', 'acct')[0] and cache.get('shared', 'other')[0]
+    assert cache.get('shared') is None
+
+    expired = cache.pop_expired(now + timedelta(hours=3))
+    assert sorted((conversation_id, account_id) for conversation_id, account_id, _ in expired) == [('shared', 'acct'), ('shared', 'other')]
+
+def test_windows_without_an_account_still_compare_in_the_heap():
+    cache = MessageWindowCache()
+    when = datetime.now(timezone.utc) - timedelta(hours=1)
+    cache.record_last_message('a', when)
+    cache.record_last_message('a', when, 'acct')
+    assert [(w['conversation_id'], w['account_id']) for w in cache.expiring(24 * 3600)] == [('a', None), ('a', 'acct')]
+
+def test_closed_window_is_rechecked_after_its_ttl():
+    cache = MessageWindowCache(closed_ttl=60)
+    cache.record_last_message('old', datetime.now(timezone.utc) - timedelta(hours=30))
+    cache.record_no_messages('empty')
+    assert cache.get('old')[0] is False and cache.get('empty') == (False, 999)
+    assert cache.get('unknown') is None
+
+    cache._entries[cache._key('old', None)]['checked_at'] -= timedelta(seconds=61)
+    assert cache.get('old') is None
+    assert cache.status('old')[0] is False
+
+def test_late_older_message_does_not_shrink_the_window():
+    cache = MessageWindowCache()
+    now = datetime.now(timezone.utc)
+    cache.record_last_message('a', now - timedelta(hours=1))
+    cache.record_last_message('a', now - timedelta(hours=5))
+    assert cache.status('a', now)[2] == now + timedelta(hours=23)
+
+@pytest.fixture
+def mock_graph():
+    window_cache.clear()
+    graph_cache.clear()
+    with MockGraphServer(MockGraphFixture(61, 1, 3)) as mock:
+        yield mock
+    window_cache.clear()
+    graph_cache.clear()
+
+def _send(messenger, fixture, index):
+    return messenger.send_facebook_message_with_templates(
+        fixture.conversation_id(0, index), fixture.participant_ids(0, index)[0], 'hi', MOCK_USER_TOKEN,
+        page_id=fixture.page_id(0), account_id='acct'
+    )
+
+def test_sends_ask_graph_for_the_window_only_once(mock_graph):
+    messenger = FacebookMessenger(base_url=mock_graph.url)
+    fixture = mock_graph.fixture
+    # Conversation 0 was just written to; conversation 60 has been quiet for 37 hours
+    for index in (0, 0, 60, 60):
+        _send(messenger, fixture, index)
+
+    stats = mock_graph.snapshot()
+    assert stats['by_endpoint'] == {'conversation': 2, 'send': 4}
+    assert stats['messages_tagged'] == 2
+    assert window_cache.get(fixture.conversation_id(0, 0), 'acct')[0] is True
+    assert window_cache.get(fixture.conversation_id(0, 0)) is None